@@ -0,0 +1,194 @@
+"""
+Row alignment for sheets without a key column.
+
+Matching such sheets row by row position turns one inserted row into a
+diff on every row below it. Here the rows of file 2 are aligned to those
+of file 1 the way a text diff aligns lines (patience diff):
+
+1. Rows are numbered by value, so equal rows share a number.
+2. Common leading and trailing rows match. In between, rows that occur
+   exactly once on both sides are anchors: the longest run of them in the
+   same order on both sides matches, and the ranges between anchors are
+   aligned the same way.
+3. Rows left over that have an equal row left over on the other side
+   moved; they match too.
+4. The rest are paired within their range as changed rows when at least
+   half of their cells are equal; unpaired rows were inserted or deleted.
+
+Steps 1-3 take O(n log n). Step 4 keeps a range of equal length on both
+sides paired by position when every such pair is similar; otherwise it only
+compares rows at most GAP_BAND apart from the diagonal of the range, as
+long as those are at most GAP_PAIRS pairs, and pairs by position beyond
+that. Either way it takes linear time in the number of edited rows.
+"""
+from bisect import bisect_left
+
+# Largest number of row pairs of one unmatched range compared cell by cell
+GAP_PAIRS = 40000
+
+# How far off the diagonal of an unmatched range (beyond the rows inserted or
+# deleted in it) a row may pair up
+GAP_BAND = 10
+
+
+def _number(rows, numbers):
+    return [numbers.setdefault(row, len(numbers)) for row in rows]
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """
+    (i, j) pairs of a[alo:ahi] and b[blo:bhi] whose value occurs exactly once
+    in both ranges, keeping the longest run in the same order on both sides.
+    """
+    count_a = {}
+    for i in range(alo, ahi):
+        count_a[a[i]] = count_a.get(a[i], 0) + 1
+    where_b = {}
+    for j in range(blo, bhi):
+        value = b[j]
+        if count_a.get(value) == 1:
+            where_b[value] = -1 if value in where_b else j
+    pairs = [(i, where_b[a[i]]) for i in range(alo, ahi)
+             if count_a[a[i]] == 1 and where_b.get(a[i], -1) >= 0]
+    if not pairs:
+        return []
+
+    # Longest increasing run of j (patience sorting), following back links
+    tails = []
+    tail_pairs = []
+    links = {}
+    for i, j in pairs:
+        k = bisect_left(tails, j)
+        links[(i, j)] = tail_pairs[k - 1] if k else None
+        if k == len(tails):
+            tails.append(j)
+            tail_pairs.append((i, j))
+        else:
+            tails[k] = j
+            tail_pairs[k] = (i, j)
+    run = []
+    pair = tail_pairs[-1]
+    while pair is not None:
+        run.append(pair)
+        pair = links[pair]
+    run.reverse()
+    return run
+
+
+def _similarity(row1, row2):
+    """Number of equal cells, or 0 when fewer than half of the cells are equal."""
+    equal = sum(1 for v1, v2 in zip(row1, row2) if v1 == v2)
+    return equal if 2 * equal >= max(len(row1), len(row2), 1) else 0
+
+
+def _pair_changed(rows1, rows2, left1, left2, match):
+    """
+    Pair the leftover rows left1 (of rows1) and left2 (of rows2) of one range
+    in order, maximising the number of equal cells of the paired rows.
+    """
+    n, m = len(left1), len(left2)
+    if n == m and all(_similarity(rows1[i], rows2[j]) for i, j in zip(left1, left2)):
+        # Rows edited in place: nothing to gain from shifting them
+        for i, j in zip(left1, left2):
+            match[i] = j
+        return
+    low, high = min(0, m - n) - GAP_BAND, max(0, m - n) + GAP_BAND
+    if n * min(m, high - low + 1) > GAP_PAIRS:
+        # Too large to compare every pair in the band: pair by position
+        for i, j in zip(left1, left2):
+            match[i] = j
+        return
+
+    # Heaviest chain of similar pairs, in order on both sides: a weighted longest
+    # increasing subsequence, with a Fenwick tree of the best chain ending before each y
+    tree = [(0, None)] * (m + 1) # (total, chain as nested (x, y, previous) links)
+
+    def best_before(y):
+        best = (0, None)
+        while y > 0:
+            if tree[y][0] > best[0]:
+                best = tree[y]
+            y -= y & -y
+        return best
+
+    for x in range(n):
+        row1 = rows1[left1[x]]
+        ends = []
+        for y in range(max(0, x + low), min(m, x + high + 1)):
+            score = _similarity(row1, rows2[left2[y]])
+            if score:
+                total, chain = best_before(y)
+                ends.append((y + 1, total + score, (x, y, chain)))
+        # Only once the row is done, so two pairs of one row never chain
+        for k, total, chain in ends:
+            while k <= m:
+                if total > tree[k][0]:
+                    tree[k] = (total, chain)
+                k += k & -k
+
+    chain = best_before(m)[1]
+    while chain is not None:
+        x, y, chain = chain
+        match[left1[x]] = left2[y]
+
+
+def match_rows(rows1, rows2):
+    """
+    Align the rows of file 2 to the rows of file 1 (sequences of value tuples).
+    Returns a list holding, for each row of rows1, the index of its row in
+    rows2, or -1 when it has none.
+    """
+    numbers = {}
+    a, b = _number(rows1, numbers), _number(rows2, numbers)
+    match = [-1] * len(a)
+    matched2 = [False] * len(b)
+    gaps = []
+
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        alo, ahi, blo, bhi = ranges.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            match[alo] = blo
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            match[ahi] = bhi
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            gaps.append((alo, ahi, blo, bhi))
+            continue
+        for i, j in anchors:
+            match[i] = j
+            ranges.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        ranges.append((alo, ahi, blo, bhi))
+
+    for i, j in enumerate(match):
+        if j >= 0:
+            matched2[j] = True
+
+    # Rows that moved: an equal row is left over on the other side
+    left_over = {}
+    for j in range(len(b)):
+        if not matched2[j]:
+            left_over.setdefault(b[j], []).append(j)
+    for value in left_over.values():
+        value.reverse()
+    for i in range(len(a)):
+        if match[i] < 0:
+            candidates = left_over.get(a[i])
+            if candidates:
+                j = candidates.pop()
+                match[i] = j
+                matched2[j] = True
+
+    for alo, ahi, blo, bhi in gaps:
+        left1 = [i for i in range(alo, ahi) if match[i] < 0]
+        left2 = [j for j in range(blo, bhi) if not matched2[j]]
+        if left1 and left2:
+            _pair_changed(rows1, rows2, left1, left2, match)
+    return match
@@ -1,203 +1,151 @@
 import os
+import traceback
 import uuid
-from flask import Flask, render_template, request, send_file, redirect, url_for
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill, Font, Color
-from copy import copy
-import io
+import tempfile
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import chain
+from flask import (Flask, Response, render_template, request, send_file, redirect, url_for, jsonify,
+                   stream_with_context, make_response)
+from engine import compare_excels, file1_rows, OUTPUT_MODES, READERS, ALIGNMENTS
+from exports import EXPORT_FORMATS, iter_export, json_value
+from events import EVENT_FORMATS, iter_events, iter_event_format
+from layout import KeyDetector, MATCH_MODES
+from key_index import KeyNormalizer
+from tolerance import Tolerance
+from selection import Selection, UnknownSheet
+from store import make_store, OUTPUT_NAME, RESULT_NAME
+from jobs import (store_comparison, submit_job, job_status, make_executor, memo_key, find_memo, set_done,
+                  DONE)
+from uploads import SpoolingRequest, upload_source
+from views import PAGE_SIZE, MAX_PAGE_SIZE, view_row, result_summary
+from snapshot import file_digest
+from metrics import Metrics, Registry, enable_log, log_comparison, profiled
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB limit
+# Uploads are spooled to temp files on disk (see uploads.py), so the limit doesn't bound worker memory
+app.request_class = SpoolingRequest
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024
 
-# In-memory simple cache for downloads (Not suitable for production with multiple workers)
-DOWNLOAD_CACHE = {}
+# Output workbooks and diff results are kept in a result store under the download id.
+# The default disk store lives in a directory shared by all gunicorn workers;
+# set RESULT_STORE=memory for a single-process setup. Results are unpickled from that
+# directory, so the store refuses one that another user owns or can write to.
+app.config['RESULT_STORE'] = os.environ.get('RESULT_STORE', 'disk')
+app.config['RESULT_STORE_DIR'] = os.environ.get(
+    'RESULT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'excel-compare-results'))
+app.config['RESULT_STORE_MAX_BYTES'] = int(os.environ.get('RESULT_STORE_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
+app.config['RESULT_STORE_TTL'] = int(os.environ.get('RESULT_STORE_TTL', 60 * 60))  # seconds since last access
 
-def workbook_to_view_data(wb):
+RESULT_STORE = make_store(app.config)
+
+# Keep parsed snapshots of uploads in the result store, keyed by their SHA-256,
+# so a workbook uploaded again (a master file 1) isn't parsed again. Comparisons
+# limited to some sheets or columns skip them (see jobs.store_comparison). 0 disables them.
+app.config['BASELINE_SNAPSHOTS'] = os.environ.get('BASELINE_SNAPSHOTS', '1') != '0'
+
+# Remember the result of every comparison under the SHA-256 of both uploads and the
+# options, so comparing the same pair again returns the stored result at once. Memos
+# live in the result store and go with the result when it expires. 0 disables them.
+app.config['RESULT_MEMO'] = os.environ.get('RESULT_MEMO', '1') != '0'
+
+# How cell values are read from the uploads when the form doesn't say:
+# 'openpyxl', or 'xml' to parse the sheet XML directly (see xlsx_reader.py)
+app.config['WORKBOOK_READER'] = os.environ.get('WORKBOOK_READER', 'openpyxl')
+
+# Processes used to compare the sheets of one workbook pair, or the row ranges of a
+# workbook with one large sheet (see shards.py); 1 = compare in-process
+app.config['SHEET_WORKERS'] = int(os.environ.get('SHEET_WORKERS', 1))
+
+# Comparison jobs (mode=job) run on a pool owned by each web worker
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', os.cpu_count() or 1))
+_job_executor = None
+
+def job_executor():
+    global _job_executor
+    if _job_executor is None:
+        _job_executor = make_executor(RESULT_STORE, app.config['JOB_WORKERS'])
+    return _job_executor
+
+# Every comparison is timed stage by stage (see metrics.py): it is logged as one
+# JSON line on stderr (METRICS_LOG=0 turns that off), returned in a Server-Timing
+# header and added to the totals served from /metrics.
+METRICS = Registry()
+if os.environ.get('METRICS_LOG', '1') != '0':
+    enable_log()
+
+# With PROFILE_DIR set, POST /compare?profile=1 runs under cProfile and tracemalloc
+# and leaves <id>.prof and <id>.memory.txt in that directory
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+
+def compare_options(form):
     """
-    Convert workbook to a structure for rendering in HTML.
-    Returns: list of sheets, where each sheet is {'name': str, 'rows': list of lists of dicts}
-    Cell dict: {'value': str, 'class': str (red/green/yellow/normal)}
+    Keyword options for jobs.store_comparison from the app config and the request form.
+    Raises ValueError with a message for the user on an invalid option.
     """
-    sheets = []
-    
-    # Define color mappings based on the styles used in compare_excels
-    # Red Font -> diff
-    # Green Fill -> header
-    # Yellow Fill -> key
-    
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        sheet_data = {'name': sheet_name, 'rows': []}
-        
-        # Determine max columns to ensure grid alignment
-        # Iterate rows
-        for row in ws.iter_rows():
-            row_data = []
-            has_diff = False
-            is_header = False
-            
-            for cell in row:
-                cell_info = {'value': cell.value if cell.value is not None else ""}
-                
-                # Check style
-                style_class = ""
-                
-                # Check Font Color (Red indicates diff)
-                if cell.font and cell.font.color and cell.font.color.rgb == "FFFF0000":
-                    style_class += " text-red-600 font-bold"
-                    has_diff = True
-                
-                # Check Fill Color
-                if cell.fill and cell.fill.start_color:
-                    color = cell.fill.start_color.rgb 
-                    # Green: FF00FF00, Yellow: FFFFFF00, Red Fill: FFFF0000 (We used red font mainly, but fill was defined too)
-                    if color == "FF00FF00":
-                        style_class += " bg-green-100"
-                        is_header = True
-                    elif color == "FFFFFF00":
-                        style_class += " bg-yellow-100"
-                
-                cell_info['class'] = style_class
-                row_data.append(cell_info)
-            
-            # Only append row if it's a header or has a difference
-            if is_header or has_diff:
-                sheet_data['rows'].append(row_data)
-        
-        sheets.append(sheet_data)
-    return sheets
+    key_match = form.get('key_match') or 'word'
+    if key_match not in MATCH_MODES:
+        raise ValueError(f"Unknown key match mode: {key_match!r}")
+    detector = KeyDetector(key_column=(form.get('key_column') or '').strip() or None, mode=key_match)
+    # Checkboxes: present in the form only when ticked
+    normalizer = KeyNormalizer(strip='key_strip' in form, casefold='key_casefold' in form,
+                               numeric='key_numeric' in form)
+    output_mode = form.get('output_mode') or 'full'
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode!r}")
+    reader = form.get('reader') or app.config['WORKBOOK_READER']
+    if reader not in READERS:
+        raise ValueError(f"Unknown workbook reader: {reader!r}")
+    alignment = form.get('alignment') or 'position'
+    if alignment not in ALIGNMENTS:
+        raise ValueError(f"Unknown row alignment: {alignment!r}")
+    try:
+        tolerance = Tolerance(abs_tol=float(form.get('abs_tol') or 0), rel_tol=float(form.get('rel_tol') or 0),
+                              dates='value_dates' in form, strip='value_strip' in form,
+                              casefold='value_casefold' in form)
+    except ValueError:
+        raise ValueError("Tolerances must be numbers of at least 0")
+    # Comma-separated sheet names and column headers; empty compares everything
+    selection = Selection(sheets=form.get('sheets'), columns=form.get('columns'),
+                          ignore_columns=form.get('ignore_columns'))
+    return {'workers': app.config['SHEET_WORKERS'], 'detector': detector, 'normalizer': normalizer or None,
+            'output_mode': output_mode, 'reader': reader, 'alignment': alignment, 'tolerance': tolerance or None, 'selection': selection or None,
+            'snapshots': app.config['BASELINE_SNAPSHOTS']}
 
-def compare_excels(file1, file2):
-    wb1 = load_workbook(file1, data_only=True)
-    wb2 = load_workbook(file2, data_only=True)
-    
-    # Create a new workbook for output
-    output_wb = Workbook()
-    output_wb.remove(output_wb.active) # Remove default sheet
-    
-    red_fill = PatternFill(start_color='FFFF0000', end_color='FFFF0000', fill_type='solid')
-    yellow_fill = PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid')
-    green_fill = PatternFill(start_color='FF00FF00', end_color='FF00FF00', fill_type='solid')
-    red_font = Font(color='FFFF0000')
-
-    # Iterate through sheets in the first workbook
-    for sheet_name in wb1.sheetnames:
-        ws1 = wb1[sheet_name]
-        
-        # Create sheet in output
-        ws_out = output_wb.create_sheet(title=sheet_name)
-        
-        # Check if sheet exists in second workbook
-        ws2 = None
-        if sheet_name in wb2.sheetnames:
-            ws2 = wb2[sheet_name]
-            
-        # Strategy: Scan rows to find "ID" column
-        id_col_idx = None # 1-based index
-        header_row_idx = None # 1-based index
-        
-        # Scan first 20 rows (or max rows) to find header
-        max_scan_rows = min(20, ws1.max_row)
-        for r_idx in range(1, max_scan_rows + 1):
-            row = ws1[r_idx]
-            for cell in row:
-                if cell.value:
-                    val_str = str(cell.value).lower()
-                    if "id" in val_str or "sku" in val_str or "#" in val_str or "貨號" in val_str:
-                        id_col_idx = cell.column
-                        header_row_idx = cell.row
-                        break
-            if id_col_idx:
-                break
-        
-        # If ID column found and ws2 exists, build index for ws2
-        ws2_index = {} # Map ID -> Row Object (or Row Index)
-        if id_col_idx and ws2 and header_row_idx:
-            for row in ws2.iter_rows(min_row=header_row_idx + 1):
-                try:
-                    if len(row) >= id_col_idx:
-                        id_cell = row[id_col_idx - 1]
-                        val = id_cell.value
-                        if val is not None:
-                            ws2_index[val] = row
-                except IndexError:
-                    pass
-
-        # Iterate through rows and columns of File 1
-        for row in ws1.iter_rows():
-            current_row_idx = row[0].row
-            
-            # Find matching row in File 2
-            row2 = None
-            if ws2:
-                # Only try to match data rows (rows after the header)
-                if header_row_idx and current_row_idx > header_row_idx:
-                     if id_col_idx and ws2_index:
-                        # Look up by ID
-                        try:
-                             if len(row) >= id_col_idx:
-                                id_val = row[id_col_idx - 1].value
-                                if id_val in ws2_index:
-                                    row2 = ws2_index[id_val]
-                        except:
-                            pass
-                     else:
-                        # Fallback to positional match
-                         try:
-                            row2 = ws2[current_row_idx]
-                         except IndexError:
-                            row2 = None
-                else:
-                    # For header row or pre-header rows, try to match by position
-                    if header_row_idx and current_row_idx == header_row_idx:
-                         try:
-                             row2 = ws2[current_row_idx]
-                         except IndexError:
-                             row2 = None
-                    else:
-                        # Pre-header rows
-                        try:
-                             row2 = ws2[current_row_idx]
-                        except IndexError:
-                             row2 = None
-
-
-            for i, cell in enumerate(row):
-                # Copy value to output
-                new_cell = ws_out.cell(row=cell.row, column=cell.column, value=cell.value)
-                
-                # Apply styles
-                if header_row_idx and cell.row == header_row_idx:
-                    new_cell.fill = green_fill
-                elif id_col_idx and cell.column == id_col_idx:
-                     # Only highlight ID column in data rows
-                    if header_row_idx and cell.row > header_row_idx:
-                        new_cell.fill = yellow_fill
-                
-                # Compare
-                is_diff = False
-                if ws2:
-                    if row2:
-                        try:
-                            # Verify row2 has this column
-                            if i < len(row2):
-                                cell2 = row2[i]
-                                if cell.value != cell2.value:
-                                    is_diff = True
-                            else:
-                                is_diff = True # Column missing in row2
-                        except:
-                            is_diff = True
-                    else:
-                        is_diff = True # Row not found in File 2
-                else:
-                     is_diff = True # Sheet doesn't exist in file 2
-                
-                if is_diff:
-                    # Make value red if different
-                    new_cell.font = red_font
-
-    return output_wb
+@lru_cache(maxsize=4)
+def _cached_result(download_id):
+    result = RESULT_STORE.get_object(download_id, RESULT_NAME)
+    if result is None:
+        # Not cached, so a result that shows up later (a finished job) is found
+        raise KeyError(download_id)
+    return result
+
+def output_rows(download_id, result):
+    """
+    file1_rows for the views of a stored result: a DiffResult doesn't keep the rows
+    of sheets missing from file 2, so they are read back from its output workbook.
+    """
+    def rows(sheet):
+        f = RESULT_STORE.open(download_id, OUTPUT_NAME)
+        if f is None:
+            return
+        with f:
+            yield from file1_rows(f, sheet, numbered=result.output_mode == 'diff')
+    return rows
+
+def load_result(download_id):
+    """
+    Unpickled DiffResult for paging; results never change, so each worker keeps the last few.
+    A cached result is only returned while the store still has it (not evicted or expired).
+    """
+    try:
+        result = _cached_result(download_id)
+    except KeyError:
+        return None
+    if not RESULT_STORE.exists(download_id, RESULT_NAME):
+        _cached_result.cache_clear()
+        return None
+    return result
 
 @app.route('/', methods=['GET'])
 def index():
@@ -214,28 +162,211 @@ def compare():
     if file1.filename == '' or file2.filename == '':
         return 'No selected file', 400
 
+    metrics = Metrics()
+    try:
+        options = compare_options(request.form)
+        with metrics.stage('upload'):
+            source1 = upload_source(file1, 'File 1')
+            source2 = upload_source(file2, 'File 2')
+    except ValueError as exc:
+        METRICS.observe(None, outcome='rejected')
+        return str(exc), 400
+
     if file1 and file2:
-        output_wb = compare_excels(file1, file2)
-        
-        # 1. Generate Table Project View Data
-        view_data = workbook_to_view_data(output_wb)
-        
-        # 2. Save for download
         download_id = str(uuid.uuid4())
-        output_stream = io.BytesIO()
-        output_wb.save(output_stream)
-        output_stream.seek(0)
-        DOWNLOAD_CACHE[download_id] = output_stream
+
+        memo = digests = None
+        if app.config['RESULT_MEMO']:
+            with metrics.stage('hash'):
+                digests = (file_digest(source1), file_digest(source2))
+                memo = memo_key(*digests, options)
+            cached_id = find_memo(RESULT_STORE, memo)
+            result = load_result(cached_id) if cached_id else None
+            if result is not None:
+                return cached_response(cached_id, result, metrics, options)
+
+        if request.form.get('mode') == 'job':
+            # Queue the comparison and let the client poll /jobs/<id>; the job logs its own metrics
+            submit_job(RESULT_STORE, job_executor(), download_id, file1, file2, options, memo)
+            return jsonify(job_id=download_id, status_url=url_for('job_status_view', job_id=download_id)), 202
         
-        return render_template('index.html', result=view_data, download_id=download_id)
+        profile_dir = app.config['PROFILE_DIR']
+        profiling = nullcontext()
+        if profile_dir and request.args.get('profile') == '1':
+            profiling = profiled(profile_dir, download_id)
+        with profiling as profile:
+            # Compare, writing the highlighted workbook and the diff result into the store;
+            # rows are fetched page by page from /rows
+            try:
+                result = store_comparison(RESULT_STORE, download_id, source1, source2, metrics=metrics,
+                                          memo=memo, digests=digests or (None, None), **options)
+            except UnknownSheet as exc:
+                METRICS.observe(None, outcome='rejected')
+                return str(exc), 400
+            except Exception:
+                METRICS.observe(None, outcome='error')
+                raise
+            with metrics.stage('render'):
+                response = make_response(render_template('index.html', result=result_summary(result),
+                                                         download_id=download_id))
+
+        METRICS.observe(metrics)
+        log_comparison(metrics, id=download_id, mode='sync', profile=profile)
+        response.headers['Server-Timing'] = metrics.server_timing()
+        return response
     
     return redirect(url_for('index'))
 
+def cached_response(download_id, result, metrics, options):
+    """Response to /compare for a pair compared before with the same options: the stored result."""
+    if request.form.get('mode') == 'job':
+        # Answer like a job that is already done; the status of the job that computed it is kept as it is
+        if job_status(RESULT_STORE, download_id) is None:
+            set_done(RESULT_STORE, download_id, result, cached=True)
+        response = jsonify(job_id=download_id, status_url=url_for('job_status_view', job_id=download_id))
+        response.status_code = 202
+    else:
+        with metrics.stage('render'):
+            response = make_response(render_template('index.html', result=result_summary(result),
+                                                     download_id=download_id))
+    METRICS.observe(metrics, outcome='cached')
+    log_comparison(metrics, id=download_id, mode=request.form.get('mode') or 'sync', cached=True)
+    response.headers['Server-Timing'] = metrics.server_timing()
+    return response
+
+EVENT_MIMETYPES = {'ndjson': 'application/x-ndjson; charset=utf-8', 'sse': 'text/event-stream; charset=utf-8'}
+
+@app.route('/compare/stream', methods=['POST'])
+def compare_stream():
+    """
+    Compare two uploads and stream the diff events (see events.py) as they are
+    found: NDJSON, or server-sent events with format=sse or an Accept header of
+    text/event-stream. Nothing is stored. A failure after the stream started
+    ends it with an {"event": "error"} event.
+    """
+    if 'file1' not in request.files or 'file2' not in request.files:
+        return 'No files uploaded', 400
+    file1 = request.files['file1']
+    file2 = request.files['file2']
+    if file1.filename == '' or file2.filename == '':
+        return 'No selected file', 400
+
+    fmt = request.values.get('format')
+    if not fmt:
+        fmt = 'sse' if request.accept_mimetypes.best == 'text/event-stream' else 'ndjson'
+    if fmt not in EVENT_FORMATS:
+        return f"Unknown format: {fmt}", 400
+
+    metrics = Metrics()
+    try:
+        options = compare_options(request.form)
+        with metrics.stage('upload'):
+            source1 = upload_source(file1, 'File 1')
+            source2 = upload_source(file2, 'File 2')
+    except ValueError as exc:
+        METRICS.observe(None, outcome='rejected')
+        return str(exc), 400
+    stream_id = str(uuid.uuid4())
+
+    def events():
+        try:
+            yield from iter_events(source1, source2, detector=options['detector'], normalizer=options['normalizer'],
+                                   metrics=metrics, reader=options['reader'], alignment=options['alignment'],
+                                   tolerance=options['tolerance'], selection=options['selection'])
+        except UnknownSheet:
+            # Raised before the first event, which the view takes below: answered with a 400
+            raise
+        except Exception as exc:
+            traceback.print_exc()
+            METRICS.observe(None, outcome='error')
+            yield {'event': 'error', 'error': str(exc) or type(exc).__name__}
+            return
+        METRICS.observe(metrics)
+        log_comparison(metrics, id=stream_id, mode='stream')
+
+    # The spooled uploads are closed with the request, when this view returns: taking
+    # the first event opens both workbooks, which then keep reading their files
+    stream = events()
+    try:
+        first = next(stream)
+    except UnknownSheet as exc:
+        METRICS.observe(None, outcome='rejected')
+        return str(exc), 400
+    return Response(stream_with_context(iter_event_format(chain([first], stream), fmt)),
+                    mimetype=EVENT_MIMETYPES[fmt], headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_view():
+    """Comparison totals of this process in the Prometheus text format."""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<job_id>')
+def job_status_view(job_id):
+    """Progress of a comparison job; links to the result once it is done."""
+    status = job_status(RESULT_STORE, job_id)
+    if status is None:
+        return jsonify(error="Job not found or expired"), 404
+    status = dict(status, job_id=job_id)
+    if status['status'] == DONE:
+        status['result_url'] = url_for('result_view', download_id=job_id)
+        status['download_url'] = url_for('download_file', download_id=job_id)
+    return jsonify(status)
+
+@app.route('/results/<download_id>')
+def result_view(download_id):
+    result = load_result(download_id)
+    if result is None:
+        return "Result not found or expired", 404
+    return render_template('index.html', result=result_summary(result), download_id=download_id)
+
+@app.route('/rows/<download_id>')
+def result_rows(download_id):
+    """
+    One page of the differing rows of a sheet, as JSON.
+    Query args: sheet (name), offset (default 0), limit (default PAGE_SIZE).
+    """
+    result = load_result(download_id)
+    if result is None:
+        return jsonify(error="Result not found or expired"), 404
+    try:
+        sheet = result[request.args.get('sheet', '')]
+    except KeyError:
+        return jsonify(error="Unknown sheet"), 404
+    
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    
+    rows = []
+    value_rows = output_rows(download_id, result)(sheet) if not sheet.in_file2 else None
+    for row_idx, values, diff_cols in sheet.iter_view_rows(offset, offset + limit, value_rows):
+        cells = view_row(sheet, row_idx, values, diff_cols)
+        for cell in cells:
+            cell['value'] = json_value(cell['value'])
+        rows.append({'row': row_idx, 'cells': cells})
+    
+    return jsonify(sheet=sheet.name, offset=offset, limit=limit, total=sheet.view_row_count, rows=rows)
+
+EXPORT_MIMETYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
 @app.route('/download/<download_id>')
 def download_file(download_id):
-    if download_id in DOWNLOAD_CACHE:
-        stream = DOWNLOAD_CACHE[download_id]
-        stream.seek(0)
+    fmt = request.args.get('format', 'xlsx')
+    if fmt in EXPORT_FORMATS:
+        # Diff exports are streamed straight from the stored DiffResult
+        result = load_result(download_id)
+        if result is None:
+            return "File not found or expired", 404
+        return Response(
+            stream_with_context(iter_export(result, fmt, output_rows(download_id, result))),
+            mimetype=EXPORT_MIMETYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename=comparison_result.{fmt}'},
+        )
+    if fmt != 'xlsx':
+        return f"Unknown format: {fmt}", 400
+
+    stream = RESULT_STORE.open(download_id, OUTPUT_NAME)
+    if stream is not None:
+        # send_file streams the open file in chunks
         return send_file(
             stream,
             as_attachment=True,
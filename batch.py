@@ -0,0 +1,237 @@
+"""
+Compare many workbook pairs from the command line.
+
+    python -m batch DIR1 DIR2 -o OUT
+    python -m batch --manifest pairs.csv -o OUT
+
+Directories are paired by relative path: DIR1/a/b.xlsx against DIR2/a/b.xlsx.
+A manifest is a CSV file with file1 and file2 columns (and optionally name);
+relative paths are taken from the manifest's directory.
+
+Each pair gets a highlighted workbook OUT/<name>_compare.xlsx, and
+OUT/summary.json describes every pair. Pairs are compared in a process pool
+with the same engine as the web app, reading the files straight from disk.
+The exit status is 0 when no pair differs, 1 when some do (or files are
+unpaired), and 2 when a comparison failed.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import ALIGNMENTS, READERS, compare_workbooks
+from key_index import KeyNormalizer
+from tolerance import Tolerance
+from selection import Selection
+from layout import KeyDetector, MATCH_MODES
+
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xlsm')
+OUTPUT_SUFFIX = '_compare.xlsx'
+SUMMARY_NAME = 'summary.json'
+
+OK = 'ok'
+ERROR = 'error'
+
+
+def _workbooks(directory):
+    """Relative paths of the workbooks under directory, skipping Excel's ~$ lock files."""
+    found = set()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in files:
+            if name.lower().endswith(WORKBOOK_EXTENSIONS) and not name.startswith('~$'):
+                found.add(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+
+def pair_directories(dir1, dir2):
+    """
+    Returns (pairs, unpaired): pairs is a list of (name, file1, file2), and
+    unpaired lists {'path', 'only_in'} for files present in one directory only.
+    """
+    files1, files2 = _workbooks(dir1), _workbooks(dir2)
+    pairs = [
+        (os.path.splitext(rel)[0], os.path.join(dir1, rel), os.path.join(dir2, rel))
+        for rel in sorted(files1 & files2)
+    ]
+    unpaired = (
+        [{'path': rel, 'only_in': 'file1'} for rel in sorted(files1 - files2)] +
+        [{'path': rel, 'only_in': 'file2'} for rel in sorted(files2 - files1)]
+    )
+    return pairs, unpaired
+
+
+def read_manifest(path):
+    """
+    List of (name, file1, file2) from a CSV manifest with file1, file2 and optional name columns.
+    A name becomes an output file name in the output directory, so it can't be a path.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    names = set()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            file1, file2 = (row.get('file1') or '').strip(), (row.get('file2') or '').strip()
+            if not file1 or not file2:
+                raise ValueError(f"{path}:{line}: file1 and file2 are required")
+            name = (row.get('name') or '').strip() or os.path.splitext(os.path.basename(file1))[0]
+            if not _plain_name(name):
+                raise ValueError(f"{path}:{line}: name {name!r} can't contain path separators or '..'")
+            # Keep output names unique
+            unique, n = name, 1
+            while unique in names:
+                n += 1
+                unique = f"{name}-{n}"
+            names.add(unique)
+            pairs.append((unique, os.path.join(base, file1), os.path.join(base, file2)))
+    return pairs
+
+
+def _plain_name(name):
+    """Whether name is a file name in the output directory rather than a path leading out of it."""
+    separators = {'/', os.sep, os.altsep} - {None}
+    return (not any(sep in name for sep in separators) and '..' not in name
+            and not os.path.isabs(name) and not os.path.splitdrive(name)[0])
+
+
+def compare_pair(task):
+    """Pool task: compare one pair into its output workbook and return its summary entry."""
+    name, file1, file2, output, options = task
+    entry = {'name': name, 'file1': file1, 'file2': file2, 'output': output}
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'wb') as stream:
+            result = compare_workbooks(file1, file2, stream, **options)
+    except Exception as exc:
+        if os.path.exists(output):
+            os.remove(output)
+        entry.update(status=ERROR, error=str(exc) or type(exc).__name__, output=None)
+    else:
+        entry.update(
+            status=OK,
+            diff_rows=result.diff_row_count,
+            fast_rows=result.fast_row_count,
+            sheets=[
+                {'name': sheet.name, 'in_file2': sheet.in_file2, 'rows': sheet.max_row,
+                 'changed_rows': len(sheet.changed_rows), 'missing_rows': sheet.missing_row_count,
+                 'diff_cells': sheet.diff_cell_count}
+                for sheet in result
+            ],
+        )
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def run_batch(pairs, out_dir, options, workers=1, report=None):
+    """
+    Compare every (name, file1, file2) pair, writing its output workbook into
+    out_dir. Returns the summary entries in pairs order; report, if given,
+    is called with each entry as soon as it is done.
+    """
+    tasks = [(name, file1, file2, os.path.join(out_dir, name + OUTPUT_SUFFIX), options)
+             for name, file1, file2 in pairs]
+    if workers > 1 and len(tasks) > 1:
+        # One long-lived pool for the whole batch; workers keep their imports and caches
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            entries = []
+            for entry in pool.map(compare_pair, tasks):
+                entries.append(entry)
+                if report:
+                    report(entry)
+            return entries
+    entries = []
+    for task in tasks:
+        entries.append(compare_pair(task))
+        if report:
+            report(entries[-1])
+    return entries
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python -m batch', description="Compare many Excel workbook pairs.")
+    parser.add_argument('dirs', nargs='*', metavar='DIR', help="two directories whose workbooks are paired by relative path")
+    parser.add_argument('--manifest', help="CSV file with file1, file2 and optional name columns")
+    parser.add_argument('-o', '--output', required=True, help="directory for the output workbooks and summary.json")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="pairs compared in parallel")
+    parser.add_argument('--reader', choices=READERS, default='openpyxl',
+                        help="how cell values are read; 'xml' parses the sheet XML directly")
+    parser.add_argument('--align', choices=ALIGNMENTS, default='position',
+                        help="how rows of sheets without a key column are matched; 'diff' finds inserted and moved rows")
+    parser.add_argument('--key-column', help="header name(s) of the key column, comma-separated for a composite key")
+    parser.add_argument('--key-match', choices=MATCH_MODES, default='word', help="how header cells match the key tokens")
+    parser.add_argument('--key-strip', action='store_true', help="ignore whitespace around keys")
+    parser.add_argument('--key-casefold', action='store_true', help="match keys case-insensitively")
+    parser.add_argument('--key-numeric', action='store_true', help="match numeric text keys to numbers")
+    parser.add_argument('--abs-tol', type=float, default=0.0, help="numbers this close count as equal")
+    parser.add_argument('--rel-tol', type=float, default=0.0,
+                        help="numbers this close relative to their size count as equal (0.001 = 0.1%%)")
+    parser.add_argument('--value-dates', action='store_true', help="compare dates however they are written")
+    parser.add_argument('--value-strip', action='store_true', help="ignore whitespace around text values")
+    parser.add_argument('--value-casefold', action='store_true', help="compare text values case-insensitively")
+    parser.add_argument('--sheets', help="names of the sheets to compare, comma-separated (default: all)")
+    parser.add_argument('--columns', help="headers of the only columns to compare, comma-separated")
+    parser.add_argument('--ignore-columns', help="headers of columns not to compare, comma-separated")
+    parser.add_argument('--diff-only', action='store_true',
+                        help="write only the header and differing rows, with their row numbers")
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if bool(args.manifest) == bool(args.dirs) or (args.dirs and len(args.dirs) != 2):
+        parser.error("give either two directories or --manifest")
+    # Bad input is a usage error (exit status 2), not a traceback
+    try:
+        if args.manifest:
+            pairs, unpaired = read_manifest(args.manifest), []
+        else:
+            pairs, unpaired = pair_directories(*args.dirs)
+        tolerance = Tolerance(abs_tol=args.abs_tol, rel_tol=args.rel_tol, dates=args.value_dates,
+                              strip=args.value_strip, casefold=args.value_casefold)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    normalizer = KeyNormalizer(strip=args.key_strip, casefold=args.key_casefold, numeric=args.key_numeric)
+    options = {
+        'detector': KeyDetector(key_column=args.key_column, mode=args.key_match),
+        'normalizer': normalizer or None,
+        'output_mode': 'diff' if args.diff_only else 'full',
+        'reader': args.reader,
+        'alignment': args.align,
+        'tolerance': tolerance or None,
+        'selection': Selection(sheets=args.sheets, columns=args.columns, ignore_columns=args.ignore_columns) or None,
+    }
+
+    def report(entry):
+        if entry['status'] == OK:
+            print(f"{entry['name']}: {entry['diff_rows']} differing rows ({entry['seconds']}s)", file=sys.stderr)
+        else:
+            print(f"{entry['name']}: failed: {entry['error']}", file=sys.stderr)
+
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    entries = run_batch(pairs, args.output, options, workers=args.workers, report=report)
+    failed = sum(entry['status'] == ERROR for entry in entries)
+    differing = sum(entry['status'] == OK and entry['diff_rows'] > 0 for entry in entries)
+    summary = {
+        'pairs': len(entries),
+        'differing': differing,
+        'failed': failed,
+        'unpaired': unpaired,
+        'seconds': round(time.perf_counter() - start, 3),
+        'results': entries,
+    }
+    with open(os.path.join(args.output, SUMMARY_NAME), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    if failed:
+        return 2
+    return 1 if differing or unpaired else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
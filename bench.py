@@ -0,0 +1,280 @@
+"""
+Benchmarks of the comparison pipeline on generated workbooks.
+
+    python -m bench --rows 20000 --cols 20 -o bench.json
+    python -m bench --rows 20000 --cols 20 --baseline bench.json
+
+A seeded generator writes a pair of workbooks: file 2 is file 1 with a share
+of cells changed, rows moved and rows dropped. Each stage of the pipeline is
+then run on the pair and timed (best of --repeat runs); its peak Python
+memory is measured in one more run under tracemalloc, which is kept apart
+because tracing slows everything down. Results are written as JSON; with
+--baseline, every stage is compared against an earlier results file and the
+exit status is 1 if any got slower than --tolerance allows.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from openpyxl import Workbook
+import snapshot
+from engine import compare_workbooks, file1_rows, open_workbook, save_snapshot, sheet_dimensions, sheet_rows
+from exports import iter_csv, iter_jsonl
+from views import PAGE_SIZE, result_to_view_data, view_row
+
+DEFAULTS = {
+    'rows': 10000,
+    'cols': 20,
+    'sheets': 1,
+    'diff_ratio': 0.01,
+    'shuffle_ratio': 0.1,
+    'missing_ratio': 0.001,
+    'pre_header_rows': 2,
+    'duplicate_ratio': 0.0,
+    'seed': 0,
+}
+
+# Smallest slowdown, in seconds, that counts as a regression
+NOISE_SECONDS = 0.01
+
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', '貨品', '倉庫', '台北', '高雄')
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def _cell(rng, col_idx):
+    """A value typical for the column: numbers, text and dates in turn."""
+    kind = col_idx % 4
+    if kind == 0:
+        return rng.randint(0, 100000)
+    if kind == 1:
+        return round(rng.uniform(0, 1000), 2)
+    if kind == 2:
+        return f"{rng.choice(WORDS)} {rng.randint(1, 999)}"
+    return EPOCH + datetime.timedelta(days=rng.randint(0, 3650))
+
+
+def _write(path, sheets):
+    wb = Workbook(write_only=True)
+    for name, rows in sheets:
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def generate_pair(path1, path2, rows=10000, cols=20, sheets=1, diff_ratio=0.01, shuffle_ratio=0.1,
+                  missing_ratio=0.001, pre_header_rows=2, duplicate_ratio=0.0, seed=0):
+    """
+    Write two related workbooks. Each sheet has pre_header_rows title rows, a
+    header with an ID key column, and rows data rows. In file 2, diff_ratio
+    of the rows have one changed cell (always a different value), shuffle_ratio of them are moved
+    elsewhere, and missing_ratio are dropped; duplicate_ratio of the IDs
+    repeat an earlier one. Returns the number of changed rows per sheet.
+    """
+    rng = random.Random(seed)
+    sheets1, sheets2, changed = [], [], []
+    for s in range(sheets):
+        header = ['ID'] + [f"Column {c}" for c in range(2, cols + 1)]
+        head = [[f"Report {s + 1}"] for _ in range(pre_header_rows)] + [header]
+
+        data = []
+        for i in range(rows):
+            key = rng.randint(1, max(i, 1)) if i and rng.random() < duplicate_ratio else i + 1
+            data.append([key] + [_cell(rng, c) for c in range(2, cols + 1)])
+
+        data2 = []
+        n_changed = 0
+        for row in data:
+            if rng.random() < missing_ratio:
+                continue
+            row = list(row)
+            if cols > 1 and rng.random() < diff_ratio:
+                c = rng.randint(2, cols)
+                if isinstance(row[c - 1], int):
+                    row[c - 1] += 1
+                else:
+                    # A new text, number or date can draw the old one again
+                    value = row[c - 1]
+                    while value == row[c - 1]:
+                        value = _cell(rng, c + 4)
+                    row[c - 1] = value
+                n_changed += 1
+            data2.append(row)
+        # Move a share of the rows to random places
+        for _ in range(int(len(data2) * shuffle_ratio)):
+            i = rng.randrange(len(data2))
+            data2.insert(rng.randrange(len(data2)), data2.pop(i))
+
+        name = f"Sheet{s + 1}"
+        sheets1.append((name, head + data))
+        sheets2.append((name, head + data2))
+        changed.append(n_changed)
+    _write(path1, sheets1)
+    _write(path2, sheets2)
+    return changed
+
+
+def _stages(file1, file2, workdir, reader):
+    """(name, function) for every benchmarked stage; each function runs the stage once."""
+    options = {'reader': reader}
+    result = compare_workbooks(file1, file2, **options)
+    snap1, snap2 = os.path.join(workdir, 'file1.snap'), os.path.join(workdir, 'file2.snap')
+
+    def read():
+        for source in (file1, file2):
+            wb = open_workbook(source, reader)
+            for name in wb.sheetnames:
+                ws = wb[name]
+                drain(sheet_rows(ws, sheet_dimensions(ws)))
+            wb.close()
+
+    def take_snapshots():
+        for source, target in ((file1, snap1), (file2, snap2)):
+            with open(target, 'wb') as f:
+                save_snapshot(source, f, reader)
+
+    def drain(chunks):
+        for _ in chunks:
+            pass
+
+    def rows_of_file1(sheet):
+        return file1_rows(file1, sheet)
+
+    def page_rows():
+        # What the results page fetches from /rows: every page of every sheet
+        for sheet in result:
+            for offset in range(0, sheet.view_row_count, PAGE_SIZE):
+                value_rows = rows_of_file1(sheet) if not sheet.in_file2 else None
+                for row in sheet.iter_view_rows(offset, offset + PAGE_SIZE, value_rows):
+                    view_row(sheet, *row)
+
+    return [
+        ('read', read),
+        ('compare', lambda: compare_workbooks(file1, file2, **options)),
+        ('compare_full_output', lambda: compare_workbooks(file1, file2, io.BytesIO(), **options)),
+        ('compare_diff_output', lambda: compare_workbooks(file1, file2, io.BytesIO(), output_mode='diff',
+                                                          **options)),
+        ('render_view', lambda: result_to_view_data(result, rows_of_file1)),
+        ('page_rows', page_rows),
+        ('export_csv', lambda: drain(iter_csv(result, rows_of_file1))),
+        ('export_jsonl', lambda: drain(iter_jsonl(result, rows_of_file1))),
+        ('take_snapshots', take_snapshots),
+        ('compare_snapshots', lambda: compare_workbooks(snapshot.SnapshotWorkbook(snap1),
+                                                        snapshot.SnapshotWorkbook(snap2), io.BytesIO())),
+    ]
+
+
+def measure(fn, repeat=1, memory=True):
+    """{'seconds': best of repeat runs, 'peak_mb': peak traced memory of one more run}."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    entry = {'seconds': round(min(times), 4)}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            entry['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 2)
+        finally:
+            tracemalloc.stop()
+    return entry
+
+
+def run_benchmark(config, repeat=1, memory=True, stages=None, report=None, reader='openpyxl'):
+    """Generate the workbooks described by config and measure every stage (or the given ones)."""
+    workdir = tempfile.mkdtemp(prefix='excel-compare-bench-')
+    try:
+        file1, file2 = os.path.join(workdir, 'file1.xlsx'), os.path.join(workdir, 'file2.xlsx')
+        changed = generate_pair(file1, file2, **config)
+        results = {}
+        for name, fn in _stages(file1, file2, workdir, reader):
+            if stages and name not in stages:
+                continue
+            results[name] = measure(fn, repeat, memory)
+            if report:
+                report(name, results[name])
+        return {
+            'config': dict(config, reader=reader, repeat=repeat),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'changed_rows': changed,
+            'file_bytes': [os.path.getsize(file1), os.path.getsize(file2)],
+            'snapshot_chunk_rows': snapshot.CHUNK_ROWS,
+            'stages': results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare_runs(baseline, current, tolerance=0.2):
+    """Returns (lines, regressed): a table of stage timings against the baseline, and whether any regressed."""
+    lines = [f"{'stage':<22}{'baseline s':>12}{'current s':>12}{'ratio':>8}"]
+    regressed = False
+    for name, entry in current['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if not before:
+            lines.append(f"{name:<22}{'-':>12}{entry['seconds']:>12.4f}{'-':>8}")
+            continue
+        ratio = entry['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        # Slowdowns within the timer noise don't count, whatever the ratio
+        if ratio > 1 + tolerance and entry['seconds'] - before['seconds'] > NOISE_SECONDS:
+            regressed = True
+            flag = '  slower'
+        lines.append(f"{name:<22}{before['seconds']:>12.4f}{entry['seconds']:>12.4f}{ratio:>8.2f}{flag}")
+    if baseline.get('config') != current['config']:
+        lines.append("note: the baseline was run with a different configuration")
+    return lines, regressed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Benchmark the comparison pipeline.")
+    for name, default in DEFAULTS.items():
+        parser.add_argument('--' + name.replace('_', '-'), type=type(default), default=default)
+    parser.add_argument('--reader', default='openpyxl', help="workbook reader: openpyxl or xml")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the fastest one counts")
+    parser.add_argument('--stages', help="comma-separated stages to run (default: all)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run of each stage")
+    parser.add_argument('-o', '--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {name: getattr(args, name) for name in DEFAULTS}
+    stages = set(args.stages.split(',')) if args.stages else None
+
+    def report(name, entry):
+        memory = f", peak {entry['peak_mb']} MB" if 'peak_mb' in entry else ''
+        print(f"{name}: {entry['seconds']}s{memory}", file=sys.stderr)
+
+    results = run_benchmark(config, repeat=args.repeat, memory=not args.no_memory,
+                            stages=stages, report=report, reader=args.reader)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            lines, regressed = compare_runs(json.load(f), results, args.tolerance)
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+
+
+class SheetDiff:
+    """
+    Differences found in one sheet of file 1. All indices are 1-based.
+    key_cols holds the key column(s) rows were matched on, empty for positional matching.
+
+    changed_rows: rows matched in file 2 with at least one differing column.
+        The columns of changed_rows[i] are
+        changed_cols[changed_offsets[i]:changed_offsets[i + 1]].
+    missing_rows: rows with no match in file 2 (every column differs).
+        A sheet missing from file 2 (in_file2 False) only counts its rows:
+        every one of them is missing, and neither they nor their values are
+        kept, so the result stays small however large the sheet is.
+    row_values: file 1 values of the header row and of every differing row,
+        so views can be rendered without reading file 1 again. Views of a
+        sheet missing from file 2 replay its values from file 1 instead.
+    view_rows: the rows of row_values in row order, so a page of the view
+        is sliced out directly.
+    fast_rows: matched rows found identical by one whole-row comparison,
+        without comparing cell by cell.
+    columns: the 1-based columns read and compared when only some were
+        selected (see selection.py), else None.
+    """
+
+    __slots__ = ('name', 'header_row', 'key_cols', 'in_file2', 'max_row', 'max_col',
+                 'changed_rows', 'changed_offsets', 'changed_cols', 'missing_rows',
+                 'row_values', 'view_rows', 'fast_rows', 'columns')
+
+    def __init__(self, name, header_row=None, key_cols=None, in_file2=True, columns=None):
+        self.name = name
+        self.header_row = header_row
+        self.key_cols = tuple(key_cols) if key_cols else ()
+        self.in_file2 = in_file2
+        self.max_row = 0
+        self.max_col = 0
+        self.changed_rows = array('I')
+        self.changed_offsets = array('I', [0])
+        self.changed_cols = array('H')
+        self.missing_rows = array('I')
+        self.row_values = {}
+        self.view_rows = array('I')
+        self.fast_rows = 0
+        self.columns = tuple(sorted(columns)) if columns is not None else None
+
+    def add_row(self, row_idx, values, diff_cols):
+        """Record one compared row; diff_cols is None when the row is missing from file 2."""
+        self.max_row = row_idx
+        if len(values) > self.max_col:
+            self.max_col = len(values)
+        if not self.in_file2:
+            return
+        if diff_cols is None:
+            self.missing_rows.append(row_idx)
+        elif diff_cols:
+            self.changed_rows.append(row_idx)
+            self.changed_cols.extend(diff_cols)
+            self.changed_offsets.append(len(self.changed_cols))
+        elif row_idx != self.header_row:
+            return
+        self.row_values[row_idx] = values
+        self.view_rows.append(row_idx)
+
+    def record(self, rows):
+        """Pass (row_idx, values, diff_cols) rows through, recording each one."""
+        for row in rows:
+            self.add_row(*row)
+            yield row
+
+    def iter_changed(self):
+        offsets = self.changed_offsets
+        for i, row_idx in enumerate(self.changed_rows):
+            yield row_idx, tuple(self.changed_cols[offsets[i]:offsets[i + 1]])
+
+    def iter_diff_rows(self):
+        """Yield (row_idx, diff_cols) for every differing row in row order; diff_cols is None for missing rows."""
+        if not self.in_file2:
+            return ((row_idx, None) for row_idx in range(1, self.max_row + 1))
+        missing = ((row_idx, None) for row_idx in self.missing_rows)
+        return merge(self.iter_changed(), missing, key=lambda item: item[0])
+
+    def replay(self, value_rows):
+        """
+        Pair the value rows of the sheet (row 1 first) with the recorded diffs,
+        yielding (row_idx, values, diff_cols) like engine.compare_sheet does.
+        """
+        diffs = self.iter_diff_rows()
+        next_diff = next(diffs, None)
+        for row_idx, values in enumerate(value_rows, 1):
+            diff_cols = ()
+            if next_diff is not None and next_diff[0] == row_idx:
+                diff_cols = next_diff[1]
+                next_diff = next(diffs, None)
+            yield row_idx, values, diff_cols
+
+    def row_diff(self, row_idx):
+        """diff_cols of one row: a tuple (empty if unchanged), or None if the row is missing from file 2."""
+        if not self.in_file2:
+            return None
+        i = bisect_left(self.missing_rows, row_idx)
+        if i < len(self.missing_rows) and self.missing_rows[i] == row_idx:
+            return None
+        i = bisect_left(self.changed_rows, row_idx)
+        if i < len(self.changed_rows) and self.changed_rows[i] == row_idx:
+            return tuple(self.changed_cols[self.changed_offsets[i]:self.changed_offsets[i + 1]])
+        return ()
+
+    def iter_view_rows(self, start=0, stop=None, value_rows=None):
+        """
+        Yield (row_idx, values, diff_cols) for the header row and every
+        differing row, in row order, optionally for a slice of them only.
+        For a sheet missing from file 2 that is every row, the values coming
+        from value_rows: the value rows of the sheet in file 1, row 1 first.
+        """
+        if not self.in_file2:
+            if value_rows is None:
+                raise ValueError(f"Sheet {self.name!r} is missing from file 2: its values are read from file 1")
+            for row_idx, values in islice(enumerate(value_rows, 1), start, stop):
+                yield row_idx, values, None
+            return
+        for row_idx in self.view_rows[start:stop]:
+            yield row_idx, self.row_values[row_idx], self.row_diff(row_idx)
+
+    @property
+    def view_row_count(self):
+        return self.max_row if not self.in_file2 else len(self.row_values)
+
+    def is_header(self, row_idx):
+        return bool(self.header_row) and row_idx == self.header_row
+
+    @property
+    def key_col(self):
+        """First key column, or None when rows are matched by position."""
+        return self.key_cols[0] if self.key_cols else None
+
+    def is_key(self, row_idx, col_idx):
+        # Only ID cells of data rows count as key cells
+        return col_idx in self.key_cols and row_idx > self.header_row
+
+    @property
+    def missing_row_count(self):
+        return self.max_row if not self.in_file2 else len(self.missing_rows)
+
+    @property
+    def diff_row_count(self):
+        return len(self.changed_rows) + self.missing_row_count
+
+    @property
+    def diff_cell_count(self):
+        return len(self.changed_cols) + self.missing_row_count * self.max_col
+
+    def __repr__(self):
+        return f"<SheetDiff {self.name!r} changed={len(self.changed_rows)} missing={self.missing_row_count}>"
+
+
+class DiffResult:
+    """
+    Outcome of comparing two workbooks: one SheetDiff per sheet of file 1, in sheet order.
+    output_mode is the engine output mode of the output workbook written with it.
+    """
+
+    __slots__ = ('sheets', 'output_mode')
+
+    def __init__(self, sheets=None, output_mode='full'):
+        self.sheets = sheets if sheets is not None else []
+        self.output_mode = output_mode
+
+    def __iter__(self):
+        return iter(self.sheets)
+
+    def __getitem__(self, name):
+        for sheet in self.sheets:
+            if sheet.name == name:
+                return sheet
+        raise KeyError(name)
+
+    @property
+    def diff_row_count(self):
+        return sum(sheet.diff_row_count for sheet in self.sheets)
+
+    @property
+    def fast_row_count(self):
+        return sum(sheet.fast_rows for sheet in self.sheets)
+
+    @property
+    def has_diffs(self):
+        return any(sheet.diff_row_count for sheet in self.sheets)
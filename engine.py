@@ -0,0 +1,584 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from itertools import chain, islice, repeat
+from openpyxl import load_workbook, Workbook
+from diff_result import SheetDiff, DiffResult
+from writers import register_styles, cell_style, new_output_workbook, write_sheet, write_diff_sheet
+from layout import HEADER_SCAN_ROWS, DEFAULT_DETECTOR
+from key_index import KeyIndex, key_getter
+from snapshot import SnapshotWorkbook, write_snapshot
+from xlsx_reader import XlsxWorkbook, XlsxSheet
+from alignment import match_rows
+from metrics import Metrics, NO_METRICS
+
+# Rows between two progress reports
+PROGRESS_INTERVAL = 5000
+
+# How cell values are read from a workbook: openpyxl's read-only mode, or
+# straight from the sheet XML (see xlsx_reader.py), about twice as fast
+READERS = ('openpyxl', 'xml')
+# Internal reader of snapshot files, for workers given the path of a SnapshotWorkbook source
+SNAPSHOT_READER = 'snapshot'
+
+# How rows of sheets without a key column are matched: by position, or
+# aligned like a text diff so inserted, deleted and moved rows are found
+# (see alignment.py; both sheets are then held in memory)
+ALIGNMENTS = ('position', 'diff')
+
+
+def open_workbook(source, reader='openpyxl'):
+    """
+    Open a workbook for streaming.
+    read_only keeps openpyxl from materialising every cell up front; rows are
+    parsed from the sheet XML on demand while we iterate. reader 'xml' reads
+    the values without openpyxl. A snapshot.SnapshotWorkbook source is used
+    as it is, and reader 'snapshot' opens a path as one: sources are never
+    taken for snapshots by their content.
+    """
+    if isinstance(source, SnapshotWorkbook):
+        return source
+    if reader == SNAPSHOT_READER:
+        return SnapshotWorkbook(source)
+    if reader == 'xml':
+        return XlsxWorkbook(source)
+    if reader != 'openpyxl':
+        raise ValueError(f"Unknown workbook reader: {reader!r}")
+    return load_workbook(source, read_only=True, data_only=True)
+
+
+def sheet_dimensions(ws):
+    """
+    Returns (max_row, max_column) for a read-only worksheet, taken from the
+    sheet's <dimension> record. Sheets written without one are sized with an
+    extra values pass. Like a regular worksheet, even an empty sheet has A1.
+    The record is only a hint: it can be stale, so sheet_rows reads past it.
+    """
+    max_row, max_col = ws.max_row, ws.max_column
+    if max_row is None or max_col is None:
+        max_row = max_col = 1
+        for idx, row in enumerate(ws.iter_rows(values_only=True), 1):
+            if any(v is not None for v in row):
+                max_row = idx
+                max_col = max(max_col, len(row))
+    return max_row, max_col
+
+
+def select_columns(rows, columns):
+    """Rows with only the 1-based columns in columns kept; the other cells are empty."""
+    keep = sorted(c - 1 for c in columns)
+    for row in rows:
+        selected = [None] * len(row)
+        for i in keep:
+            if i >= len(row):
+                break
+            selected[i] = row[i]
+        yield tuple(selected)
+
+
+def sheet_rows(ws, dims, min_row=1, columns=None):
+    """
+    Yield value tuples for the rows of a sheet from min_row on.
+    dims (see sheet_dimensions) is only a hint: rows and cells past it are
+    read until the sheet runs out, and every row is padded to the widest row
+    seen so far, at least dims[1]. Rows missing from the end of the sheet
+    XML up to dims[0] still count as (empty) rows.
+    columns, a set of 1-based columns (see selection.Selection), limits what
+    is read: the other cells come back empty.
+    """
+    max_row, width = dims
+    if hasattr(ws, 'reset_dimensions'):
+        # openpyxl would cut every row and the sheet off at the <dimension> record
+        ws.reset_dimensions()
+    if columns is None:
+        rows = ws.iter_rows(min_row=min_row, values_only=True)
+    elif isinstance(ws, XlsxSheet):
+        # Cells of other columns aren't even converted
+        rows = ws.iter_rows(min_row=min_row, values_only=True, columns=frozenset(columns))
+    else:
+        rows = select_columns(ws.iter_rows(min_row=min_row, values_only=True), columns)
+    row_idx = min_row - 1
+    for row_idx, row in enumerate(rows, min_row):
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        else:
+            width = len(row)
+            row = tuple(row)
+        yield row
+    for _ in range(row_idx, max_row):
+        yield (None,) * width
+
+
+def file1_rows(source, sheet, numbered=False):
+    """
+    Value rows of a sheet missing from file 2 (see SheetDiff.iter_view_rows),
+    read back from source: file 1, or an output workbook of compare_workbooks,
+    whose rows are then led by their row number when numbered (diff-only output).
+    """
+    lead = 1 if numbered else 0
+    wb = open_workbook(source)
+    try:
+        rows = (row[lead:] for row in sheet_rows(wb[sheet.name], (sheet.max_row, sheet.max_col + lead)))
+        if sheet.columns is not None:
+            rows = select_columns(rows, sheet.columns)
+        yield from rows
+    finally:
+        wb.close()
+
+
+def save_snapshot(source, f, reader='openpyxl'):
+    """Parse every sheet of a workbook once and write them to f as a snapshot."""
+    wb = open_workbook(source, reader)
+    try:
+        write_snapshot(f, ((name, sheet_rows(wb[name], sheet_dimensions(wb[name]))) for name in wb.sheetnames))
+    finally:
+        wb.close()
+
+
+class PositionalRows:
+    """
+    Forward-only cursor over a sheet, returning the row at a given index.
+    Rows past the end of the sheet come back as empty cells, the same as
+    indexing past max_row on a regular worksheet.
+    """
+
+    def __init__(self, ws, dims, columns=None):
+        self._rows = sheet_rows(ws, dims, columns=columns)
+        self._next_idx = 1
+        self._current = None
+        self._width = max(dims[1], 1)
+
+    def get(self, row_idx):
+        while self._next_idx <= row_idx:
+            row = next(self._rows, None)
+            if row is None:
+                # As wide as the sheet turned out to be
+                row = (None,) * self._width
+            self._width = max(self._width, len(row))
+            self._current = row
+            self._next_idx += 1
+        return self._current
+
+
+def build_key_index(ws, dims, header_row_idx, get_key, columns=None):
+    """
+    KeyIndex of key -> row values for the data rows of ws; get_key is a key_index.key_getter.
+    columns limits the values kept, as in sheet_rows.
+    """
+    index = KeyIndex()
+    for row in sheet_rows(ws, dims, min_row=header_row_idx + 1, columns=columns):
+        key = get_key(row)
+        if key is not None:
+            index.add(key, row)
+    return index
+
+
+def diff_columns(values, row2, kernels=None):
+    """
+    1-based columns whose value differs from row2; cells past the end of row2
+    always differ. kernels (see tolerance.Tolerance.kernels) decide whether
+    two values that aren't equal still count as equal.
+    """
+    if kernels is None:
+        return tuple(
+            i for i, value in enumerate(values, 1)
+            if i > len(row2) or value != row2[i - 1]
+        )
+    # Rows can be wider than the leading rows the kernels were picked from
+    kernels = chain(kernels, repeat(None))
+    return tuple(
+        i for i, (value, equal) in enumerate(zip(values, kernels), 1)
+        if i > len(row2) or (value != row2[i - 1] and not (equal and equal(value, row2[i - 1])))
+    )
+
+
+def head_width(head, dims):
+    """Width of a sheet as far as its leading rows head tell, at least the dims hint."""
+    return max([dims[1]] + [len(row) for row in head])
+
+
+def read_layout(ws, dims, detector, selection=None):
+    """
+    Read the leading rows of ws and detect its layout.
+    Returns (header_row_idx, key_cols, columns, head, rows): columns is the
+    set of columns selection (a selection.Selection) keeps, None for all;
+    head holds the leading rows and rows iterates over the rest, both
+    limited to those columns.
+    """
+    rows = sheet_rows(ws, dims)
+    head = list(islice(rows, HEADER_SCAN_ROWS))
+    header_row_idx, key_cols = detector.detect(head)
+    columns = None
+    if selection:
+        header = head[header_row_idx - 1] if header_row_idx else None
+        columns = selection.column_set(header, key_cols, head_width(head, dims))
+    if columns is not None:
+        # Read the rest again, without the cells of the other columns
+        rows.close()
+        head = list(select_columns(head, columns))
+        rows = sheet_rows(ws, (dims[0], head_width(head, dims)), min_row=len(head) + 1, columns=columns)
+    return header_row_idx, key_cols, columns, head, rows
+
+
+def column_kernels(tolerance, rows, header_row_idx, width):
+    """Per-column kernels of a tolerance for a sheet whose leading rows are rows, or None."""
+    if not tolerance:
+        return None
+    return tolerance.kernels(rows[header_row_idx or 0:], width)
+
+
+def compare_sheet(sheet_name, ws1, ws2, detector=DEFAULT_DETECTOR, normalizer=None, metrics=NO_METRICS,
+                  alignment='position', tolerance=None, selection=None):
+    """
+    Compare one sheet of file 1 against its counterpart in file 2 (or None).
+    Returns (sheet, rows): sheet is an empty SheetDiff carrying the detected
+    layout, and rows lazily yields (row_idx, values, diff_cols) for every row
+    of ws1. diff_cols holds the 1-based columns whose value differs from
+    file 2, or is None when the row has no match in file 2 at all.
+    detector (a layout.KeyDetector) finds the header row and key column(s);
+    normalizer (a key_index.KeyNormalizer) canonicalizes key values before matching.
+    metrics (a metrics.Metrics) is charged with the detect and index stages.
+    Only the key index of ws2 and the current row of ws1 are held in memory,
+    except with alignment 'diff' on a sheet without a key column: both sheets
+    are then read into memory and aligned by alignment.match_rows.
+    tolerance (a tolerance.Tolerance) lets values that aren't equal count as equal.
+    selection (a selection.Selection) limits the columns read and compared.
+    """
+    dims1 = sheet_dimensions(ws1)
+
+    # Scan the leading rows for the header, then put them back in front
+    with metrics.stage('detect'):
+        header_row_idx, key_cols, columns, head, rows1 = read_layout(ws1, dims1, detector, selection)
+        kernels = column_kernels(tolerance, head, header_row_idx, head_width(head, dims1))
+    rows1 = chain(head, rows1)
+
+    sheet = SheetDiff(sheet_name, header_row_idx, key_cols, in_file2=ws2 is not None, columns=columns)
+
+    ws2_index = None
+    positional = None
+    aligned = None
+    if ws2 is not None:
+        dims2 = sheet_dimensions(ws2)
+        if key_cols:
+            get_key = key_getter(key_cols, normalizer)
+            with metrics.stage('index'):
+                ws2_index = build_key_index(ws2, dims2, header_row_idx, get_key, columns)
+        if not key_cols and alignment == 'diff':
+            with metrics.stage('load'):
+                rows1 = list(rows1)
+                rows2 = list(sheet_rows(ws2, dims2, columns=columns))
+            with metrics.stage('align'):
+                aligned = [rows2[j] if j >= 0 else None for j in match_rows(rows1, rows2)]
+            del rows2
+        else:
+            positional = PositionalRows(ws2, dims2, columns)
+
+    def rows():
+        for row_idx, values in enumerate(rows1, 1):
+            row2 = None
+            if aligned is not None:
+                row2 = aligned[row_idx - 1]
+            elif positional is not None:
+                if header_row_idx and row_idx > header_row_idx and ws2_index:
+                    # Data row: look up by key
+                    key = get_key(values)
+                    if key is not None:
+                        row2 = ws2_index.match(key)
+                else:
+                    # Header, pre-header rows or no key column: match by position
+                    row2 = positional.get(row_idx)
+
+            if row2 is None:
+                # Row (or the whole sheet) not found in File 2
+                diff_cols = None
+            elif values == row2:
+                # Fast path: identical rows need no cell-by-cell comparison
+                diff_cols = ()
+                sheet.fast_rows += 1
+            else:
+                diff_cols = diff_columns(values, row2, kernels)
+            yield row_idx, values, diff_cols
+
+    return sheet, rows()
+
+
+OUTPUT_MODES = ('full', 'diff')
+
+
+def check_options(output_mode='full', reader='openpyxl', alignment='position'):
+    """Raise ValueError on an unknown comparison option."""
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode!r}")
+    if reader not in READERS:
+        raise ValueError(f"Unknown workbook reader: {reader!r}")
+    if alignment not in ALIGNMENTS:
+        raise ValueError(f"Unknown row alignment: {alignment!r}")
+
+
+def iter_sheets(wb1, wb2, detector=DEFAULT_DETECTOR, normalizer=None, metrics=NO_METRICS, alignment='position',
+                workers=1, tolerance=None, selection=None):
+    """
+    Yield (sheet, rows) as returned by compare_sheet for each sheet of wb1, in order,
+    or for the sheets selection (a selection.Selection) picks.
+    With workers > 1, the rows of large sheets are compared in that many
+    processes (see shards.py).
+    """
+    compare = compare_sheet
+    if workers > 1:
+        # Imported on demand: shards imports this module
+        import shards
+        compare = partial(shards.compare_sheet_sharded, workers=workers)
+    sheet_names = selection.sheet_names(wb1.sheetnames) if selection else wb1.sheetnames
+    for sheet_name in sheet_names:
+        ws2 = wb2[sheet_name] if sheet_name in wb2.sheetnames else None
+        yield compare(sheet_name, wb1[sheet_name], ws2, detector, normalizer, metrics, alignment, tolerance,
+                      selection)
+
+
+class Progress:
+    """
+    Counts compared rows and reports them to a callback as
+    callback(sheets_done, sheet_count, rows_processed), at most every interval rows.
+    """
+
+    def __init__(self, callback, sheet_count, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.sheet_count = sheet_count
+        self.interval = interval
+        self.sheets_done = 0
+        self.rows_processed = 0
+
+    def count(self, rows):
+        for row in rows:
+            self.rows_processed += 1
+            if self.rows_processed % self.interval == 0:
+                self.report()
+            yield row
+
+    def sheet_done(self, rows=0):
+        """Mark a sheet as finished; rows adds rows that weren't passed through count()."""
+        self.sheets_done += 1
+        self.rows_processed += rows
+        self.report()
+
+    def report(self):
+        self.callback(self.sheets_done, self.sheet_count, self.rows_processed)
+
+
+@contextmanager
+def local_path(source):
+    """
+    Yield a filesystem path for a workbook source, so other processes can open it.
+    File-like sources (uploads, store entries) are copied to a temp file first,
+    and so is the file of a SnapshotWorkbook.
+    """
+    if isinstance(source, SnapshotWorkbook):
+        source = source.file
+    if isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    tmp = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    try:
+        with tmp:
+            shutil.copyfileobj(source, tmp)
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+
+# Both workbooks of a compare_sheets_parallel worker process, opened once by its initializer
+_worker_workbooks = None
+
+
+def _open_worker_workbooks(path1, reader1, path2, reader2):
+    """Pool initializer: open both workbooks once per process, so their shared strings are parsed once."""
+    global _worker_workbooks
+    _worker_workbooks = (open_workbook(path1, reader1), open_workbook(path2, reader2))
+
+
+def _source_reader(source, reader):
+    """Reader a worker opens the local_path of source with."""
+    return SNAPSHOT_READER if isinstance(source, SnapshotWorkbook) else reader
+
+
+def _compare_sheet_task(args):
+    """
+    Pool task: compare one sheet of the workbooks the worker opened.
+    With rows_path, the rows of file 1 are written there as they are compared
+    (a snapshot of the one sheet), so the output can be written without
+    parsing file 1 again.
+    Returns (SheetDiff, stage timings), the timings being empty unless measure is set.
+    """
+    sheet_name, detector, normalizer, alignment, tolerance, selection, measure, rows_path = args
+    wb1, wb2 = _worker_workbooks
+    metrics = Metrics() if measure else NO_METRICS
+    ws2 = wb2[sheet_name] if sheet_name in wb2.sheetnames else None
+    sheet, rows = compare_sheet(sheet_name, wb1[sheet_name], ws2, detector, normalizer, metrics, alignment,
+                                tolerance, selection)
+    rows = metrics.timed('compare', sheet.record(rows))
+    if rows_path is None:
+        deque(rows, maxlen=0)
+    else:
+        with open(rows_path, 'wb') as f:
+            write_snapshot(f, [(sheet_name, (values for _, values, _ in rows))])
+    return sheet, metrics.timings if metrics else {}
+
+
+def _kept_rows(path, sheet_name):
+    """Rows of file 1 a worker wrote to path (see _compare_sheet_task); the file is removed once read."""
+    wb = SnapshotWorkbook(path)
+    try:
+        yield from wb[sheet_name].iter_rows()
+    finally:
+        wb.close()
+        os.remove(path)
+
+
+def compare_sheets_parallel(file1, file2, sheet_names, workers, detector=DEFAULT_DETECTOR, normalizer=None,
+                            metrics=NO_METRICS, reader='openpyxl', alignment='position', tolerance=None,
+                            selection=None, keep_rows=False):
+    """
+    Compare the given sheets in a process pool, one task per sheet; each
+    worker opens both workbooks once. Yields (SheetDiff, rows) in sheet_names
+    order as they become available. With keep_rows, rows iterates over the
+    value rows of the sheet in file 1, read back from a temp file the worker
+    wrote; it must be consumed before the next sheet is taken. Else it is None.
+    The stage timings of the workers are added to metrics, so they sum the
+    time of every process rather than the elapsed time.
+    """
+    with local_path(file1) as path1, local_path(file2) as path2, \
+            (tempfile.TemporaryDirectory(prefix='excel-compare-rows-') if keep_rows else nullcontext()) as rows_dir:
+        # spawn rather than fork: we may be running inside a threaded web worker
+        initargs = (path1, _source_reader(file1, reader), path2, _source_reader(file2, reader))
+        with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_open_worker_workbooks, initargs=initargs) as pool:
+            rows_paths = [os.path.join(rows_dir, f'{i}.rows') if rows_dir else None for i in range(len(sheet_names))]
+            tasks = [(name, detector, normalizer, alignment, tolerance, selection, bool(metrics), rows_path)
+                     for name, rows_path in zip(sheet_names, rows_paths)]
+            for (sheet, timings), rows_path in zip(pool.map(_compare_sheet_task, tasks), rows_paths):
+                metrics.merge(timings)
+                yield sheet, _kept_rows(rows_path, sheet.name) if rows_path else None
+
+
+def compare_workbooks(file1, file2, stream=None, progress=None, workers=1, detector=DEFAULT_DETECTOR,
+                      normalizer=None, output_mode='full', metrics=None, reader='openpyxl', alignment='position',
+                      tolerance=None, selection=None):
+    """
+    Compare two workbooks and return a DiffResult.
+    file1 and file2 are paths or binary files of workbooks, or
+    snapshot.SnapshotWorkbooks (see jobs.open_snapshot).
+    If stream is given, the highlighted workbook is written to it in the same
+    pass: rows are appended to a write-only workbook as they are compared.
+    progress, if given, is called as progress(sheets_done, sheet_count, rows_processed).
+    With workers > 1, sheets are compared in that many processes; the output
+    is then written from the SheetDiffs and the rows the workers kept, in the
+    original sheet order.
+    A workbook with a single sheet is instead split into row ranges compared
+    in that many processes (see shards.py).
+    detector (a layout.KeyDetector) finds the header row and key column(s) of
+    each sheet, and normalizer (a key_index.KeyNormalizer) canonicalizes keys.
+    output_mode 'diff' writes only the header and differing rows of each sheet,
+    led by their row numbers, from the DiffResult once everything is compared.
+    metrics, if given, is a metrics.Metrics that gets the time of each stage
+    and the counts of the result.
+    reader picks how cell values are read: 'openpyxl' or 'xml' (see xlsx_reader.py).
+    alignment picks how rows of sheets without a key column are matched:
+    'position' or 'diff' (see alignment.py).
+    tolerance, a tolerance.Tolerance, lets close numbers, dates written
+    differently and text differing in whitespace or case count as equal.
+    selection, a selection.Selection, restricts the comparison to some sheets
+    (raising selection.UnknownSheet for a sheet file 1 doesn't have) and
+    columns; the other sheets are left out of the result and the output.
+    """
+    check_options(output_mode, reader, alignment)
+    metrics = metrics or NO_METRICS
+    with metrics.stage('open'):
+        wb1 = open_workbook(file1, reader)
+        wb2 = open_workbook(file2, reader)
+    output_wb = new_output_workbook() if stream is not None else None
+    # Full output is written while comparing; diff-only output afterwards
+    full_wb = output_wb if output_mode == 'full' else None
+    result = DiffResult(output_mode=output_mode)
+
+    try:
+        sheet_names = selection.sheet_names(wb1.sheetnames) if selection else wb1.sheetnames
+        tracker = Progress(progress, len(sheet_names)) if progress else None
+        if workers > 1 and len(sheet_names) > 1:
+            # The workers keep the rows of file 1 for the full output, so it isn't parsed again here
+            sheets = compare_sheets_parallel(file1, file2, sheet_names, workers, detector, normalizer,
+                                             metrics, reader, alignment, tolerance, selection,
+                                             keep_rows=full_wb is not None)
+            for sheet, value_rows in metrics.timed('wait', sheets):
+                result.sheets.append(sheet)
+                if full_wb is not None:
+                    with metrics.stage('write'):
+                        write_sheet(full_wb.create_sheet(title=sheet.name), sheet, sheet.replay(value_rows))
+                if tracker:
+                    tracker.sheet_done(rows=sheet.max_row)
+        else:
+            for sheet, rows in iter_sheets(wb1, wb2, detector, normalizer, metrics, alignment, workers,
+                                           tolerance, selection):
+                result.sheets.append(sheet)
+                rows = metrics.timed('compare', sheet.record(rows))
+                if tracker:
+                    rows = tracker.count(rows)
+                if full_wb is not None:
+                    with metrics.stage('write'):
+                        write_sheet(full_wb.create_sheet(title=sheet.name), sheet, rows)
+                else:
+                    deque(rows, maxlen=0)
+                if tracker:
+                    tracker.sheet_done()
+        if output_wb is not None:
+            if full_wb is None:
+                with metrics.stage('write'):
+                    for sheet in result:
+                        # Sheets missing from file 2 are replayed from file 1
+                        value_rows = None if sheet.in_file2 else sheet_rows(
+                            wb1[sheet.name], (sheet.max_row, sheet.max_col), columns=sheet.columns)
+                        write_diff_sheet(output_wb.create_sheet(title=sheet.name), sheet, value_rows)
+            with metrics.stage('save'):
+                output_wb.save(stream)
+    finally:
+        wb1.close()
+        wb2.close()
+
+    metrics.add_result(result)
+    return result
+
+
+def compare_excels(file1, file2, detector=DEFAULT_DETECTOR, normalizer=None, reader='openpyxl',
+                   alignment='position', workers=1, tolerance=None, selection=None):
+    wb1 = open_workbook(file1, reader)
+    wb2 = open_workbook(file2, reader)
+
+    # Create a new workbook for output
+    output_wb = Workbook()
+    output_wb.remove(output_wb.active) # Remove default sheet
+    register_styles(output_wb)
+
+    try:
+        for sheet, rows in iter_sheets(wb1, wb2, detector=detector, normalizer=normalizer, alignment=alignment,
+                                       workers=workers, tolerance=tolerance, selection=selection):
+            ws_out = output_wb.create_sheet(title=sheet.name)
+            for row_idx, values, diff_cols in rows:
+                if diff_cols is not None:
+                    diff_cols = set(diff_cols)
+                for col_idx, value in enumerate(values, 1):
+                    new_cell = ws_out.cell(row=row_idx, column=col_idx, value=value)
+                    style = cell_style(sheet, row_idx, col_idx, diff_cols)
+                    if style:
+                        new_cell.style = style
+    finally:
+        wb1.close()
+        wb2.close()
+
+    return output_wb
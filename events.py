@@ -0,0 +1,93 @@
+"""
+Comparison as a stream of diff events.
+
+iter_events compares two workbooks like engine.compare_workbooks but, instead
+of returning a DiffResult at the end, yields an event for everything it finds
+while it reads file 1, in sheet and row order. Nothing is accumulated, so a
+caller can act on the first differences of a large workbook right away, and
+memory stays that of the comparison itself (the key index of file 2).
+
+Events are dicts with an 'event' type:
+    sheet       {'sheet', 'in_file2'}                  a sheet of file 1 is started
+    header      {'sheet', 'row', 'key_cols'}           its header row was found
+    changed     {'sheet', 'row', 'diff_cols', 'values'} a row differs in diff_cols
+    missing     {'sheet', 'row', 'values'}             a row has no match in file 2
+    sheet_done  {'sheet', 'rows', 'diff_rows', 'fast_rows'}
+    done        {'sheets', 'diff_rows'}
+Rows and columns are 1-based; values are the row's values in file 1.
+
+iter_ndjson and iter_sse turn events into NDJSON lines or server-sent events.
+"""
+import json
+from engine import check_options, iter_sheets, open_workbook
+from exports import json_value
+from layout import DEFAULT_DETECTOR
+from metrics import NO_METRICS
+
+EVENT_FORMATS = ('ndjson', 'sse')
+
+
+def iter_events(file1, file2, detector=DEFAULT_DETECTOR, normalizer=None, metrics=None,
+                reader='openpyxl', alignment='position', tolerance=None, selection=None):
+    """
+    Yield the diff events of comparing file1 against file2 (paths or binary files).
+    Options are those of engine.compare_workbooks; metrics gets the open and
+    comparison stages. Both workbooks are closed when the generator is
+    exhausted or closed early.
+    """
+    check_options(reader=reader, alignment=alignment)
+    metrics = metrics or NO_METRICS
+    with metrics.stage('open'):
+        wb1 = open_workbook(file1, reader)
+        wb2 = open_workbook(file2, reader)
+    sheet_count = diff_rows_total = 0
+    try:
+        for sheet, rows in iter_sheets(wb1, wb2, detector, normalizer, metrics, alignment,
+                                       tolerance=tolerance, selection=selection):
+            name = sheet.name
+            sheet_count += 1
+            yield {'event': 'sheet', 'sheet': name, 'in_file2': sheet.in_file2}
+            if sheet.header_row:
+                yield {'event': 'header', 'sheet': name, 'row': sheet.header_row, 'key_cols': list(sheet.key_cols)}
+            row_count = diff_rows = 0
+            for row_idx, values, diff_cols in metrics.timed('compare', rows):
+                row_count = row_idx
+                if diff_cols is None:
+                    diff_rows += 1
+                    yield {'event': 'missing', 'sheet': name, 'row': row_idx, 'values': values}
+                elif diff_cols:
+                    diff_rows += 1
+                    yield {'event': 'changed', 'sheet': name, 'row': row_idx, 'diff_cols': list(diff_cols),
+                           'values': values}
+            diff_rows_total += diff_rows
+            yield {'event': 'sheet_done', 'sheet': name, 'rows': row_count, 'diff_rows': diff_rows,
+                   'fast_rows': sheet.fast_rows}
+        yield {'event': 'done', 'sheets': sheet_count, 'diff_rows': diff_rows_total}
+    finally:
+        wb1.close()
+        wb2.close()
+
+
+def event_json(event):
+    """JSON text of an event, with cell values shown as in the exports."""
+    if 'values' in event:
+        event = dict(event, values=[json_value(v) for v in event['values']])
+    return json.dumps(event, ensure_ascii=False)
+
+
+def iter_ndjson(events):
+    """Events as newline-delimited JSON, one object per line, each yielded as soon as it is found."""
+    return (event_json(event) + '\n' for event in events)
+
+
+def iter_sse(events):
+    """Events as server-sent events, the event type as the SSE event name."""
+    return (f"event: {event['event']}\ndata: {event_json(event)}\n\n" for event in events)
+
+
+def iter_event_format(events, fmt):
+    if fmt == 'ndjson':
+        return iter_ndjson(events)
+    if fmt == 'sse':
+        return iter_sse(events)
+    raise ValueError(f"Unknown event format: {fmt!r}")
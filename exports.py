@@ -0,0 +1,103 @@
+"""
+Diff exports of a DiffResult, produced as streams of text chunks.
+
+Only the header and the differing rows are exported, each with its row
+number in file 1. Everything comes from the stored DiffResult, so neither
+workbook is read again, except for the rows of sheets missing from file 2,
+which the DiffResult doesn't keep: file1_rows gives those.
+"""
+import csv
+import io
+import json
+from openpyxl.utils import get_column_letter
+
+# Rows per chunk yielded by the exporters
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+CSV_COLUMNS = ('sheet', 'row', 'status', 'diff_cols', 'values')
+
+
+def json_value(value):
+    # Dates, times etc. are shown the same way the template would print them
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def row_status(diff_cols):
+    """'missing' for rows not in file 2, 'changed' for rows with differing cells, else 'header'."""
+    if diff_cols is None:
+        return 'missing'
+    return 'changed' if diff_cols else 'header'
+
+
+def iter_diff_records(result, file1_rows=None):
+    """
+    Yield (sheet name, row_idx, values, diff_cols) for the header and differing rows of every sheet.
+    file1_rows(sheet) returns the value rows of a sheet missing from file 2 (see SheetDiff.iter_view_rows).
+    """
+    for sheet in result:
+        value_rows = file1_rows(sheet) if file1_rows and not sheet.in_file2 else None
+        for row_idx, values, diff_cols in sheet.iter_view_rows(value_rows=value_rows):
+            yield sheet.name, row_idx, values, diff_cols
+
+
+def _chunks(lines):
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(buf)
+            buf = []
+    if buf:
+        yield ''.join(buf)
+
+
+def iter_csv(result, file1_rows=None):
+    """
+    CSV export: sheet, row, status, differing column letters (space-separated),
+    then the row's values in the remaining columns.
+    """
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def line(row):
+        writer.writerow(row)
+        text = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return text
+
+    def lines():
+        yield line(CSV_COLUMNS)
+        for name, row_idx, values, diff_cols in iter_diff_records(result, file1_rows):
+            letters = ' '.join(get_column_letter(c) for c in diff_cols) if diff_cols else ''
+            yield line((name, row_idx, row_status(diff_cols), letters) + tuple(values))
+
+    return _chunks(lines())
+
+
+def iter_jsonl(result, file1_rows=None):
+    """JSON lines export: one {"sheet", "row", "status", "diff_cols", "values"} object per row."""
+    def lines():
+        for name, row_idx, values, diff_cols in iter_diff_records(result, file1_rows):
+            record = {
+                'sheet': name,
+                'row': row_idx,
+                'status': row_status(diff_cols),
+                'diff_cols': list(diff_cols) if diff_cols is not None else None,
+                'values': [json_value(v) for v in values],
+            }
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+
+    return _chunks(lines())
+
+
+def iter_export(result, fmt, file1_rows=None):
+    if fmt == 'csv':
+        return iter_csv(result, file1_rows)
+    if fmt == 'jsonl':
+        return iter_jsonl(result, file1_rows)
+    raise ValueError(f"Unknown export format: {fmt!r}")
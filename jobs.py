@@ -0,0 +1,194 @@
+import hashlib
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from engine import compare_workbooks, save_snapshot
+from metrics import Metrics, NO_METRICS, log_comparison
+from snapshot import SNAPSHOT_NAME, SnapshotWorkbook, file_digest
+from store import DiskStore, OUTPUT_NAME, RESULT_NAME
+
+# Entry names of a job in the result store (the job id doubles as the result id)
+JOB_NAME = 'job.json'
+UPLOAD_NAMES = ('file1.xlsx', 'file2.xlsx')
+
+# Entry holding the result id of a memoized comparison, under its memo key
+MEMO_NAME = 'memo.json'
+
+# Options that shape a result; the others (workers, reader, snapshots) only change how it is computed
+MEMO_OPTIONS = ('detector', 'normalizer', 'output_mode', 'alignment', 'tolerance', 'selection')
+
+# Minimum seconds between two progress updates written to the store
+STATUS_INTERVAL = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def open_snapshot(store, source, reader='openpyxl', digest=None):
+    """
+    Snapshot of an uploaded workbook, opened for reading as a
+    snapshot.SnapshotWorkbook; close its file when done. Snapshots are kept
+    in the store under the SHA-256 of the upload, so a file that was seen
+    before is not parsed again; like any entry they expire by age or size.
+    digest is that SHA-256 if the caller already has it.
+    Returns None if the store couldn't keep the snapshot (larger than the store).
+    """
+    digest = digest or file_digest(source)
+    f = store.open(digest, SNAPSHOT_NAME)
+    if f is not None:
+        try:
+            return SnapshotWorkbook(f)
+        except ValueError:
+            # Written in an older format: take it again
+            f.close()
+    with store.writer(digest, SNAPSHOT_NAME) as out:
+        save_snapshot(source, out, reader)
+    f = store.open(digest, SNAPSHOT_NAME)
+    return SnapshotWorkbook(f) if f is not None else None
+
+
+def memo_key(digest1, digest2, options):
+    """
+    Store key of the memo of a comparison: a SHA-256 over the SHA-256 of
+    both workbooks and the options that shape the result (MEMO_OPTIONS).
+    """
+    parts = [digest1, digest2] + [f"{name}={options.get(name)!r}" for name in MEMO_OPTIONS]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def find_memo(store, memo):
+    """
+    Result id of an earlier comparison under the memo key memo, or None.
+    Memos are plain store entries, so they are shared by every worker of a
+    DiskStore and evicted with everything else; a memo whose result was
+    evicted meanwhile counts as a miss. A hit refreshes the result's last access.
+    """
+    entry = store.get_json(memo, MEMO_NAME)
+    if entry is None:
+        return None
+    result_id = entry['result_id']
+    if not all(store.exists(result_id, name) for name in (OUTPUT_NAME, RESULT_NAME)):
+        return None
+    return result_id
+
+
+def store_comparison(store, key, file1, file2, progress=None, snapshots=False, metrics=None,
+                     memo=None, digests=(None, None), **options):
+    """
+    Compare two workbooks and keep the output workbook and DiffResult in the
+    store under key. Returns the DiffResult.
+    With snapshots, both workbooks are read from their snapshots (see open_snapshot);
+    digests are the SHA-256 of the workbooks, if known. A snapshot holds every
+    sheet and column, so a comparison with a selection reads the workbooks
+    directly instead: only the selected data is parsed.
+    metrics (a metrics.Metrics) gets the stage timings and counts.
+    memo, a memo key, is pointed at the stored result (see find_memo).
+    options are passed on to engine.compare_workbooks.
+    """
+    metrics = metrics or NO_METRICS
+    opened = []
+    try:
+        if snapshots and not options.get('selection'):
+            sources = []
+            for source, digest in zip((file1, file2), digests):
+                with metrics.stage('snapshot'):
+                    snapshot = open_snapshot(store, source, options.get('reader', 'openpyxl'), digest)
+                if snapshot is not None:
+                    opened.append(snapshot.file)
+                    source = snapshot
+                sources.append(source)
+            file1, file2 = sources
+        with store.writer(key, OUTPUT_NAME) as output_stream:
+            result = compare_workbooks(file1, file2, output_stream, progress=progress,
+                                       metrics=metrics, **options)
+    finally:
+        for f in opened:
+            f.close()
+    with metrics.stage('store'):
+        store.put_object(key, RESULT_NAME, result)
+        if memo:
+            store.put_json(memo, MEMO_NAME, {'result_id': key})
+    return result
+
+
+def job_status(store, job_id):
+    """Status dict of a job, or None if there is no such job (or it expired)."""
+    return store.get_json(job_id, JOB_NAME)
+
+
+def _set_status(store, job_id, **status):
+    status.setdefault('updated', time.time())
+    store.put_json(job_id, JOB_NAME, status)
+
+
+def set_done(store, job_id, result, **status):
+    """Mark a job as done with the counts of its DiffResult."""
+    _set_status(store, job_id, status=DONE, sheets_done=len(result.sheets),
+                sheet_count=len(result.sheets), rows_processed=sum(sheet.max_row for sheet in result),
+                diff_rows=result.diff_row_count, fast_rows=result.fast_row_count, **status)
+
+
+def run_job(store, job_id, options, memo=None):
+    """
+    Run a queued comparison. Executed in a pool worker; everything it needs
+    is read from the store and everything it produces is written back to it.
+    """
+    last_update = 0.0
+
+    def progress(sheets_done, sheet_count, rows_processed):
+        nonlocal last_update
+        now = time.time()
+        if now - last_update >= STATUS_INTERVAL or sheets_done == sheet_count:
+            last_update = now
+            _set_status(store, job_id, status=RUNNING, sheets_done=sheets_done,
+                        sheet_count=sheet_count, rows_processed=rows_processed, updated=now)
+
+    _set_status(store, job_id, status=RUNNING, sheets_done=0, sheet_count=None, rows_processed=0)
+    metrics = Metrics()
+    file1 = store.open(job_id, UPLOAD_NAMES[0])
+    file2 = store.open(job_id, UPLOAD_NAMES[1])
+    try:
+        if file1 is None or file2 is None:
+            raise RuntimeError("Uploaded files expired before the job started")
+        result = store_comparison(store, job_id, file1, file2, progress=progress, metrics=metrics,
+                                  memo=memo, **options)
+    except Exception as exc:
+        traceback.print_exc()
+        _set_status(store, job_id, status=FAILED, error=str(exc) or type(exc).__name__)
+        return
+    finally:
+        for f in (file1, file2):
+            if f is not None:
+                f.close()
+        for name in UPLOAD_NAMES:
+            store.remove(job_id, name)
+
+    log_comparison(metrics, id=job_id, mode='job')
+    set_done(store, job_id, result, stages={name: round(seconds, 4) for name, seconds in metrics.timings.items()})
+
+
+def submit_job(store, executor, job_id, file1, file2, options, memo=None):
+    """
+    Save both uploads under job_id and queue the comparison (with options) on executor.
+    memo is the memo key to point at the result once it is done.
+    """
+    for name, upload in zip(UPLOAD_NAMES, (file1, file2)):
+        with store.writer(job_id, name) as f:
+            upload.save(f)
+    _set_status(store, job_id, status=QUEUED, sheets_done=0, sheet_count=None, rows_processed=0)
+    executor.submit(run_job, store, job_id, options, memo)
+
+
+def make_executor(store, max_workers=None):
+    """
+    Pool for comparison jobs. Worker processes only work with a store they
+    can reach from another process (a DiskStore); a per-process store falls
+    back to threads.
+    """
+    if isinstance(store, DiskStore):
+        # spawn rather than fork: the web worker may already be running threads
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return ThreadPoolExecutor(max_workers=max_workers)
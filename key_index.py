@@ -0,0 +1,142 @@
+"""
+Matching rows of file 1 to rows of file 2 by key.
+
+A key is the value of the key column, or a tuple of values for a composite
+key spanning several columns. Keys can be normalized first, so " A1" and
+"a1", or 1 and "1", count as the same key.
+"""
+import re
+from decimal import Decimal
+from operator import itemgetter
+
+# Numeric text read as a number by KeyNormalizer: plain ASCII digits, no exponent or underscores
+_INTEGER_RE = re.compile(r'[+-]?[0-9]+')
+_DECIMAL_RE = re.compile(r'[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+)')
+
+
+class KeyNormalizer:
+    """
+    Canonical form of a key value:
+    strip surrounding whitespace, casefold text, and/or read numeric text as a number.
+    Numbers are exact: integer text becomes an int however long it is (long
+    IDs don't collide as floats would), other numbers a Decimal of their
+    shortest form, so "0.1" and the number 0.1 are the same key.
+    """
+
+    def __init__(self, strip=False, casefold=False, numeric=False):
+        self.strip = strip
+        self.casefold = casefold
+        self.numeric = numeric
+
+    def __bool__(self):
+        return self.strip or self.casefold or self.numeric
+
+    def __repr__(self):
+        return f"KeyNormalizer(strip={self.strip!r}, casefold={self.casefold!r}, numeric={self.numeric!r})"
+
+    def __call__(self, value):
+        if isinstance(value, str):
+            if self.strip:
+                value = value.strip()
+                if not value:
+                    return None
+            if self.casefold:
+                value = value.casefold()
+            if self.numeric:
+                # "1" -> 1, "1.50" -> Decimal('1.5'); "1e3", "1_000", "nan" or "inf" stay text
+                if _INTEGER_RE.fullmatch(value):
+                    return int(value)
+                if _DECIMAL_RE.fullmatch(value):
+                    return _exact(Decimal(value))
+        elif self.numeric and isinstance(value, float) and value == value and abs(value) != float('inf'):
+            return int(value) if value.is_integer() else _exact(Decimal(repr(value)))
+        return value
+
+
+def _exact(number):
+    """A Decimal as an int when it is integral, else without trailing zeros."""
+    if number == number.to_integral_value():
+        return int(number)
+    return number.normalize()
+
+
+def key_getter(key_cols, normalizer=None):
+    """
+    Function returning the key of a row: the value of the key column, or a
+    tuple for several key columns. None means the row has no key: a column
+    is past the end of the row, or every key cell is empty.
+    """
+    width = max(key_cols)
+    if len(key_cols) == 1:
+        get = itemgetter(key_cols[0] - 1)
+        if not normalizer:
+            return lambda row: get(row) if len(row) >= width else None
+        return lambda row: normalizer(get(row)) if len(row) >= width else None
+
+    get = itemgetter(*(c - 1 for c in key_cols))
+
+    def composite(row):
+        if len(row) < width:
+            return None
+        key = get(row)
+        if normalizer:
+            key = tuple(map(normalizer, key))
+        return None if all(v is None for v in key) else key
+    return composite
+
+
+# KeyIndex.lookup of a key with several rows in file 2
+DUPLICATE = object()
+
+
+class _Bucket(list):
+    """Rows sharing one key, in sheet order."""
+    __slots__ = ()
+
+
+class KeyIndex:
+    """
+    Multimap of key -> rows of file 2. Most keys are unique, so a key maps
+    straight to its row; only duplicated keys get a bucket. match() pairs
+    the n-th occurrence of a key in file 1 with its n-th occurrence in file 2,
+    and returns None once file 2 has run out of rows for that key.
+    """
+
+    __slots__ = ('_rows', '_taken')
+
+    def __init__(self):
+        self._rows = {}
+        self._taken = {} # key -> occurrences already matched, for duplicated keys only
+
+    def add(self, key, row):
+        existing = self._rows.get(key, _Bucket)
+        if existing is _Bucket:
+            self._rows[key] = row
+        elif type(existing) is _Bucket:
+            existing.append(row)
+        else:
+            self._rows[key] = _Bucket((existing, row))
+
+    def match(self, key):
+        row = self._rows.get(key)
+        if type(row) is not _Bucket:
+            return row
+        taken = self._taken.get(key, 0)
+        self._taken[key] = taken + 1
+        return row[taken] if taken < len(row) else None
+
+    def lookup(self, key):
+        """
+        Row of a key that occurs once in file 2, or None if it doesn't occur;
+        DUPLICATE for a duplicated key, whose rows only match() hands out in
+        order. Doesn't change the index, so it can be used from several processes.
+        """
+        row = self._rows.get(key)
+        return DUPLICATE if type(row) is _Bucket else row
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __bool__(self):
+        return bool(self._rows)
+
@@ -0,0 +1,158 @@
+"""
+Header row and key column detection.
+
+A sheet's header is the first of its leading rows naming the key: either the
+column(s) the user picked, or the first cell matching the key tokens.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+# Scan the first rows of a sheet for the header
+HEADER_SCAN_ROWS = 20
+KEY_TOKENS = ("id", "sku", "#", "貨號")
+
+# How a header cell must match a key token
+#   word:     the token stands alone, not inside a longer ASCII word ("Product ID", "ID_No", "ProductID",
+#             but not "Width")
+#   prefix:   the cell starts with the token as a word ("ID", "SKU Code", "IdNumber", but not "Product ID")
+#   exact:    the whole cell is the token
+#   contains: the token appears anywhere (matches "Valid" and "Width" too)
+MATCH_MODES = ('word', 'prefix', 'exact', 'contains')
+
+# Word boundaries only guard the letter and digit ends of a token, so "Item#", "#No" and CJK
+# headers like "商品貨號" still match. A lower to upper case change is a boundary too ("OrderId"),
+# so they are tested on the header as written; the token itself matches ignoring case.
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz0123456789')
+_BEFORE = r'(?:(?<![A-Za-z0-9])|(?<=[a-z])(?=[A-Z]))'
+_AFTER = r'(?:(?![A-Za-z0-9])|(?<=[a-z])(?=[A-Z]))'
+
+
+def _token_pattern(token, before, after):
+    """Pattern of one key token, with word boundaries at its letter or digit ends where asked."""
+    pattern = f'(?i:{re.escape(token)})'
+    if before and token[:1] in _WORD_CHARS:
+        pattern = _BEFORE + pattern
+    if after and token[-1:] in _WORD_CHARS:
+        pattern += _AFTER
+    return pattern
+
+
+# Detected layouts by fingerprint of the leading rows, most recently used last
+LAYOUT_CACHE_SIZE = 256
+_layout_cache = OrderedDict()
+_layout_cache_lock = threading.Lock()
+
+
+class KeyMatcher:
+    """Tests header cells against the key tokens with one precompiled pattern."""
+
+    def __init__(self, tokens=KEY_TOKENS, mode='word'):
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown key match mode: {mode!r}")
+        self.tokens = tuple(tokens)
+        self.mode = mode
+        before, after = {'word': (True, True), 'prefix': (False, True)}.get(mode, (False, False))
+        tokens = sorted((t.casefold() for t in self.tokens), key=len, reverse=True)
+        alternatives = '|'.join(_token_pattern(t, before, after) for t in tokens)
+        pattern = {
+            'word': f'(?:{alternatives})',
+            'prefix': f'^(?:{alternatives})',
+            'exact': f'^(?:{alternatives})$',
+            'contains': f'(?:{alternatives})',
+        }[mode]
+        self._search = re.compile(pattern).search
+
+    def __call__(self, value):
+        return bool(value) and self._search(str(value).strip()) is not None
+
+
+class KeyDetector:
+    """
+    Finds (header_row_idx, key_cols) among the leading rows of a sheet.
+    key_column names the header of the key column to use, or several
+    comma-separated headers for a composite key ("SKU, Warehouse"); sheets
+    without them fall back to the first cell matching the key tokens.
+    """
+
+    def __init__(self, key_column=None, tokens=KEY_TOKENS, mode='word'):
+        self.matcher = KeyMatcher(tokens, mode)
+        names = (key_column or '').split(',')
+        self.key_columns = tuple(name.strip().casefold() for name in names if name.strip())
+        # Part of every cache key, so differently configured detectors never share entries
+        self._config = (self.key_columns, self.matcher.tokens, self.matcher.mode)
+
+    def _find_named(self, rows):
+        for r_idx, row in enumerate(rows, 1):
+            headers = {}
+            for c_idx, value in enumerate(row, 1):
+                if value is not None:
+                    headers.setdefault(str(value).strip().casefold(), c_idx)
+            if all(name in headers for name in self.key_columns):
+                return r_idx, tuple(headers[name] for name in self.key_columns)
+        return None
+
+    def _find_token(self, rows):
+        match = self.matcher
+        for r_idx, row in enumerate(rows, 1):
+            for c_idx, value in enumerate(row, 1):
+                if match(value):
+                    return r_idx, (c_idx,)
+        return None
+
+    def __repr__(self):
+        # Stable across processes: part of the result memo key (see jobs.memo_key)
+        key_columns, tokens, mode = self._config
+        return f"KeyDetector(key_columns={key_columns!r}, tokens={tokens!r}, mode={mode!r})"
+
+    def _scan(self, rows):
+        """
+        Returns (layout, whole): whole is true when the layout depends on every
+        scanned row, not just those up to the header. A fallback to the key
+        tokens only holds as long as no row names the key columns.
+        """
+        if self.key_columns:
+            found = self._find_named(rows)
+            if found:
+                return found, False
+            return self._find_token(rows) or (None, None), True
+        return self._find_token(rows) or (None, None), False
+
+    def detect(self, rows):
+        """
+        Returns (header_row_idx, key_cols): the 1-based header row and a tuple
+        of 1-based key columns, or (None, None).
+        The result only depends on the rows up to the header, so it is cached
+        under a fingerprint of exactly those rows: a repeated template is
+        recognised without testing any cell. Results that depend on every
+        scanned row (no header, or the fallback from key_column to the key
+        tokens) are cached under a fingerprint of all of them.
+        """
+        rows = rows[:HEADER_SCAN_ROWS]
+        fingerprints = []
+        fingerprint = hash(self._config)
+        with _layout_cache_lock:
+            for row in rows:
+                fingerprint = hash((fingerprint, tuple(row)))
+                fingerprints.append(fingerprint)
+                layout = _layout_cache.get(fingerprint)
+                if layout is not None:
+                    _layout_cache.move_to_end(fingerprint)
+                    return layout
+            # "No header" only holds for exactly these rows, not for longer sheets starting with them
+            end = hash((fingerprint, len(rows)))
+            layout = _layout_cache.get(end)
+            if layout is not None:
+                _layout_cache.move_to_end(end)
+                return layout
+
+        layout, whole = self._scan(rows)
+        key = fingerprints[layout[0] - 1] if layout[0] and not whole else end
+        with _layout_cache_lock:
+            _layout_cache[key] = layout
+            while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+                _layout_cache.popitem(last=False)
+        return layout
+
+
+DEFAULT_DETECTOR = KeyDetector()
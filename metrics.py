@@ -0,0 +1,269 @@
+"""
+Instrumentation of comparisons: stage timers, counters and profiles.
+
+A Metrics object collects the time spent in each stage of one comparison
+and the counts from its DiffResult. The app logs it as one JSON line,
+returns it in a Server-Timing header and adds it to a Registry, which is
+served in the Prometheus text format from /metrics.
+
+Stages:
+    upload    spooling and validating the uploads
+    hash      hashing the uploads to look up an earlier result of the pair
+    snapshot  reading or taking the snapshots of the uploads
+    open      opening both workbooks
+    load      reading whole sheets into memory (row alignment)
+    detect    finding the header row and key columns
+    index     building the key index of file 2
+    align     aligning the rows of sheets without a key column
+    compare   reading the rows of file 1 and comparing them
+    wait      waiting for the sheets compared in other processes
+    write     writing the output workbook
+    save      saving the output workbook
+    store     storing the DiffResult
+    render    rendering the results page
+"""
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger('excel_compare.metrics')
+
+# Counters taken from a DiffResult
+COUNTERS = ('sheets', 'rows', 'cells', 'diff_rows', 'diff_cells', 'key_misses', 'fast_rows')
+
+# Lines of the tracemalloc report written next to a profile
+PROFILE_TOP_LINES = 50
+
+_profile_lock = threading.Lock()
+
+
+class Metrics:
+    """
+    Stage timings (seconds) and counters of one comparison.
+    Stages are timed exclusively: entering a stage pauses the enclosing one,
+    so the stage times add up to at most the elapsed time.
+    """
+
+    __slots__ = ('timings', 'counters', 'started', '_current', '_since')
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self._current = None
+        self._since = self.started
+
+    def __bool__(self):
+        return True
+
+    def _switch(self, stage):
+        """Charge the time since the last switch to the current stage and make stage current."""
+        now = time.perf_counter()
+        if self._current is not None:
+            self.timings[self._current] = self.timings.get(self._current, 0.0) + now - self._since
+        previous, self._current, self._since = self._current, stage, now
+        return previous
+
+    @contextmanager
+    def stage(self, name):
+        previous = self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def timed(self, name, iterable):
+        """Pass the items of iterable through, charging the time spent producing them to stage name."""
+        it = iter(iterable)
+        while True:
+            previous = self._switch(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._switch(previous)
+            yield item
+
+    def merge(self, timings):
+        """Add stage timings measured elsewhere (in a worker process)."""
+        for name, seconds in timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def add_result(self, result):
+        """Count the sheets, rows, cells and differences of a DiffResult."""
+        counts = dict.fromkeys(COUNTERS, 0)
+        for sheet in result:
+            counts['sheets'] += 1
+            counts['rows'] += sheet.max_row
+            counts['cells'] += sheet.max_row * sheet.max_col
+            counts['diff_rows'] += sheet.diff_row_count
+            counts['diff_cells'] += sheet.diff_cell_count
+            counts['fast_rows'] += sheet.fast_rows
+            if sheet.in_file2:
+                # Rows whose key (or position) has no match in file 2
+                counts['key_misses'] += len(sheet.missing_rows)
+        for name, n in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value: every stage and the total, in milliseconds."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(parts)
+
+    def record(self, **fields):
+        """Dict for a structured log line: fields, the total and stage seconds, and the counters."""
+        return dict(
+            {name: value for name, value in fields.items() if value is not None},
+            seconds=round(self.elapsed(), 4),
+            stages={name: round(seconds, 4) for name, seconds in self.timings.items()},
+            counters=dict(self.counters),
+        )
+
+
+class NullMetrics:
+    """Stands in for Metrics when nothing is measured."""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def merge(self, timings):
+        pass
+
+    def add_result(self, result):
+        pass
+
+
+NO_METRICS = NullMetrics()
+
+
+def log_comparison(metrics, **fields):
+    """Log one comparison as a single JSON line."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(metrics.record(event='comparison', **fields), default=str))
+
+
+def enable_log(stream=None):
+    """Send the comparison log lines to stream (stderr by default) as they are."""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Registry:
+    """
+    Totals over every comparison observed by this process, for /metrics.
+    Each web worker keeps its own totals, so a scrape sees one worker.
+    """
+
+    PREFIX = 'excel_compare'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = {}
+        self._stage_seconds = {}
+        self._stage_count = {}
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._seconds = 0.0
+
+    def observe(self, metrics, outcome='ok'):
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+            if not metrics:
+                return
+            self._seconds += metrics.elapsed()
+            for name, seconds in metrics.timings.items():
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + seconds
+                self._stage_count[name] = self._stage_count.get(name, 0) + 1
+            for name, n in metrics.counters.items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def render(self):
+        """The totals in the Prometheus text exposition format."""
+        p = self.PREFIX
+        with self._lock:
+            lines = [
+                f"# HELP {p}_comparisons_total Comparisons by outcome.",
+                f"# TYPE {p}_comparisons_total counter",
+            ]
+            lines += [f'{p}_comparisons_total{{outcome="{outcome}"}} {n}'
+                      for outcome, n in sorted(self._outcomes.items())]
+            lines += [
+                f"# HELP {p}_seconds_total Time spent in comparisons.",
+                f"# TYPE {p}_seconds_total counter",
+                f"{p}_seconds_total {self._seconds:.6f}",
+                f"# HELP {p}_stage_seconds Time spent in each stage of the comparisons.",
+                f"# TYPE {p}_stage_seconds summary",
+            ]
+            for name in sorted(self._stage_seconds):
+                lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {self._stage_seconds[name]:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {self._stage_count[name]}')
+            for name, n in self._counters.items():
+                lines += [
+                    f"# HELP {p}_{name}_total Total {name.replace('_', ' ')} of the compared workbooks.",
+                    f"# TYPE {p}_{name}_total counter",
+                    f"{p}_{name}_total {n}",
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def _write_memory_report(path, snapshot, peak):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"peak traced memory: {peak / (1 << 20):.2f} MB\n")
+        f.write(f"top {PROFILE_TOP_LINES} allocation sites still held at the end:\n")
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_LINES]:
+            f.write(f"{stat}\n")
+
+
+@contextmanager
+def profiled(directory, name):
+    """
+    Run the block under cProfile and tracemalloc, then write
+    directory/name.prof (load it with pstats or snakeviz) and
+    directory/name.memory.txt. Yields the .prof path, or None when another
+    profile is running: tracemalloc traces the whole process, so only one
+    block is profiled at a time. Only the calling thread is profiled.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        prof_path = os.path.join(directory, name + '.prof')
+        tracing = not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield prof_path
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+            profiler.dump_stats(prof_path)
+            _write_memory_report(os.path.join(directory, name + '.memory.txt'), snapshot, peak)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,68 @@
+"""
+Partial comparisons: the sheets and columns to compare.
+
+A Selection names the sheets of file 1 to compare and, by their header, the
+columns to compare or to leave out. Sheets that aren't selected are never
+opened. Columns that aren't selected are left empty on both sides: the XML
+reader doesn't convert their cells at all, other readers drop their values
+as soon as a row is read, so they are neither compared, kept in the result
+nor written to the output. The key columns of a sheet are always compared.
+"""
+
+
+class UnknownSheet(ValueError):
+    pass
+
+
+def _names(value):
+    """Names given as a comma-separated string or a sequence, without blanks."""
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(name.strip() for name in value or () if name and name.strip())
+
+
+class Selection:
+    """
+    sheets names the sheets of file 1 to compare; columns the headers of the
+    columns to compare, or ignore_columns those to leave out. Each is a
+    sequence or a comma-separated string; empty means all. Headers match
+    ignoring surrounding whitespace and case, like KeyDetector's key_column.
+    """
+
+    def __init__(self, sheets=None, columns=None, ignore_columns=None):
+        self.sheets = _names(sheets)
+        self.columns = tuple(name.casefold() for name in _names(columns))
+        self.ignore_columns = tuple(name.casefold() for name in _names(ignore_columns))
+
+    def __bool__(self):
+        return bool(self.sheets or self.columns or self.ignore_columns)
+
+    def __repr__(self):
+        return (f"Selection(sheets={self.sheets!r}, columns={self.columns!r}, "
+                f"ignore_columns={self.ignore_columns!r})")
+
+    def sheet_names(self, names):
+        """The selected sheets among names, in their order. Raises UnknownSheet for a sheet not in names."""
+        if not self.sheets:
+            return list(names)
+        missing = [name for name in self.sheets if name not in names]
+        if missing:
+            raise UnknownSheet(f"No sheet named {', '.join(map(repr, missing))} in file 1")
+        return [name for name in names if name in self.sheets]
+
+    def column_set(self, header, key_cols, width):
+        """
+        Set of 1-based columns to compare of a sheet width columns wide with
+        the header row values header, or None to compare them all. Sheets
+        without a detected header (header None) are compared whole.
+        """
+        if header is None or not (self.columns or self.ignore_columns):
+            return None
+        names = [str(value).strip().casefold() if value is not None else None for value in header]
+        if self.columns:
+            keep = {c for c, name in enumerate(names, 1) if name in self.columns}
+        else:
+            keep = set(range(1, width + 1))
+        keep.difference_update(c for c, name in enumerate(names, 1) if name in self.ignore_columns)
+        keep.update(key_cols or ())
+        return None if len(keep) >= width else keep
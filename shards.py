@@ -0,0 +1,182 @@
+"""
+Row-range sharding of one large sheet over worker processes.
+
+Comparing sheets in parallel doesn't help a workbook that is one huge sheet.
+Here the rows of file 1 and the key index of file 2 are built in memory
+once, then the data rows of file 1 are split into row ranges compared in
+forked worker processes. The workers see the rows and the index copy-on-
+write, so nothing is pickled on the way in; each returns only its differing
+rows, and the parent merges the shards back in row order.
+
+Two kinds of rows stay with the parent: rows up to the header, which match
+by position, and rows whose key is duplicated in file 2, since pairing the
+n-th occurrence of a key needs every earlier row of file 1. The latter are
+matched in order while the shards are merged.
+
+Needs the fork start method and a process running no other threads: a
+child forked while another thread holds a lock (of logging, the metrics, a
+job pool) would wait for it forever. Elsewhere, in a threaded web worker or
+job pool, for a sheet missing from file 2 and for sheets shorter than
+SHARD_MIN_ROWS, engine.compare_sheet is used.
+"""
+import gc
+import multiprocessing
+import threading
+from array import array
+from diff_result import SheetDiff
+from engine import (compare_sheet, sheet_dimensions, sheet_rows, build_key_index, diff_columns, column_kernels,
+                    head_width, read_layout, PositionalRows)
+from layout import DEFAULT_DETECTOR
+from key_index import DUPLICATE, key_getter
+from alignment import match_rows
+from metrics import NO_METRICS
+
+# Sheets with fewer rows are compared in-process; forking doesn't pay for them
+SHARD_MIN_ROWS = 50000
+
+# Row ranges per worker, so one slow range doesn't hold the others up
+SHARDS_PER_WORKER = 4
+
+# What the forked workers compare, set by the parent for the lifetime of its pool
+# (the pool forks replacement workers too): (rows1, rows2, get_key, index, kernels)
+# with rows2 used when index is None
+_shared = None
+
+
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def single_threaded():
+    """Whether no thread but this one is running, so a forked child can't inherit a held lock."""
+    return threading.active_count() == 1
+
+
+def split_rows(start, stop, count):
+    """count (lo, hi) ranges of about equal length covering start..stop-1."""
+    count = max(min(count, stop - start), 1)
+    size, extra = divmod(stop - start, count)
+    bounds = []
+    for n in range(count):
+        hi = start + size + (n < extra)
+        bounds.append((start, hi))
+        start = hi
+    return bounds
+
+
+def _compare_shard(bounds):
+    """
+    Pool task: compare the rows lo..hi-1 (0-based) of file 1.
+    Returns (diffs, deferred, fast_rows): diffs holds (row_idx, diff_cols) of
+    the differing rows, diff_cols being None for rows not in file 2; deferred
+    the rows whose key is duplicated in file 2, left to the parent.
+    """
+    lo, hi = bounds
+    rows1, rows2, get_key, index, kernels = _shared
+    diffs = []
+    deferred = array('I')
+    fast_rows = 0
+    for i in range(lo, hi):
+        values = rows1[i]
+        if index is not None:
+            key = get_key(values)
+            row2 = None if key is None else index.lookup(key)
+            if row2 is DUPLICATE:
+                deferred.append(i + 1)
+                continue
+        else:
+            row2 = rows2[i]
+        if row2 is None:
+            diffs.append((i + 1, None))
+        elif values == row2:
+            fast_rows += 1
+        else:
+            diff_cols = diff_columns(values, row2, kernels)
+            if diff_cols:
+                diffs.append((i + 1, diff_cols))
+    return diffs, deferred, fast_rows
+
+
+def compare_sheet_sharded(sheet_name, ws1, ws2, detector=DEFAULT_DETECTOR, normalizer=None, metrics=NO_METRICS,
+                          alignment='position', tolerance=None, selection=None, workers=2):
+    """
+    Same contract as engine.compare_sheet; the rows of file 1 are compared
+    in workers processes. Both sheets are held in memory (file 2 as its key
+    index when it has a key column).
+    """
+    dims1 = sheet_dimensions(ws1)
+    if ws2 is None or workers < 2 or dims1[0] < SHARD_MIN_ROWS or not can_fork() or not single_threaded():
+        return compare_sheet(sheet_name, ws1, ws2, detector, normalizer, metrics, alignment, tolerance, selection)
+
+    with metrics.stage('detect'):
+        header_row_idx, key_cols, columns, head, rest = read_layout(ws1, dims1, detector, selection)
+        kernels = column_kernels(tolerance, head, header_row_idx, head_width(head, dims1))
+    with metrics.stage('load'):
+        rows1 = head + list(rest)
+    sheet = SheetDiff(sheet_name, header_row_idx, key_cols, columns=columns)
+
+    dims2 = sheet_dimensions(ws2)
+    get_key = index = positional = rows2 = None
+    if key_cols:
+        get_key = key_getter(key_cols, normalizer)
+        with metrics.stage('index'):
+            index = build_key_index(ws2, dims2, header_row_idx, get_key, columns)
+    if index:
+        # Rows up to the header match by position, the rest by key
+        positional = PositionalRows(ws2, dims2, columns)
+        start = header_row_idx
+    else:
+        index = None
+        start = 0
+        with metrics.stage('load'):
+            rows2 = list(sheet_rows(ws2, dims2, columns=columns))
+        if not key_cols and alignment == 'diff':
+            with metrics.stage('align'):
+                rows2 = [rows2[j] if j >= 0 else None for j in match_rows(rows1, rows2)]
+        else:
+            # Rows past the end of file 2 match empty cells, as in compare_sheet
+            rows2 += [(None,) * max([dims2[1]] + [len(row) for row in rows2[-1:]])] * (len(rows1) - len(rows2))
+
+    def rows():
+        global _shared
+        for row_idx in range(1, start + 1):
+            values, row2 = rows1[row_idx - 1], positional.get(row_idx)
+            if values == row2:
+                sheet.fast_rows += 1
+                yield row_idx, values, ()
+            else:
+                yield row_idx, values, diff_columns(values, row2, kernels)
+
+        bounds = split_rows(start, len(rows1), workers * SHARDS_PER_WORKER)
+        _shared = (rows1, rows2, get_key, index, kernels)
+        try:
+            # Frozen objects are left alone by the workers' garbage collector, which
+            # would otherwise write to (and so copy) every page of the shared rows
+            gc.freeze()
+            try:
+                pool = multiprocessing.get_context('fork').Pool(min(workers, len(bounds)))
+            finally:
+                gc.unfreeze()
+            with pool:
+                for (lo, hi), (diffs, deferred, fast_rows) in zip(bounds, pool.imap(_compare_shard, bounds)):
+                    sheet.fast_rows += fast_rows
+                    diffs = dict(diffs)
+                    deferred = set(deferred)
+                    for row_idx in range(lo + 1, hi + 1):
+                        values = rows1[row_idx - 1]
+                        if row_idx in deferred:
+                            row2 = index.match(get_key(values))
+                            if row2 is None:
+                                diff_cols = None
+                            elif values == row2:
+                                diff_cols = ()
+                                sheet.fast_rows += 1
+                            else:
+                                diff_cols = diff_columns(values, row2, kernels)
+                        else:
+                            diff_cols = diffs.get(row_idx, ())
+                        yield row_idx, values, diff_cols
+        finally:
+            _shared = None
+
+    return sheet, rows()
@@ -0,0 +1,180 @@
+"""
+Parsed workbook snapshots.
+
+Parsing the sheet XML is by far the slowest part of a comparison, and the
+same file 1 is often uploaded over and over. A snapshot holds the parsed,
+padded rows of every sheet in a compact binary file, so a workbook is only
+parsed once; later comparisons read the snapshot instead.
+
+Layout: MAGIC, then the rows of each sheet as chunks of CHUNK_ROWS rows,
+then an index [(name, max_row, max_col, chunk offsets)], then the offset of
+that index as 8 bytes. Chunks and the index are one line of JSON each;
+dates, times and durations are written as {type: text} objects, which no
+cell value can be. Rows are read a chunk at a time, so a snapshot is never
+loaded into memory as a whole.
+
+Snapshots are only read where they were written (see jobs.open_snapshot):
+nothing decides from the content of a file that it is a snapshot, and
+reading one never runs code from it.
+"""
+import datetime
+import os
+import hashlib
+import json
+import struct
+from itertools import islice
+
+MAGIC = b'XLSNAP2\n'
+CHUNK_ROWS = 1000
+SNAPSHOT_NAME = 'snapshot.bin'
+
+_TRAILER = struct.Struct('<Q')
+
+# Cell value types JSON has no form for, by the key of their {key: text} objects
+_TYPES = {
+    'datetime': datetime.datetime.fromisoformat,
+    'date': datetime.date.fromisoformat,
+    'time': datetime.time.fromisoformat,
+    'timedelta': lambda text: datetime.timedelta(microseconds=int(text)),
+}
+
+
+def file_digest(source):
+    """SHA-256 hex digest of a path or seekable binary file, which is left at the start."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def _encode_value(value):
+    """JSON form of a cell value json doesn't handle itself."""
+    # datetime before date: it is a date too
+    if isinstance(value, datetime.datetime):
+        return {'datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'date': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'time': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {'timedelta': str(value // datetime.timedelta(microseconds=1))}
+    raise TypeError(f"Can't keep a {type(value).__name__} in a snapshot")
+
+
+def _decode_value(obj):
+    (kind, text), = obj.items()
+    return _TYPES[kind](text)
+
+
+def _dump_line(f, obj):
+    f.write(json.dumps(obj, default=_encode_value, separators=(',', ':')).encode('ascii'))
+    f.write(b'\n')
+
+
+def _load_line(f):
+    return json.loads(f.readline(), object_hook=_decode_value)
+
+
+def write_snapshot(f, sheets):
+    """
+    Write a snapshot to the binary file f.
+    sheets yields (name, rows) with rows yielding the value tuples of the
+    sheet, like engine.sheet_rows; the snapshot is sized by the rows written.
+    """
+    f.write(MAGIC)
+    index = []
+    for name, rows in sheets:
+        offsets = []
+        max_row = max_col = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, CHUNK_ROWS))
+            if not chunk:
+                break
+            offsets.append(f.tell())
+            _dump_line(f, chunk)
+            max_row += len(chunk)
+            max_col = max(max_col, max(map(len, chunk)))
+        index.append((name, max_row, max_col, offsets))
+    trailer = f.tell()
+    _dump_line(f, index)
+    f.write(_TRAILER.pack(trailer))
+
+
+class SnapshotSheet:
+    """Worksheet of a snapshot, with the parts of openpyxl's read-only worksheet the engine uses."""
+
+    def __init__(self, f, title, max_row, max_col, offsets):
+        self._f = f
+        self.title = title
+        self.max_row = max_row
+        self.max_column = max_col
+        self._offsets = offsets
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        if not values_only:
+            raise ValueError("Snapshots only hold cell values")
+        max_row = self.max_row if max_row is None else min(max_row, self.max_row)
+        first = (min_row - 1) // CHUNK_ROWS
+        row_idx = first * CHUNK_ROWS
+        f = self._f
+        for offset in self._offsets[first:]:
+            if row_idx >= max_row:
+                return
+            # Seek for every chunk: other iterators may share the file
+            f.seek(offset)
+            chunk = _load_line(f)
+            start = max(min_row - 1 - row_idx, 0)
+            stop = min(len(chunk), max_row - row_idx)
+            for row in islice(chunk, start, stop):
+                yield tuple(row if max_col is None or max_col >= len(row) else row[:max_col])
+            row_idx += len(chunk)
+
+
+class SnapshotWorkbook:
+    """
+    Snapshot opened for reading, standing in for openpyxl's read-only workbook.
+    source is a path or a seekable binary file, which close() leaves open.
+    Raises ValueError if it doesn't hold a snapshot of this format.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, (str, os.PathLike)):
+            self.file = open(source, 'rb')
+            self._owned = True
+        else:
+            self.file = source
+            self._owned = False
+        f = self.file
+        try:
+            f.seek(0)
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a snapshot")
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            f.seek(_TRAILER.unpack(f.read(_TRAILER.size))[0])
+            self._sheets = {
+                name: SnapshotSheet(f, name, max_row, max_col, offsets)
+                for name, max_row, max_col, offsets in _load_line(f)
+            }
+        except Exception:
+            self.close()
+            raise
+        self.sheetnames = list(self._sheets)
+
+    def __getitem__(self, name):
+        return self._sheets[name]
+
+    @property
+    def active(self):
+        return self._sheets[self.sheetnames[0]]
+
+    def close(self):
+        if self._owned:
+            self.file.close()
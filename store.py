@@ -0,0 +1,262 @@
+import io
+import json
+import os
+import re
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import pickle
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Result ids come from URLs; only accept the characters of a uuid4
+_KEY_RE = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+# Entry names used for the artifacts of a comparison
+OUTPUT_NAME = 'output.xlsx'
+RESULT_NAME = 'result.pickle'
+
+
+def valid_key(key):
+    return bool(_KEY_RE.match(key or ''))
+
+
+class ResultStore(ABC):
+    """
+    Keeps the artifacts of a comparison (output workbook, pickled DiffResult, ...)
+    under a result id. Each id holds a few named entries.
+    Entries are evicted once they are older than ttl seconds since their last
+    access, or least recently used first when the store grows past max_bytes.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @abstractmethod
+    @contextmanager
+    def writer(self, key, name):
+        """Yield a writable binary file; its content is stored once the block exits without error."""
+
+    @abstractmethod
+    def open(self, key, name):
+        """Open an entry for reading, or return None if it doesn't exist (or expired)."""
+
+    @abstractmethod
+    def remove(self, key, name):
+        """Drop a single entry of a result id."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drop a result id with all its entries."""
+
+    @abstractmethod
+    def evict(self):
+        """Drop the entries past their ttl, then the least recently used ones over max_bytes."""
+
+    def exists(self, key, name):
+        """Whether an entry is still there; like open, this counts as an access."""
+        f = self.open(key, name)
+        if f is None:
+            return False
+        f.close()
+        return True
+
+    def put(self, key, name, data):
+        with self.writer(key, name) as f:
+            f.write(data)
+
+    def put_object(self, key, name, obj):
+        with self.writer(key, name) as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def get_object(self, key, name):
+        f = self.open(key, name)
+        if f is None:
+            return None
+        with f:
+            return pickle.load(f)
+
+    def put_json(self, key, name, obj):
+        self.put(key, name, json.dumps(obj).encode('utf-8'))
+
+    def get_json(self, key, name):
+        """Plain data (job status, memos) is kept as JSON, so reading it back never unpickles anything."""
+        f = self.open(key, name)
+        if f is None:
+            return None
+        with f:
+            return json.load(f)
+
+
+class MemoryStore(ResultStore):
+    """Per-process store. Only correct with a single worker process."""
+
+    def __init__(self, max_bytes, ttl):
+        super().__init__(max_bytes, ttl)
+        self._entries = OrderedDict() # key -> (last access, {name: bytes})
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def writer(self, key, name):
+        if not valid_key(key):
+            raise ValueError(f"Invalid result id: {key!r}")
+        buf = io.BytesIO()
+        yield buf
+        with self._lock:
+            _, files = self._entries.pop(key, (None, {}))
+            files[name] = buf.getvalue()
+            self._entries[key] = (time.time(), files)
+        self.evict()
+
+    def open(self, key, name):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl or name not in entry[1]:
+                return None
+            self._entries[key] = (time.time(), entry[1])
+            self._entries.move_to_end(key)
+            return io.BytesIO(entry[1][name])
+
+    def remove(self, key, name):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1].pop(name, None)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict(self):
+        with self._lock:
+            now = time.time()
+            total = 0
+            # Newest first, so whatever is left over the cap is least recently used
+            for key in reversed(list(self._entries)):
+                accessed, files = self._entries[key]
+                size = sum(len(data) for data in files.values())
+                if now - accessed > self.ttl or total + size > self.max_bytes:
+                    del self._entries[key]
+                else:
+                    total += size
+
+
+class DiskStore(ResultStore):
+    """
+    Store backed by a directory, shared by every worker process that points at it.
+    Layout: <directory>/<key>/<name>. Entries are written to temp files in the
+    shared directory and moved into place atomically, so other workers never see
+    a partial file. The mtime of <key>/ marks its last access.
+    Results are unpickled from the directory, so it must be private to this
+    user: it is created with mode 0o700, and an existing directory owned by
+    another user or writable by others is refused (see private_directory).
+    """
+
+    def __init__(self, directory, max_bytes, ttl):
+        super().__init__(max_bytes, ttl)
+        self.directory = directory
+        private_directory(directory)
+
+    def _entry_dir(self, key):
+        if not valid_key(key):
+            return None
+        return os.path.join(self.directory, key)
+
+    @contextmanager
+    def writer(self, key, name):
+        entry_dir = self._entry_dir(key)
+        if entry_dir is None:
+            raise ValueError(f"Invalid result id: {key!r}")
+        os.makedirs(entry_dir, exist_ok=True)
+
+        tmp = tempfile.NamedTemporaryFile(prefix='.tmp-', dir=entry_dir, delete=False)
+        try:
+            with tmp:
+                yield tmp
+            os.replace(tmp.name, os.path.join(entry_dir, name))
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+        os.utime(entry_dir)
+        self.evict()
+
+    def open(self, key, name):
+        entry_dir = self._entry_dir(key)
+        if entry_dir is None:
+            return None
+        try:
+            if time.time() - os.stat(entry_dir).st_mtime > self.ttl:
+                return None
+            f = open(os.path.join(entry_dir, name), 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            pass # Evicted by another worker; the open file stays readable
+        return f
+
+    def remove(self, key, name):
+        entry_dir = self._entry_dir(key)
+        if entry_dir is not None:
+            try:
+                os.remove(os.path.join(entry_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def delete(self, key):
+        entry_dir = self._entry_dir(key)
+        if entry_dir is not None:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def _entries(self):
+        """(last access, size, key) for every entry in the directory."""
+        entries = []
+        for dir_entry in os.scandir(self.directory):
+            if not dir_entry.is_dir() or not valid_key(dir_entry.name):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(dir_entry.path) if f.is_file())
+                entries.append((dir_entry.stat().st_mtime, size, dir_entry.name))
+            except FileNotFoundError:
+                pass # Removed by another worker meanwhile
+        return entries
+
+    def evict(self):
+        now = time.time()
+        total = 0
+        for accessed, size, key in sorted(self._entries(), reverse=True):
+            if now - accessed > self.ttl or total + size > self.max_bytes:
+                self.delete(key)
+            else:
+                total += size
+
+
+def private_directory(directory):
+    """
+    Create directory with mode 0o700, or check that an existing one is a real
+    directory owned by this user that neither its group nor others can write.
+    Raises PermissionError otherwise.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"Result store {directory!r} is not a directory")
+    if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+        raise PermissionError(f"Result store {directory!r} is owned by another user; set RESULT_STORE_DIR")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Result store {directory!r} is writable by other users; set RESULT_STORE_DIR")
+
+
+def make_store(config):
+    """Build the result store described by the app config."""
+    max_bytes = config['RESULT_STORE_MAX_BYTES']
+    ttl = config['RESULT_STORE_TTL']
+    if config['RESULT_STORE'] == 'memory':
+        return MemoryStore(max_bytes, ttl)
+    return DiskStore(config['RESULT_STORE_DIR'], max_bytes, ttl)
@@ -0,0 +1,63 @@
+import os
+import unittest
+from openpyxl import Workbook
+from alignment import match_rows
+from engine import compare_workbooks
+
+class TestRowAlignment(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_align_1.xlsx'
+        self.file2 = 'test_align_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_match_rows(self):
+        rows1 = [('a', 1), ('b', 2), ('c', 3), ('d', 4), ('e', 5)]
+        # Inserted at the top, 'b' changed, 'd' moved to the end, 'c' deleted
+        rows2 = [('new', 0), ('a', 1), ('b', 9), ('e', 5), ('d', 4)]
+        self.assertEqual(match_rows(rows1, rows2), [1, 2, -1, 4, 3])
+
+        # Duplicate rows pair up in order
+        self.assertEqual(match_rows([('x',), ('x',), ('y',)], [('y',), ('x',), ('x',)]), [1, 2, 0])
+        self.assertEqual(match_rows([], [('x',)]), [])
+
+    def test_edited_rows(self):
+        rows1 = [(i, f'item {i}', i) for i in range(300)]
+        # Every row edited: paired by position
+        edited = [(i, f'item {i}', -i - 1) for i in range(300)]
+        self.assertEqual(match_rows(rows1, edited), list(range(300)))
+        # A row inserted among them shifts the rest by one
+        inserted = edited[:150] + [('new', 'new', 'new')] + edited[150:]
+        self.assertEqual(match_rows(rows1, inserted), list(range(150)) + list(range(151, 301)))
+
+    def test_keyless_sheet(self):
+        # No header token: rows used to be matched by position only
+        rows = [[f'item {i}', i, i * 2] for i in range(1, 21)]
+        changed = [list(row) for row in rows]
+        changed[9][2] = -1
+        self.create_excel(self.file1, rows)
+        self.create_excel(self.file2, [['inserted', 0, 0]] + changed)
+
+        positional = compare_workbooks(self.file1, self.file2)
+        self.assertEqual(positional.diff_row_count, 20)
+
+        result = compare_workbooks(self.file1, self.file2, alignment='diff')
+        sheet = result['Sheet']
+        # Only the changed row differs; the inserted row isn't in file 1
+        self.assertEqual(list(sheet.iter_diff_rows()), [(10, (3,))])
+
+        with self.assertRaises(ValueError):
+            compare_workbooks(self.file1, self.file2, alignment='fuzzy')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from openpyxl import Workbook, load_workbook
+from batch import main, SUMMARY_NAME
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dir1 = os.path.join(self.directory, 'old')
+        self.dir2 = os.path.join(self.directory, 'new')
+        self.out = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def create_excel(self, filename, rows):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def summary(self):
+        with open(os.path.join(self.out, SUMMARY_NAME), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_directories(self):
+        header = ['ID', 'Value']
+        self.create_excel(os.path.join(self.dir1, 'same.xlsx'), [header, [1, 10]])
+        self.create_excel(os.path.join(self.dir2, 'same.xlsx'), [header, [1, 10]])
+        self.create_excel(os.path.join(self.dir1, 'sub', 'changed.xlsx'), [header, [1, 10], [2, 20]])
+        self.create_excel(os.path.join(self.dir2, 'sub', 'changed.xlsx'), [header, [2, 21], [1, 10]])
+        self.create_excel(os.path.join(self.dir1, 'only_old.xlsx'), [header])
+
+        status = main([self.dir1, self.dir2, '-o', self.out, '-j', '2'])
+        self.assertEqual(status, 1)
+
+        summary = self.summary()
+        self.assertEqual((summary['pairs'], summary['differing'], summary['failed']), (2, 1, 0))
+        self.assertEqual(summary['unpaired'], [{'path': 'only_old.xlsx', 'only_in': 'file1'}])
+        results = {entry['name']: entry for entry in summary['results']}
+        self.assertEqual(results['same']['diff_rows'], 0)
+        changed = results[os.path.join('sub', 'changed')]
+        self.assertEqual(changed['diff_rows'], 1)
+        self.assertEqual(changed['sheets'][0]['changed_rows'], 1)
+
+        ws = load_workbook(changed['output']).active
+        self.assertEqual(ws.cell(row=3, column=2).font.color.rgb, 'FFFF0000')
+
+    def test_manifest(self):
+        self.create_excel(os.path.join(self.dir1, 'a.xlsx'), [['Code', 'Qty'], ['x', 1], ['y', 2]])
+        self.create_excel(os.path.join(self.dir2, 'a.xlsx'), [['Code', 'Qty'], ['y', 2], ['x', 1]])
+        manifest = os.path.join(self.directory, 'pairs.csv')
+        with open(manifest, 'w', encoding='utf-8') as f:
+            f.write('file1,file2,name\n')
+            f.write('old/a.xlsx,new/a.xlsx,keyed\n')
+            f.write('old/a.xlsx,new/missing.xlsx,\n')
+
+        status = main(['--manifest', manifest, '-o', self.out, '-j', '1', '--key-column', 'Code'])
+        self.assertEqual(status, 2)
+
+        keyed, broken = self.summary()['results']
+        self.assertEqual((keyed['name'], keyed['status'], keyed['diff_rows']), ('keyed', 'ok', 0))
+        self.assertEqual((broken['name'], broken['status'], broken['output']), ('a', 'error', None))
+        self.assertFalse(os.path.exists(os.path.join(self.out, 'a_compare.xlsx')))
+
+    def usage_error(self, argv):
+        with self.assertRaises(SystemExit) as cm, contextlib.redirect_stderr(io.StringIO()) as stderr:
+            main(argv)
+        self.assertEqual(cm.exception.code, 2)
+        return stderr.getvalue()
+
+    def test_manifest_name_is_not_a_path(self):
+        self.create_excel(os.path.join(self.dir1, 'a.xlsx'), [['ID'], [1]])
+        manifest = os.path.join(self.directory, 'pairs.csv')
+        for name in ['../escaped', os.path.join(self.directory, 'escaped'), 'sub/name', '..']:
+            with open(manifest, 'w', encoding='utf-8') as f:
+                f.write('file1,file2,name\n')
+                f.write(f'old/a.xlsx,old/a.xlsx,{name}\n')
+            self.assertIn("can't contain path separators", self.usage_error(['--manifest', manifest, '-o', self.out]))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'escaped_compare.xlsx')))
+        self.assertFalse(os.path.exists(self.out))
+
+    def test_negative_tolerance(self):
+        self.create_excel(os.path.join(self.dir1, 'a.xlsx'), [['ID'], [1]])
+        self.create_excel(os.path.join(self.dir2, 'a.xlsx'), [['ID'], [1]])
+        self.assertIn("can't be negative", self.usage_error([self.dir1, self.dir2, '-o', self.out, '--abs-tol', '-1']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+from openpyxl import load_workbook
+from bench import generate_pair, run_benchmark, compare_runs
+from engine import compare_workbooks
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file1 = os.path.join(self.directory, 'a.xlsx')
+        self.file2 = os.path.join(self.directory, 'b.xlsx')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_generator_is_seeded(self):
+        config = dict(rows=300, cols=6, sheets=2, diff_ratio=0.1, shuffle_ratio=0.2,
+                      missing_ratio=0.0, pre_header_rows=2, seed=4)
+        changed = generate_pair(self.file1, self.file2, **config)
+        result = compare_workbooks(self.file1, self.file2)
+        self.assertEqual([sheet.header_row for sheet in result], [3, 3])
+        # Rows are matched by ID despite the shuffle, so only the changed ones differ
+        self.assertEqual([sheet.diff_row_count for sheet in result], changed)
+
+        first = self.values(self.file2)
+        self.assertEqual(generate_pair(self.file1, self.file2, **config), changed)
+        self.assertEqual(self.values(self.file2), first)
+
+    def test_every_change_differs(self):
+        # Text and date changes could draw the old value again; each changed row must still differ
+        changed = generate_pair(self.file1, self.file2, rows=2000, cols=4, diff_ratio=1.0, shuffle_ratio=0.0,
+                                missing_ratio=0.0, pre_header_rows=0, seed=7)
+        self.assertEqual(changed, [2000])
+        self.assertEqual(compare_workbooks(self.file1, self.file2).diff_row_count, 2000)
+
+    def values(self, filename):
+        wb = load_workbook(filename, read_only=True)
+        try:
+            return [list(ws.iter_rows(values_only=True)) for ws in wb]
+        finally:
+            wb.close()
+
+    def test_run_and_compare(self):
+        config = dict(rows=50, cols=4, sheets=1, diff_ratio=0.1, shuffle_ratio=0.1,
+                      missing_ratio=0.0, pre_header_rows=0, duplicate_ratio=0.0, seed=1)
+        stages = {'compare', 'export_jsonl', 'render_view', 'page_rows'}
+        results = run_benchmark(config, stages=stages)
+        self.assertEqual(set(results['stages']), stages)
+        self.assertIn('peak_mb', results['stages']['compare'])
+
+        slower = dict(results, stages={'compare': {'seconds': results['stages']['compare']['seconds'] * 2 + 0.1}})
+        lines, regressed = compare_runs(results, slower)
+        self.assertTrue(regressed)
+        self.assertIn('slower', lines[1])
+        self.assertFalse(compare_runs(results, results)[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import unittest
+from openpyxl import Workbook
+from views import result_to_view_data
+from engine import compare_workbooks, file1_rows
+
+class TestDiffResult(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_result_1.xlsx'
+        self.file2 = 'test_result_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def test_result(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Data'
+        for row in [['ID', 'Name', 'Value'], [1, 'A', 100], [2, 'B', 200], [3, 'C', 300]]:
+            ws.append(row)
+        wb.create_sheet('Extra').append(['x'])
+        wb.save(self.file1)
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Data'
+        for row in [['ID', 'Name', 'Value'], [2, 'B', 201], [1, 'A', 100]]:
+            ws.append(row)
+        wb.save(self.file2)
+
+        result = compare_workbooks(self.file1, self.file2)
+        self.assertEqual([s.name for s in result], ['Data', 'Extra'])
+
+        sheet = result['Data']
+        self.assertEqual((sheet.header_row, sheet.key_col), (1, 1))
+        self.assertEqual((sheet.max_row, sheet.max_col), (4, 3))
+        self.assertEqual(list(sheet.iter_diff_rows()), [(3, (3,)), (4, None)])
+        self.assertEqual(sheet.diff_cell_count, 4)
+
+        # Only the header and differing rows keep their values for the view
+        self.assertEqual(sorted(sheet.row_values), [1, 3, 4])
+        self.assertEqual([row[0] for row in sheet.iter_view_rows()], [1, 3, 4])
+
+        # Sheet missing from file 2: every row is missing, and only counted
+        extra = result['Extra']
+        self.assertFalse(extra.in_file2)
+        self.assertEqual(list(extra.iter_diff_rows()), [(1, None)])
+        self.assertEqual((len(extra.missing_rows), extra.row_values), (0, {}))
+        self.assertEqual(result.diff_row_count, 3)
+        with self.assertRaises(ValueError):
+            list(extra.iter_view_rows())
+
+        view = result_to_view_data(result, lambda sheet: file1_rows(self.file1, sheet))
+        self.assertEqual(view[1]['rows'], [[{'value': 'x', 'class': ' text-red-600 font-bold'}]])
+        self.assertEqual(len(view[0]['rows']), 3)
+        self.assertEqual(view[0]['rows'][1][2], {'value': 200, 'class': ' text-red-600 font-bold'})
+        self.assertEqual(view[0]['rows'][1][0]['class'], ' bg-yellow-100')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import unittest
+from openpyxl import Workbook
+from app import app
+from engine import compare_workbooks
+from events import iter_events
+
+class TestDiffEvents(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_events_1.xlsx'
+        self.file2 = 'test_events_2.xlsx'
+        header = ['ID', 'Value']
+        wb = Workbook()
+        for row in [header, [1, 10], [2, 20], [3, 30]]:
+            wb.active.append(row)
+        wb.create_sheet('Only1').append(['x'])
+        wb.save(self.file1)
+        wb = Workbook()
+        for row in [header, [1, 10], [2, 21]]:
+            wb.active.append(row)
+        wb.save(self.file2)
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def test_iter_events(self):
+        events = list(iter_events(self.file1, self.file2))
+        self.assertEqual(events, [
+            {'event': 'sheet', 'sheet': 'Sheet', 'in_file2': True},
+            {'event': 'header', 'sheet': 'Sheet', 'row': 1, 'key_cols': [1]},
+            {'event': 'changed', 'sheet': 'Sheet', 'row': 3, 'diff_cols': [2], 'values': (2, 20)},
+            {'event': 'missing', 'sheet': 'Sheet', 'row': 4, 'values': (3, 30)},
+            {'event': 'sheet_done', 'sheet': 'Sheet', 'rows': 4, 'diff_rows': 2, 'fast_rows': 2},
+            {'event': 'sheet', 'sheet': 'Only1', 'in_file2': False},
+            {'event': 'missing', 'sheet': 'Only1', 'row': 1, 'values': ('x',)},
+            {'event': 'sheet_done', 'sheet': 'Only1', 'rows': 1, 'diff_rows': 1, 'fast_rows': 0},
+            {'event': 'done', 'sheets': 2, 'diff_rows': 3},
+        ])
+        # Same differences as the stored result
+        result = compare_workbooks(self.file1, self.file2)
+        self.assertEqual(result.diff_row_count, events[-1]['diff_rows'])
+
+        # Stopping early is fine: the workbooks are closed with the generator
+        events = iter_events(self.file1, self.file2)
+        self.assertEqual(next(events)['event'], 'sheet')
+        events.close()
+
+        with self.assertRaises(ValueError):
+            iter_events(self.file1, self.file2, alignment='fuzzy').send(None)
+
+    def post(self, form=None, **kwargs):
+        client = app.test_client()
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            data = dict(form or {}, file1=(f1, self.file1), file2=(f2, self.file2))
+            return client.post('/compare/stream', data=data, **kwargs)
+
+    def test_ndjson_endpoint(self):
+        resp = self.post()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([e['event'] for e in events][:5], ['sheet', 'header', 'changed', 'missing', 'sheet_done'])
+        self.assertEqual(events[2]['values'], [2, 20])
+        self.assertEqual(events[-1], {'event': 'done', 'sheets': 2, 'diff_rows': 3})
+
+    def test_sse_endpoint(self):
+        resp = self.post(headers={'Accept': 'text/event-stream'})
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        messages = resp.get_data(as_text=True).split('\n\n')
+        self.assertEqual(messages[0].split('\n')[0], 'event: sheet')
+        self.assertTrue(messages[-2].startswith('event: done\ndata: {'))
+
+        self.assertEqual(self.post(query_string={'format': 'xml'}).status_code, 400)
+
+    def test_unknown_sheet(self):
+        # Rejected before the stream starts, like /compare does
+        resp = self.post(form={'sheets': 'Missing'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("No sheet named 'Missing'", resp.get_data(as_text=True))
+
+        resp = self.post(form={'sheets': 'Only1'})
+        self.assertEqual(resp.status_code, 200)
+        events = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(events[-1], {'event': 'done', 'sheets': 1, 'diff_rows': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+import os
+import unittest
+from openpyxl import Workbook, load_workbook
+import app as app_module
+from engine import compare_workbooks
+from exports import iter_csv, iter_jsonl
+from store import MemoryStore
+
+class TestExports(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_export_1.xlsx'
+        self.file2 = 'test_export_2.xlsx'
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header, [1, 10], [2, 20], [3, 30], [4, 40]])
+        self.create_excel(self.file2, [header, [1, 10], [2, 21], [3, 30]])
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_diff_only_workbook(self):
+        stream = io.BytesIO()
+        compare_workbooks(self.file1, self.file2, stream, output_mode='diff')
+        ws = load_workbook(stream).active
+        # Header and the two differing rows, led by their row numbers in file 1
+        self.assertEqual([[c.value for c in row] for row in ws.iter_rows()],
+                         [['列號', 'ID', 'Value'], [3, 2, 20], [5, 4, 40]])
+        self.assertEqual(ws['B1'].fill.start_color.rgb, 'FF00FF00')
+        self.assertEqual(ws['B2'].fill.start_color.rgb, 'FFFFFF00')
+        self.assertNotEqual(ws['B2'].font.color.rgb if ws['B2'].font.color else None, 'FFFF0000')
+        self.assertEqual(ws['C2'].font.color.rgb, 'FFFF0000')
+        self.assertEqual(ws['B3'].font.color.rgb, 'FFFF0000')
+
+    def test_csv_and_jsonl(self):
+        result = compare_workbooks(self.file1, self.file2)
+        rows = list(csv.reader(io.StringIO(''.join(iter_csv(result)))))
+        self.assertEqual(rows, [
+            ['sheet', 'row', 'status', 'diff_cols', 'values'],
+            ['Sheet', '1', 'header', '', 'ID', 'Value'],
+            ['Sheet', '3', 'changed', 'B', '2', '20'],
+            ['Sheet', '5', 'missing', '', '4', '40'],
+        ])
+
+        records = [json.loads(line) for line in ''.join(iter_jsonl(result)).splitlines()]
+        self.assertEqual(records[1], {'sheet': 'Sheet', 'row': 3, 'status': 'changed',
+                                      'diff_cols': [2], 'values': [2, 20]})
+        self.assertEqual(records[2]['diff_cols'], None)
+
+    def test_download_formats(self):
+        saved = app_module.RESULT_STORE
+        app_module.RESULT_STORE = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+        try:
+            client = app_module.app.test_client()
+            with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+                resp = client.post('/compare', data={'file1': (f1, self.file1), 'file2': (f2, self.file2)})
+            download_id = resp.get_data(as_text=True).split('/download/')[1].split('"')[0]
+
+            resp = client.get(f'/download/{download_id}?format=jsonl')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(resp.get_data(as_text=True).splitlines()), 3)
+            resp = client.get(f'/download/{download_id}?format=csv')
+            self.assertIn('attachment; filename=comparison_result.csv', resp.headers['Content-Disposition'])
+            self.assertEqual(client.get(f'/download/{download_id}?format=pdf').status_code, 400)
+        finally:
+            app_module.RESULT_STORE = saved
+
+if __name__ == '__main__':
+    unittest.main()
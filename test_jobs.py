@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from openpyxl import Workbook
+import app as app_module
+from store import DiskStore
+from jobs import make_executor
+
+class TestComparisonJobs(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_job_1.xlsx'
+        self.file2 = 'test_job_2.xlsx'
+        self.directory = tempfile.mkdtemp()
+        self.saved = app_module.RESULT_STORE, app_module._job_executor
+        app_module.RESULT_STORE = DiskStore(self.directory, max_bytes=10 * 1024 * 1024, ttl=60)
+        app_module._job_executor = make_executor(app_module.RESULT_STORE, 1)
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module._job_executor.shutdown()
+        app_module.RESULT_STORE, app_module._job_executor = self.saved
+        shutil.rmtree(self.directory, ignore_errors=True)
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, data, header):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(header)
+        for row in data:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_job(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [[1, 10], [2, 20]], header)
+        self.create_excel(self.file2, [[1, 10], [2, 21]], header)
+
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = self.client.post('/compare', data={
+                'file1': (f1, self.file1), 'file2': (f2, self.file2), 'mode': 'job'})
+        self.assertEqual(resp.status_code, 202)
+        status_url = resp.get_json()['status_url']
+
+        deadline = time.time() + 60
+        while True:
+            status = self.client.get(status_url).get_json()
+            if status['status'] in ('done', 'failed') or time.time() > deadline:
+                break
+            time.sleep(0.1)
+
+        self.assertEqual(status['status'], 'done', status)
+        self.assertEqual((status['sheets_done'], status['rows_processed'], status['diff_rows']), (1, 3, 1))
+        self.assertEqual(self.client.get(status['result_url']).status_code, 200)
+        resp = self.client.get(status['download_url'])
+        self.assertEqual(resp.status_code, 200)
+        resp.close()
+
+        # Uploads are dropped once the job has run
+        self.assertNotIn('file1.xlsx', os.listdir(os.path.join(self.directory, status['job_id'])))
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/jobs/nope').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import unittest
+from openpyxl import Workbook
+from engine import compare_workbooks
+from layout import KeyDetector
+from key_index import KeyIndex, KeyNormalizer, key_getter
+
+class TestKeyIndex(unittest.TestCase):
+    def test_duplicates_pair_up_in_order(self):
+        index = KeyIndex()
+        for key, row in [(1, 'a'), (2, 'b'), (1, 'c')]:
+            index.add(key, row)
+        self.assertEqual(len(index), 2)
+        self.assertEqual([index.match(1), index.match(1), index.match(1)], ['a', 'c', None])
+        # Unique keys match every time
+        self.assertEqual([index.match(2), index.match(2)], ['b', 'b'])
+        self.assertIsNone(index.match(3))
+
+    def test_key_getter(self):
+        get = key_getter((2,))
+        self.assertEqual(get(('a', 'b')), 'b')
+        self.assertIsNone(get(('a',)))
+        get = key_getter((1, 3))
+        self.assertEqual(get(('a', 'b', 'c')), ('a', 'c'))
+        self.assertIsNone(get((None, 'b', None)))
+        self.assertEqual(get((None, 'b', 'c')), (None, 'c'))
+
+    def test_normalizer(self):
+        normalize = KeyNormalizer(strip=True, casefold=True, numeric=True)
+        self.assertEqual(normalize(' AB-1 '), 'ab-1')
+        self.assertEqual(normalize('  '), None)
+        self.assertEqual(normalize('1'), 1)
+        self.assertEqual(normalize('2.5'), 2.5)
+        self.assertEqual(normalize(3.0), 3)
+        self.assertEqual(normalize('nan'), 'nan')
+        # Exact: long numeric IDs don't collide, and text and numbers agree
+        self.assertNotEqual(normalize('110101199003071234'), normalize('110101199003071235'))
+        self.assertEqual(normalize('110101199003071234'), 110101199003071234)
+        self.assertEqual(normalize('0.10'), normalize(0.1))
+        self.assertEqual(normalize('-4.0'), -4)
+        # Only plain digits count as numbers
+        self.assertEqual(normalize('1_000'), '1_000')
+        self.assertEqual(normalize('1e3'), '1e3')
+        self.assertEqual(KeyNormalizer(numeric=True)(' 1 '), ' 1 ')
+        self.assertFalse(KeyNormalizer())
+        self.assertEqual(KeyNormalizer()(' A '), ' A ')
+
+class TestCompositeKeys(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_keys_1.xlsx'
+        self.file2 = 'test_keys_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def compare(self, **options):
+        sheet = compare_workbooks(self.file1, self.file2, **options)['Sheet']
+        return sheet, list(sheet.iter_diff_rows())
+
+    def test_sku_and_warehouse(self):
+        header = ['SKU', 'Warehouse', 'Qty']
+        self.create_excel(self.file1, [header, ['A', 'North', 1], ['A', 'South', 2], ['B', 'North', 3]])
+        self.create_excel(self.file2, [header, ['A', 'South', 2], ['B', 'North', 4], ['A', 'North', 1]])
+
+        sheet, diffs = self.compare(detector=KeyDetector(key_column='SKU, Warehouse'))
+        self.assertEqual(sheet.key_cols, (1, 2))
+        self.assertTrue(sheet.is_key(2, 2))
+        self.assertEqual(diffs, [(4, (3,))])
+
+    def test_duplicate_keys(self):
+        header = ['ID', 'Value']
+        # Duplicates pair up in order instead of all matching the last one
+        self.create_excel(self.file1, [header, [1, 'a'], [1, 'b'], [2, 'c'], [1, 'd']])
+        self.create_excel(self.file2, [header, [2, 'c'], [1, 'a'], [1, 'b']])
+        sheet, diffs = self.compare()
+        # File 2 has run out of rows with ID 1 for the third one
+        self.assertEqual(diffs, [(5, None)])
+
+    def test_normalized_keys(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header, [1, 'a'], [' x2 ', 'b']])
+        self.create_excel(self.file2, [header, ['X2', 'b'], ['1', 'a']])
+
+        sheet, diffs = self.compare()
+        self.assertEqual(diffs, [(2, None), (3, None)])
+        sheet, diffs = self.compare(normalizer=KeyNormalizer(strip=True, casefold=True, numeric=True))
+        # Matched; the key cells themselves still differ
+        self.assertEqual(diffs, [(2, (1,)), (3, (1,))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import unittest
+from openpyxl import Workbook
+from engine import compare_workbooks
+from layout import KeyMatcher, KeyDetector
+
+class TestKeyMatcher(unittest.TestCase):
+    def test_word_rule(self):
+        match = KeyMatcher()
+        for header in ['ID', 'Product ID', 'customer_id', 'SKU#', 'Item #', '商品貨號', ' id ']:
+            self.assertTrue(match(header), header)
+        for header in ['Width', 'Valid', 'Idea', 'Skull', None, '', 0]:
+            self.assertFalse(match(header), header)
+
+    def test_joined_headers(self):
+        # A case change inside a header is a word boundary; "#" needs none
+        match = KeyMatcher()
+        for header in ['ProductID', 'UserID', 'OrderId', 'Item#', '#No', 'IdNumber']:
+            self.assertTrue(match(header), header)
+        for header in ['Width', 'WIDTH', 'Paid', 'ValidFrom', 'Ideas', 'Skull']:
+            self.assertFalse(match(header), header)
+        self.assertTrue(KeyMatcher(mode='prefix')('#No'))
+        self.assertFalse(KeyMatcher(mode='prefix')('ProductID'))
+
+    def test_prefix_and_exact_rules(self):
+        prefix = KeyMatcher(mode='prefix')
+        self.assertTrue(prefix('ID No'))
+        self.assertFalse(prefix('Product ID'))
+        exact = KeyMatcher(mode='exact')
+        self.assertTrue(exact('sku'))
+        self.assertFalse(exact('SKU Code'))
+
+    def test_contains_rule_is_the_old_substring_match(self):
+        self.assertTrue(KeyMatcher(mode='contains')('Width'))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            KeyMatcher(mode='fuzzy')
+
+class TestKeyDetector(unittest.TestCase):
+    def test_skips_words_containing_id(self):
+        rows = [('Width', 'Valid', 'Part ID', 'Qty')]
+        self.assertEqual(KeyDetector().detect(rows), (1, (3,)))
+
+    def test_user_key_column(self):
+        rows = [('Report',), ('ID', 'Code', 'Qty')]
+        self.assertEqual(KeyDetector(key_column='code').detect(rows), (2, (2,)))
+        self.assertEqual(KeyDetector(key_column='Qty, code').detect(rows), (2, (3, 2)))
+        # Falls back to the key tokens when the column isn't there
+        self.assertEqual(KeyDetector(key_column='Serial').detect(rows), (2, (1,)))
+
+    def test_fallback_not_cached_for_other_rows(self):
+        # The fallback only holds while no scanned row names the key column
+        detector = KeyDetector(key_column='Code')
+        self.assertEqual(detector.detect([('Title', None), ('ID', 'Name'), (1, 'x'), (2, 'y')]), (2, (1,)))
+        self.assertEqual(detector.detect([('Title', None), ('ID', 'Name'), ('Code', 'Name'), (2, 'y')]), (3, (1,)))
+
+    def test_no_header(self):
+        self.assertEqual(KeyDetector().detect([(1, 2), ('a', 'b')]), (None, None))
+        self.assertEqual(KeyDetector().detect([]), (None, None))
+        # A cached "no header" doesn't apply to a longer sheet with the same first rows
+        self.assertEqual(KeyDetector().detect([(1, 2), ('a', 'b'), ('ID', 'b')]), (3, (1,)))
+
+    def test_repeated_template_skips_detection(self):
+        detector = KeyDetector(key_column='Serial No')
+        rows = [('Template v3',), ('Name', 'Serial No', 'Qty'), ('a', 1, 2)]
+        self.assertEqual(detector.detect(rows), (2, (2,)))
+
+        def fail(rows):
+            raise AssertionError("layout should come from the cache")
+        detector._scan = fail
+        # Same leading rows up to the header, different data below it
+        self.assertEqual(detector.detect(rows[:2] + [('b', 7, 8)]), (2, (2,)))
+        # A detector with other settings doesn't share the entry
+        self.assertEqual(KeyDetector(mode='exact').detect(rows), (None, None))
+
+class TestKeyColumnOption(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_layout_1.xlsx'
+        self.file2 = 'test_layout_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_compare_by_chosen_key(self):
+        self.create_excel(self.file1, [['Width', 'Code', 'Qty'], [10, 'A', 1], [20, 'B', 2]])
+        self.create_excel(self.file2, [['Width', 'Code', 'Qty'], [20, 'B', 2], [10, 'A', 1]])
+
+        # "Width" is not a key column, so rows are matched by position
+        sheet = compare_workbooks(self.file1, self.file2)['Sheet']
+        self.assertEqual(sheet.key_col, None)
+        self.assertEqual(sheet.diff_row_count, 2)
+
+        sheet = compare_workbooks(self.file1, self.file2, detector=KeyDetector(key_column='Code'))['Sheet']
+        self.assertEqual((sheet.header_row, sheet.key_col), (1, 2))
+        self.assertEqual(sheet.diff_row_count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import unittest
+from openpyxl import Workbook
+import app as app_module
+from jobs import MEMO_NAME, memo_key, find_memo, set_done
+from layout import KeyDetector
+from snapshot import file_digest
+from store import MemoryStore, OUTPUT_NAME
+
+class TestResultMemo(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_memo_1.xlsx'
+        self.file2 = 'test_memo_2.xlsx'
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header, [1, 10], [2, 20]])
+        self.create_excel(self.file2, [header, [1, 10], [2, 21]])
+        self.saved = app_module.RESULT_STORE
+        app_module.RESULT_STORE = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.RESULT_STORE = self.saved
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def compare(self, **form):
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = self.client.post('/compare', data=dict(form, file1=(f1, self.file1), file2=(f2, self.file2)))
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_data(as_text=True).split('/download/')[1].split('"')[0], resp
+
+    def test_memo_key(self):
+        options = {'detector': KeyDetector(), 'normalizer': None,
+                   'output_mode': 'full', 'alignment': 'position', 'workers': 1}
+        key = memo_key('a' * 64, 'b' * 64, options)
+        self.assertEqual(len(key), 64)
+        # Options that don't shape the result don't change the key
+        self.assertEqual(key, memo_key('a' * 64, 'b' * 64, dict(options, workers=4, reader='xml')))
+        self.assertNotEqual(key, memo_key('b' * 64, 'a' * 64, options))
+        self.assertNotEqual(key, memo_key('a' * 64, 'b' * 64, dict(options, output_mode='diff')))
+        self.assertNotEqual(key, memo_key('a' * 64, 'b' * 64, dict(options, detector=KeyDetector(key_column='ID'))))
+
+    def test_same_pair_again(self):
+        download_id, _ = self.compare()
+        again, resp = self.compare()
+        self.assertEqual(again, download_id)
+        self.assertIn('hash;dur=', resp.headers['Server-Timing'])
+        self.assertNotIn('compare;dur=', resp.headers['Server-Timing'])
+        self.assertEqual(self.client.get(f'/download/{again}').status_code, 200)
+
+        # Other options compare again
+        other, _ = self.compare(output_mode='diff')
+        self.assertNotEqual(other, download_id)
+
+        # Job mode answers with the stored result as a finished job
+        job = self.post_job()
+        self.assertEqual(job['job_id'], download_id)
+        status = self.client.get(job['status_url']).get_json()
+        self.assertEqual((status['status'], status['diff_rows']), ('done', 1))
+
+    def post_job(self):
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = self.client.post('/compare', data={'file1': (f1, self.file1), 'file2': (f2, self.file2),
+                                                      'mode': 'job'})
+        self.assertEqual(resp.status_code, 202)
+        return resp.get_json()
+
+    def test_cached_job_keeps_status(self):
+        # The result of a job: a cached hit doesn't overwrite that job's status
+        download_id, _ = self.compare()
+        set_done(app_module.RESULT_STORE, download_id, app_module.load_result(download_id),
+                 stages={'compare': 0.5})
+        for _ in range(2):
+            job = self.post_job()
+            self.assertEqual(job['job_id'], download_id)
+            status = self.client.get(job['status_url']).get_json()
+            self.assertEqual((status['status'], status['stages']), ('done', {'compare': 0.5}))
+            self.assertNotIn('cached', status)
+
+    def test_evicted_result(self):
+        download_id, _ = self.compare()
+        store = app_module.RESULT_STORE
+        options = app_module.compare_options({})
+        memo = memo_key(file_digest(self.file1), file_digest(self.file2), options)
+        self.assertEqual(find_memo(store, memo), download_id)
+
+        store.remove(download_id, OUTPUT_NAME)
+        self.assertIsNone(find_memo(store, memo))
+        again, _ = self.compare()
+        self.assertNotEqual(again, download_id)
+        self.assertEqual(store.get_json(memo, MEMO_NAME), {'result_id': again})
+
+if __name__ == '__main__':
+    unittest.main()
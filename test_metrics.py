@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from openpyxl import Workbook
+import app as app_module
+from engine import compare_workbooks
+from metrics import Metrics, Registry
+from store import MemoryStore
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_metrics_1.xlsx'
+        self.file2 = 'test_metrics_2.xlsx'
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header, [1, 10], [2, 20], [3, 30]])
+        self.create_excel(self.file2, [header, [1, 10], [2, 21]])
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_stages_are_exclusive(self):
+        metrics = Metrics()
+        with metrics.stage('outer'):
+            time.sleep(0.02)
+            with metrics.stage('inner'):
+                time.sleep(0.02)
+        self.assertGreaterEqual(metrics.timings['inner'], 0.02)
+        self.assertLess(metrics.timings['outer'], 0.035)
+
+        def slow():
+            time.sleep(0.02)
+            yield 1
+        with metrics.stage('consumer'):
+            self.assertEqual(list(metrics.timed('producer', slow())), [1])
+        self.assertGreaterEqual(metrics.timings['producer'], 0.02)
+        self.assertLess(metrics.timings['consumer'], 0.015)
+
+    def test_compare_workbooks(self):
+        metrics = Metrics()
+        compare_workbooks(self.file1, self.file2, io.BytesIO(), metrics=metrics)
+        self.assertTrue({'open', 'detect', 'index', 'compare', 'write', 'save'} <= set(metrics.timings))
+        self.assertEqual(metrics.counters['rows'], 4)
+        self.assertEqual(metrics.counters['cells'], 8)
+        self.assertEqual(metrics.counters['diff_rows'], 2)
+        self.assertEqual(metrics.counters['key_misses'], 1)
+
+        registry = Registry()
+        registry.observe(metrics)
+        text = registry.render()
+        self.assertIn('excel_compare_comparisons_total{outcome="ok"} 1', text)
+        self.assertIn('excel_compare_stage_seconds_count{stage="index"} 1', text)
+        self.assertIn('excel_compare_key_misses_total 1', text)
+
+    def test_request_instrumentation(self):
+        saved = app_module.RESULT_STORE, app_module.app.config['PROFILE_DIR']
+        directory = tempfile.mkdtemp()
+        app_module.RESULT_STORE = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+        app_module.app.config['PROFILE_DIR'] = directory
+        try:
+            client = app_module.app.test_client()
+            with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+                resp = client.post('/compare?profile=1', data={'file1': (f1, self.file1), 'file2': (f2, self.file2)})
+            self.assertEqual(resp.status_code, 200)
+            timing = resp.headers['Server-Timing']
+            for stage in ('upload', 'compare', 'save', 'store', 'render', 'total'):
+                self.assertIn(stage + ';dur=', timing)
+            names = os.listdir(directory)
+            self.assertTrue(any(name.endswith('.prof') for name in names))
+            self.assertTrue(any(name.endswith('.memory.txt') for name in names))
+
+            resp = client.get('/metrics')
+            self.assertIn('excel_compare_diff_rows_total', resp.get_data(as_text=True))
+        finally:
+            app_module.RESULT_STORE, app_module.app.config['PROFILE_DIR'] = saved
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import unittest
+from openpyxl import Workbook
+import app as app_module
+from app import app
+
+class TestResultPagination(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_page_1.xlsx'
+        self.file2 = 'test_page_2.xlsx'
+        self.client = app.test_client()
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, data, header):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(header)
+        for row in data:
+            ws.append(row)
+        wb.save(filename)
+
+    def compare(self, **form):
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = self.client.post('/compare', data=dict(form, file1=(f1, self.file1), file2=(f2, self.file2)))
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_data(as_text=True).split('/download/')[1].split('"')[0]
+
+    def test_pages(self):
+        header = ['ID', 'Value']
+        # Every odd ID differs: 25 diff rows + the header
+        self.create_excel(self.file1, [[i, i] for i in range(1, 51)], header)
+        self.create_excel(self.file2, [[i, i + (i % 2)] for i in range(1, 51)], header)
+        download_id = self.compare()
+
+        page = self.client.get(f'/rows/{download_id}?sheet=Sheet&offset=0&limit=10').get_json()
+        self.assertEqual(page['total'], 26)
+        self.assertEqual(len(page['rows']), 10)
+        self.assertEqual(page['rows'][0]['row'], 1)
+        self.assertEqual(page['rows'][0]['cells'][0], {'value': 'ID', 'class': ' bg-green-100'})
+        self.assertEqual(page['rows'][1]['row'], 2)
+        self.assertEqual(page['rows'][1]['cells'][1], {'value': 1, 'class': ' text-red-600 font-bold'})
+
+        last = self.client.get(f'/rows/{download_id}?sheet=Sheet&offset=20&limit=10').get_json()
+        self.assertEqual([r['row'] for r in last['rows']], [40, 42, 44, 46, 48, 50])
+
+    def test_missing_sheet(self):
+        # Rows of a sheet missing from file 2 are read back from the output workbook
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [[i, i] for i in range(1, 31)], header)
+        wb = Workbook()
+        wb.active.title = 'Other'
+        wb.save(self.file2)
+        for output_mode in ('full', 'diff'):
+            download_id = self.compare(output_mode=output_mode)
+            page = self.client.get(f'/rows/{download_id}?sheet=Sheet&offset=25&limit=10').get_json()
+            self.assertEqual(page['total'], 31)
+            self.assertEqual([r['row'] for r in page['rows']], [26, 27, 28, 29, 30, 31])
+            self.assertEqual([c['value'] for c in page['rows'][0]['cells']], [25, 25])
+
+            resp = self.client.get(f'/download/{download_id}?format=csv')
+            self.assertEqual(len(resp.get_data(as_text=True).splitlines()), 32)
+            resp.close()
+
+    def test_download(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [[1, 1]], header)
+        self.create_excel(self.file2, [[1, 2]], header)
+        download_id = self.compare()
+
+        resp = self.client.get(f'/download/{download_id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_data()[:2], b'PK')
+        resp.close()
+
+    def test_evicted(self):
+        # A result the store dropped isn't served from the per-worker cache any more
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [[1, 1]], header)
+        self.create_excel(self.file2, [[1, 2]], header)
+        download_id = self.compare()
+        self.assertEqual(self.client.get(f'/rows/{download_id}?sheet=Sheet').status_code, 200)
+        app_module.RESULT_STORE.delete(download_id)
+        self.assertEqual(self.client.get(f'/rows/{download_id}?sheet=Sheet').status_code, 404)
+
+    def test_missing(self):
+        self.assertEqual(self.client.get('/rows/nope?sheet=Sheet').status_code, 404)
+        self.assertEqual(self.client.get('/download/nope').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
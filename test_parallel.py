@@ -0,0 +1,75 @@
+import io
+import os
+import unittest
+from openpyxl import Workbook, load_workbook
+from engine import compare_workbooks
+
+class TestParallelSheets(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_par_1.xlsx'
+        self.file2 = 'test_par_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, sheets):
+        wb = Workbook()
+        wb.remove(wb.active)
+        for name, rows in sheets.items():
+            ws = wb.create_sheet(name)
+            for row in rows:
+                ws.append(row)
+        wb.save(filename)
+
+    def test_same_as_sequential(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, {
+            'Jan': [header, [1, 10], [2, 20]],
+            'Feb': [header, [1, 11], [2, 21]],
+            'Mar': [['Name', 'Value'], ['a', 1]],
+        })
+        self.create_excel(self.file2, {
+            'Feb': [header, [2, 21], [1, 99]],
+            'Jan': [header, [1, 10], [2, 20]],
+        })
+
+        sequential = compare_workbooks(self.file1, self.file2)
+        with open(self.file1, 'rb') as f1:
+            parallel = compare_workbooks(f1, self.file2, workers=2)
+
+        def summary(result):
+            return [(s.name, s.header_row, s.key_col, list(s.iter_diff_rows()), s.row_values) for s in result]
+
+        self.assertEqual(summary(parallel), summary(sequential))
+        self.assertEqual([s.name for s in parallel], ['Jan', 'Feb', 'Mar'])
+        self.assertEqual(list(parallel['Feb'].iter_diff_rows()), [(2, (2,))])
+
+    def test_same_output(self):
+        header = ['ID', 'Value', 'Note']
+        self.create_excel(self.file1, {
+            'Jan': [['Report'], header, [1, 10, 'a'], [2, 20, 'b'], [3, 30, 'c']],
+            'Feb': [header, [1, 11, 'x'], [2, 21, 'y']],
+            'Only1': [['Name'], ['a']],
+        })
+        self.create_excel(self.file2, {
+            'Jan': [['Report'], header, [3, 30, 'c'], [1, 12, 'a']],
+            'Feb': [header, [2, 21, 'y'], [1, 11, 'z']],
+        })
+
+        def output(**options):
+            stream = io.BytesIO()
+            compare_workbooks(self.file1, self.file2, stream, **options)
+            wb = load_workbook(stream)
+            return [
+                (ws.title, [[(cell.value, cell.font.color.rgb if cell.font.color else None, cell.fill.fgColor.rgb)
+                             for cell in row] for row in ws.iter_rows()])
+                for ws in wb
+            ]
+
+        for output_mode in ('full', 'diff'):
+            self.assertEqual(output(workers=2, output_mode=output_mode), output(output_mode=output_mode))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import io
+import os
+import unittest
+from openpyxl import Workbook, load_workbook
+from app import app
+from engine import compare_workbooks
+from selection import Selection, UnknownSheet
+from xlsx_reader import XlsxWorkbook
+
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_selection_1.xlsx'
+        self.file2 = 'test_selection_2.xlsx'
+        header = ['ID', 'Name', 'Price', 'Note']
+        self.create_excel(self.file1, {
+            'Items': [header, [1, 'a', 10, 'x'], [2, 'b', 20, 'y'], [3, 'c', 30, 'z']],
+            'Other': [['ID', 'Value'], [1, 1]],
+        })
+        self.create_excel(self.file2, {
+            'Items': [header, [1, 'a', 11, 'x'], [2, 'b', 20, 'changed'], [3, 'C', 30, 'z']],
+            'Other': [['ID', 'Value'], [1, 2]],
+        })
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, sheets):
+        wb = Workbook()
+        wb.remove(wb.active)
+        for name, rows in sheets.items():
+            ws = wb.create_sheet(name)
+            for row in rows:
+                ws.append(row)
+        wb.save(filename)
+
+    def test_column_set(self):
+        header = ('ID', ' price ', 'Note', None)
+        self.assertEqual(Selection(columns='Price').column_set(header, (1,), 4), {1, 2})
+        self.assertEqual(Selection(ignore_columns=['note']).column_set(header, (1,), 4), {1, 2, 4})
+        self.assertIsNone(Selection(ignore_columns='Other').column_set(header, (1,), 4))
+        self.assertIsNone(Selection(columns='Price').column_set(None, None, 4))
+        self.assertFalse(Selection(sheets=' , '))
+
+        wb = XlsxWorkbook(self.file1)
+        try:
+            rows = list(wb['Items'].iter_rows(max_col=4, columns={1, 3}))
+        finally:
+            wb.close()
+        self.assertEqual(rows[1], (1, None, 10, None))
+
+    def test_sheets(self):
+        stream = io.BytesIO()
+        result = compare_workbooks(self.file1, self.file2, stream, selection=Selection(sheets='Other'))
+        self.assertEqual([sheet.name for sheet in result], ['Other'])
+        self.assertEqual(load_workbook(stream).sheetnames, ['Other'])
+
+        with self.assertRaises(UnknownSheet):
+            compare_workbooks(self.file1, self.file2, selection=Selection(sheets='Missing'))
+
+    def test_columns(self):
+        selections = (Selection(sheets='Items', columns='Price'),
+                      Selection(sheets='Items', ignore_columns='Name, Note'))
+        for reader in ('openpyxl', 'xml'):
+            for selection in selections:
+                result = compare_workbooks(self.file1, self.file2, reader=reader, selection=selection)
+                sheet = result['Items']
+                self.assertEqual(list(sheet.iter_diff_rows()), [(2, (3,))])
+                self.assertEqual(sheet.columns, (1, 3))
+                self.assertEqual(sheet.row_values[2], (1, None, 10, None))
+
+    def test_parallel_output(self):
+        # Sheets compared in worker processes are written from file 1 with the same columns left out
+        stream = io.BytesIO()
+        compare_workbooks(self.file1, self.file2, stream, workers=2, selection=Selection(columns='Price'))
+        ws = load_workbook(stream)['Items']
+        self.assertEqual([cell.value for cell in ws[3]], [2, None, 20, None])
+
+    def test_form(self):
+        client = app.test_client()
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = client.post('/compare', data={'file1': (f1, self.file1), 'file2': (f2, self.file2),
+                                                 'sheets': 'Missing'})
+        self.assertEqual(resp.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import threading
+import unittest
+from openpyxl import Workbook
+import shards
+from engine import compare_workbooks
+
+@unittest.skipUnless(shards.can_fork(), "row sharding needs the fork start method")
+class TestRowSharding(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_shards_1.xlsx'
+        self.file2 = 'test_shards_2.xlsx'
+        self.saved = shards.SHARD_MIN_ROWS
+        shards.SHARD_MIN_ROWS = 10
+
+    def tearDown(self):
+        shards.SHARD_MIN_ROWS = self.saved
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def assertSameResult(self, **options):
+        expected = compare_workbooks(self.file1, self.file2, **options)['Sheet']
+        sheet = compare_workbooks(self.file1, self.file2, workers=3, **options)['Sheet']
+        self.assertEqual(list(sheet.iter_diff_rows()), list(expected.iter_diff_rows()))
+        self.assertEqual(sheet.row_values, expected.row_values)
+        self.assertEqual((sheet.max_row, sheet.fast_rows), (expected.max_row, expected.fast_rows))
+        return sheet
+
+    def test_keyed_sheet(self):
+        rows = [['note'], ['ID', 'Value']] + [[i, i * 10] for i in range(1, 201)]
+        changed = [list(row) for row in rows]
+        changed[0] = ['other note']
+        changed[50][1] = -1
+        del changed[120]
+        # Duplicated keys pair up in order, across shards
+        rows += [[7, 'a'], [7, 'b'], [7, 'c']]
+        changed += [[7, 'b'], [7, 'x']]
+        self.create_excel(self.file1, rows)
+        # Data rows in another order
+        self.create_excel(self.file2, changed[:2] + changed[:1:-1])
+
+        sheet = self.assertSameResult()
+        self.assertEqual(sheet.key_cols, (1,))
+        self.assertEqual(len(sheet.missing_rows), 2)
+
+    def test_keyless_sheet(self):
+        rows = [[f'item {i}', i] for i in range(1, 101)]
+        changed = [['inserted', 0]] + [list(row) for row in rows[:90]]
+        changed[30][1] = -1
+        self.create_excel(self.file1, rows)
+        self.create_excel(self.file2, changed)
+
+        self.assertSameResult()
+        sheet = self.assertSameResult(alignment='diff')
+        self.assertEqual(len(sheet.missing_rows), 10)
+
+    def test_threads_running(self):
+        # Forking while another thread may hold a lock could hang the workers: compare in-process
+        rows = [['ID', 'Value']] + [[i, i] for i in range(1, 101)]
+        self.create_excel(self.file1, rows)
+        self.create_excel(self.file2, rows[:50])
+        calls = []
+        compare_sheet = shards.compare_sheet
+        shards.compare_sheet = lambda *args: calls.append(args[0]) or compare_sheet(*args)
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        try:
+            self.assertFalse(shards.single_threaded())
+            self.assertSameResult()
+        finally:
+            release.set()
+            thread.join()
+            shards.compare_sheet = compare_sheet
+        self.assertEqual(calls, ['Sheet'])
+        self.assertIsNone(shards._shared)
+
+if __name__ == '__main__':
+    unittest.main()
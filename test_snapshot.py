@@ -0,0 +1,155 @@
+import datetime
+import io
+import os
+import pickle
+import unittest
+from openpyxl import Workbook
+import jobs
+import snapshot
+from engine import compare_workbooks, open_workbook, save_snapshot, sheet_dimensions, sheet_rows
+from jobs import open_snapshot, store_comparison
+from selection import Selection
+from snapshot import MAGIC, SNAPSHOT_NAME, SnapshotWorkbook, file_digest, write_snapshot
+from store import MemoryStore
+
+# Set by Payload when it is unpickled
+unpickled = []
+
+class Payload:
+    def __reduce__(self):
+        return unpickled.append, ('ran',)
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_snap_1.xlsx'
+        self.file2 = 'test_snap_2.xlsx'
+        self.chunk_rows = snapshot.CHUNK_ROWS
+        snapshot.CHUNK_ROWS = 3
+
+    def tearDown(self):
+        snapshot.CHUNK_ROWS = self.chunk_rows
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, sheets):
+        wb = Workbook()
+        wb.remove(wb.active)
+        for name, rows in sheets.items():
+            ws = wb.create_sheet(name)
+            for row in rows:
+                ws.append(row)
+        wb.save(filename)
+
+    def test_round_trip(self):
+        rows = [['ID', 'Value']] + [[i, i * 10] for i in range(1, 11)] + [[None, None], ['x']]
+        self.create_excel(self.file1, {'Data': rows, 'Empty': []})
+        buf = io.BytesIO()
+        save_snapshot(self.file1, buf)
+
+        wb = open_workbook(self.file1)
+        snap = SnapshotWorkbook(buf)
+        self.assertIs(open_workbook(snap), snap)
+        self.assertEqual(snap.sheetnames, ['Data', 'Empty'])
+        for name in wb.sheetnames:
+            dims = sheet_dimensions(wb[name])
+            self.assertEqual(sheet_dimensions(snap[name]), dims)
+            self.assertEqual(list(sheet_rows(snap[name], dims)), list(sheet_rows(wb[name], dims)))
+            # Starting in the middle of a chunk
+            self.assertEqual(list(sheet_rows(snap[name], dims, min_row=5)), list(sheet_rows(wb[name], dims, min_row=5)))
+        wb.close()
+        with self.assertRaises(ValueError):
+            SnapshotWorkbook(self.file1)
+
+    def test_value_types(self):
+        row = (None, True, 3, 2.5, 'text', datetime.datetime(2024, 3, 1, 12, 30), datetime.date(2024, 3, 1),
+               datetime.time(8, 15), datetime.timedelta(days=1, microseconds=5), '#N/A')
+        buf = io.BytesIO()
+        write_snapshot(buf, [('Sheet', [row, row[:3]])])
+        snap = SnapshotWorkbook(buf)
+        self.assertEqual((snap['Sheet'].max_row, snap['Sheet'].max_column), (2, len(row)))
+        self.assertEqual(list(snap['Sheet'].iter_rows()), [row, row[:3]])
+
+    def test_upload_is_never_unpickled(self):
+        # An upload shaped like a snapshot (of this or the old pickled format) is read as a workbook
+        header = ['ID', 'Value']
+        self.create_excel(self.file2, {'Sheet': [header, [1, 10]]})
+        for magic in (MAGIC, b'XLSNAP1\n'):
+            with open(self.file1, 'wb') as f:
+                f.write(magic)
+                offset = f.tell()
+                pickle.dump(Payload(), f)
+                f.write(offset.to_bytes(8, 'little'))
+            for reader in ('openpyxl', 'xml'):
+                with self.assertRaises(Exception):
+                    compare_workbooks(self.file1, self.file2, reader=reader)
+            store = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+            with self.assertRaises(Exception):
+                store_comparison(store, 'key', self.file1, self.file2, snapshots=True)
+        self.assertEqual(unpickled, [])
+
+    def test_reused_by_digest(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, {'Sheet': [header, [1, 10], [2, 20], [3, 30], [4, 40]]})
+        self.create_excel(self.file2, {'Sheet': [header, [4, 40], [2, 21], [1, 10]]})
+        store = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+
+        direct = compare_workbooks(self.file1, self.file2)['Sheet']
+        result = store_comparison(store, 'first', self.file1, self.file2, snapshots=True)['Sheet']
+        self.assertEqual(list(result.iter_diff_rows()), list(direct.iter_diff_rows()))
+        self.assertEqual(list(result.iter_diff_rows()), [(3, (2,)), (4, None)])
+
+        digest = file_digest(self.file1)
+        self.assertIsNotNone(store.open(digest, SNAPSHOT_NAME))
+
+        # Once taken, the snapshot is served from the store without parsing the workbook again
+        def parse(source, f):
+            raise AssertionError("workbook parsed again")
+        jobs.save_snapshot = parse
+        try:
+            result = store_comparison(store, 'second', self.file1, self.file2, snapshots=True)['Sheet']
+        finally:
+            jobs.save_snapshot = save_snapshot
+        self.assertEqual(list(result.iter_diff_rows()), [(3, (2,)), (4, None)])
+
+    def test_parallel(self):
+        # Workers are handed the snapshot files, not the workbooks
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, {'A': [header, [1, 10], [2, 20]], 'B': [header, [3, 30]]})
+        self.create_excel(self.file2, {'A': [header, [2, 21], [1, 10]], 'B': [header, [3, 31]]})
+        store = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+        result = store_comparison(store, 'key', self.file1, self.file2, snapshots=True, workers=2)
+        self.assertEqual(list(result['A'].iter_diff_rows()), [(3, (2,))])
+        self.assertEqual(list(result['B'].iter_diff_rows()), [(2, (2,))])
+
+    def test_not_taken_for_selection(self):
+        header = ['ID', 'Value', 'Note']
+        self.create_excel(self.file1, {'Sheet': [header, [1, 10, 'a']], 'Other': [header, [2, 20, 'b']]})
+        self.create_excel(self.file2, {'Sheet': [header, [1, 11, 'x']], 'Other': [header, [2, 21, 'y']]})
+        store = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+
+        # A snapshot would parse the sheets and columns left out of the selection
+        def parse(source, f):
+            raise AssertionError("snapshot taken")
+        jobs.save_snapshot = parse
+        try:
+            result = store_comparison(store, 'key', self.file1, self.file2, snapshots=True,
+                                      selection=Selection(sheets='Sheet', ignore_columns='Note'))
+        finally:
+            jobs.save_snapshot = save_snapshot
+        self.assertEqual([sheet.name for sheet in result], ['Sheet'])
+        self.assertEqual(list(result['Sheet'].iter_diff_rows()), [(2, (2,))])
+        self.assertIsNone(store.open(file_digest(self.file1), SNAPSHOT_NAME))
+
+    def test_store_too_small(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, {'Sheet': [header, [1, 10]]})
+        self.create_excel(self.file2, {'Sheet': [header, [1, 11]]})
+        # Snapshots are evicted with the rest of the store; the workbooks are then read directly
+        store = MemoryStore(max_bytes=50, ttl=60)
+        self.assertIsNone(open_snapshot(store, self.file1))
+        result = store_comparison(store, 'key', self.file1, self.file2, snapshots=True)['Sheet']
+        self.assertEqual(list(result.iter_diff_rows()), [(2, (2,))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from store import MemoryStore, DiskStore
+
+class StoreTests:
+    def test_roundtrip(self):
+        self.store.put('abc', 'output.xlsx', b'data')
+        with self.store.open('abc', 'output.xlsx') as f:
+            self.assertEqual(f.read(), b'data')
+        self.assertIsNone(self.store.open('abc', 'other'))
+        self.assertIsNone(self.store.open('missing', 'output.xlsx'))
+
+        self.store.put_object('abc', 'result.pickle', {'rows': [1, 2]})
+        self.assertEqual(self.store.get_object('abc', 'result.pickle'), {'rows': [1, 2]})
+
+    def test_invalid_key(self):
+        self.assertIsNone(self.store.open('../etc', 'passwd'))
+        with self.assertRaises(ValueError):
+            self.store.put('../etc', 'passwd', b'x')
+
+    def test_size_cap_evicts_least_recently_used(self):
+        self.store.put('a', 'f', b'x' * 40)
+        time.sleep(0.01)
+        self.store.put('b', 'f', b'x' * 40)
+        time.sleep(0.01)
+        self.store.open('a', 'f').close() # a is now more recent than b
+        time.sleep(0.01)
+        self.store.put('c', 'f', b'x' * 40)
+
+        self.assertIsNotNone(self.store.open('a', 'f'))
+        self.assertIsNone(self.store.open('b', 'f'))
+        self.assertIsNotNone(self.store.open('c', 'f'))
+
+    def test_ttl(self):
+        self.store.ttl = 0.05
+        self.store.put('a', 'f', b'x')
+        time.sleep(0.1)
+        self.assertIsNone(self.store.open('a', 'f'))
+
+class TestMemoryStore(StoreTests, unittest.TestCase):
+    def setUp(self):
+        self.store = MemoryStore(max_bytes=100, ttl=60)
+
+class TestDiskStore(StoreTests, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = DiskStore(self.directory, max_bytes=100, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_shared_between_instances(self):
+        # Two workers pointing at the same directory see each other's results
+        other = DiskStore(self.directory, max_bytes=100, ttl=60)
+        self.store.put('abc', 'f', b'data')
+        with other.open('abc', 'f') as f:
+            self.assertEqual(f.read(), b'data')
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "POSIX permissions")
+    def test_private_directory(self):
+        directory = os.path.join(self.directory, 'store')
+        DiskStore(directory, max_bytes=100, ttl=60)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+        # A directory others can write to could hold planted pickles
+        os.chmod(directory, 0o777)
+        with self.assertRaises(PermissionError):
+            DiskStore(directory, max_bytes=100, ttl=60)
+
+    def test_failed_write_leaves_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.writer('abc', 'f') as f:
+                f.write(b'partial')
+                raise RuntimeError
+        self.assertIsNone(self.store.open('abc', 'f'))
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'abc')), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import io
+import os
+import re
+import unittest
+import zipfile
+from openpyxl import Workbook, load_workbook
+from app import compare_excels
+from engine import open_workbook, compare_sheet, compare_workbooks, READERS
+
+class TestStreamingCompare(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_stream_1.xlsx'
+        self.file2 = 'test_stream_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_rows_are_lazy(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header] + [[i, i * 10] for i in range(1, 51)])
+        self.create_excel(self.file2, [header] + [[i, i * 10] for i in range(50, 0, -1)])
+
+        wb1 = open_workbook(self.file1)
+        wb2 = open_workbook(self.file2)
+        sheet, rows = compare_sheet('Sheet', wb1.active, wb2.active)
+        self.assertEqual((sheet.header_row, sheet.key_col), (1, 1))
+
+        # Nothing has been compared yet; rows come out one at a time
+        row_idx, values, diff_cols = next(rows)
+        self.assertEqual((row_idx, values, diff_cols), (1, ('ID', 'Value'), ()))
+        self.assertTrue(all(diff == () for _, _, diff in rows))
+        wb1.close()
+        wb2.close()
+
+    def test_fast_path_rows(self):
+        header = ['ID', 'Value']
+        self.create_excel(self.file1, [header, [1, 10], [2, 20], [3, 30]])
+        self.create_excel(self.file2, [header, [3, 30], [2, 21], [1, 10]])
+
+        wb1 = open_workbook(self.file1)
+        wb2 = open_workbook(self.file2)
+        sheet, rows = compare_sheet('Sheet', wb1.active, wb2.active)
+        self.assertEqual([diff for _, _, diff in rows], [(), (), (2,), ()])
+        # Header and rows 1 and 3 are identical; row 2 is compared cell by cell
+        self.assertEqual(sheet.fast_rows, 3)
+        wb1.close()
+        wb2.close()
+
+    def test_shorter_file2(self):
+        # No key column -> positional match; row 3 doesn't exist in File 2
+        self.create_excel(self.file1, [['Name', 'Value'], ['A', 1], ['B', 2]])
+        self.create_excel(self.file2, [['Name', 'Value'], ['A', 1]])
+
+        ws_out = compare_excels(self.file1, self.file2).active
+        self.assertNotEqual(ws_out.cell(row=2, column=2).font.color.rgb, 'FFFF0000')
+        self.assertEqual(ws_out.cell(row=3, column=1).font.color.rgb, 'FFFF0000')
+        self.assertEqual(ws_out.cell(row=3, column=2).font.color.rgb, 'FFFF0000')
+
+    def stale_dimension(self, filename):
+        """Rewrite the <dimension> record of the first sheet to A1, as some writers leave it."""
+        with zipfile.ZipFile(filename) as src:
+            items = [(item, src.read(item.filename)) for item in src.infolist()]
+        with zipfile.ZipFile(filename, 'w') as dst:
+            for item, data in items:
+                if item.filename == 'xl/worksheets/sheet1.xml':
+                    data = re.sub(rb'<dimension ref="[^"]*"', b'<dimension ref="A1"', data)
+                dst.writestr(item, data)
+
+    def test_stale_dimension(self):
+        # The dimension is a hint: rows and columns past it are still compared
+        self.create_excel(self.file1, [['ID', 'Value'], [1, 10], [2, 20], [3, 30]])
+        self.create_excel(self.file2, [['ID', 'Value'], [1, 10], [2, 21], [3, 31]])
+        self.stale_dimension(self.file1)
+        self.stale_dimension(self.file2)
+
+        for reader in READERS:
+            out = io.BytesIO()
+            result = compare_workbooks(self.file1, self.file2, out, reader=reader)
+            self.assertEqual(list(result['Sheet'].iter_diff_rows()), [(3, (2,)), (4, (2,))])
+            self.assertEqual((result['Sheet'].max_row, result['Sheet'].max_col), (4, 2))
+            ws = load_workbook(out).active
+            self.assertEqual([row for row in ws.iter_rows(values_only=True)],
+                             [('ID', 'Value'), (1, 10), (2, 20), (3, 30)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import datetime
+import os
+import unittest
+from openpyxl import Workbook
+from app import app
+from engine import compare_workbooks
+from tolerance import Tolerance, NUMBER, DATE, TEXT
+
+class TestTolerance(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_tolerance_1.xlsx'
+        self.file2 = 'test_tolerance_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_kernels(self):
+        tolerance = Tolerance(abs_tol=0.01, dates=True, strip=True)
+        rows = [(1, 2.5, datetime.date(2024, 1, 1), 'a', '2024-01-02', None, 'x'),
+                (2, None, datetime.datetime(2024, 1, 2), 'b', '2024-01-03', None, 3)]
+        self.assertEqual([tolerance.column_kind(column) for column in zip(*rows)],
+                         [NUMBER, NUMBER, DATE, TEXT, DATE, None, None])
+        number, _, date, text, date_text, empty, mixed = tolerance.kernels(rows, 7)
+        self.assertTrue(number(100, 100.005))
+        self.assertFalse(number(100, 100.02))
+        self.assertFalse(number(100, '100'))
+        self.assertTrue(date(datetime.datetime(2024, 1, 1), '2024-01-01'))
+        self.assertTrue(date_text('2024-01-03', datetime.date(2024, 1, 3)))
+        self.assertFalse(date(datetime.date(2024, 1, 1), 'soon'))
+        self.assertTrue(text('a ', ' a'))
+        self.assertFalse(text('A', 'a'))
+        self.assertFalse(text('a', 1))
+        self.assertTrue(mixed(3, 3.001) and mixed('x ', 'x'))
+        # Nothing to relax: columns compare as before
+        self.assertEqual(Tolerance(dates=True).kernels(rows, 2), [None, None])
+        self.assertFalse(Tolerance())
+        with self.assertRaises(ValueError):
+            Tolerance(rel_tol=-1)
+
+    def test_compare(self):
+        header = ['ID', 'Amount', 'Date', 'Name']
+        self.create_excel(self.file1, [header,
+                                       [1, 100, datetime.datetime(2024, 3, 1), 'Alice'],
+                                       [2, 0.3, datetime.datetime(2024, 3, 2), 'Bob'],
+                                       [3, 50, datetime.datetime(2024, 3, 3), 'Carol']])
+        self.create_excel(self.file2, [header,
+                                       [1, 100.0000001, '2024-03-01', 'Alice '],
+                                       [2, 0.3000001, datetime.datetime(2024, 3, 2), 'bob'],
+                                       [3, 51, datetime.datetime(2024, 3, 3), 'Carol']])
+
+        tolerance = Tolerance(abs_tol=1e-6, dates=True, strip=True)
+        exact = compare_workbooks(self.file1, self.file2)['Sheet']
+        self.assertEqual(list(exact.iter_diff_rows()), [(2, (2, 3, 4)), (3, (2, 4)), (4, (2,))])
+
+        sheet = compare_workbooks(self.file1, self.file2, tolerance=tolerance)['Sheet']
+        self.assertEqual(list(sheet.iter_diff_rows()), [(3, (4,)), (4, (2,))])
+
+    def test_form(self):
+        self.create_excel(self.file1, [['ID'], [1]])
+        self.create_excel(self.file2, [['ID'], [1]])
+        with open(self.file1, 'rb') as f1, open(self.file2, 'rb') as f2:
+            resp = app.test_client().post('/compare', data={'file1': (f1, self.file1), 'file2': (f2, self.file2),
+                                                            'abs_tol': '-1'})
+        self.assertEqual(resp.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from flask import request
+from openpyxl import Workbook
+import app as app_module
+from store import MemoryStore
+from uploads import InvalidUpload, validate_workbook, upload_source
+
+class TestUploads(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file1 = os.path.join(self.directory, 'test_upload_1.xlsx')
+        self.saved = app_module.RESULT_STORE
+        app_module.RESULT_STORE = MemoryStore(max_bytes=10 * 1024 * 1024, ttl=60)
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.RESULT_STORE = self.saved
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def create_excel(self, filename, rows):
+        wb = Workbook()
+        ws = wb.active
+        for row in rows:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_validate_workbook(self):
+        self.create_excel(self.file1, [['ID'], [1]])
+        validate_workbook(self.file1, 'File 1')
+
+        with self.assertRaises(InvalidUpload):
+            validate_workbook(io.BytesIO(b'ID,Value\n1,2\n'), 'File 1')
+        other_zip = io.BytesIO()
+        with zipfile.ZipFile(other_zip, 'w') as package:
+            package.writestr('readme.txt', 'not a workbook')
+        with self.assertRaisesRegex(InvalidUpload, 'not an Excel workbook'):
+            validate_workbook(other_zip, 'File 1')
+
+    def test_uploads_are_spooled_to_disk(self):
+        self.create_excel(self.file1, [['ID'], [1]])
+        with open(self.file1, 'rb') as f:
+            data = {'file1': (io.BytesIO(f.read()), 'a.xlsx')}
+        with app_module.app.test_request_context('/compare', method='POST', data=data):
+            upload = request.files['file1']
+            source = upload_source(upload, 'File 1')
+            # The engine reads the spooled file from disk
+            self.assertIsInstance(source, str)
+            self.assertTrue(os.path.isfile(source))
+        self.assertFalse(os.path.exists(source))
+
+    def test_rejects_non_workbooks(self):
+        self.create_excel(self.file1, [['ID'], [1]])
+        with open(self.file1, 'rb') as f:
+            resp = self.client.post('/compare', data={
+                'file1': (f, 'a.xlsx'), 'file2': (io.BytesIO(b'plain text'), 'b.xlsx')})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('File 2 is not a valid .xlsx file', resp.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
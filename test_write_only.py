@@ -0,0 +1,46 @@
+import io
+import os
+import unittest
+from openpyxl import Workbook, load_workbook
+from engine import compare_workbooks
+
+class TestWriteOnlyOutput(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_wo_1.xlsx'
+        self.file2 = 'test_wo_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def create_excel(self, filename, data, header):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(header)
+        for row in data:
+            ws.append(row)
+        wb.save(filename)
+
+    def test_styles(self):
+        header = ['Name', 'ID', 'Value']
+        self.create_excel(self.file1, [['A', 1, 100], ['B', 2, 200]], header)
+        self.create_excel(self.file2, [['B', 2, 200], ['A', 1, 999]], header)
+
+        stream = io.BytesIO()
+        result = compare_workbooks(self.file1, self.file2, stream)
+        stream.seek(0)
+        ws_out = load_workbook(stream).active
+
+        self.assertEqual(ws_out.cell(row=1, column=1).fill.start_color.rgb, "FF00FF00")
+        self.assertEqual(ws_out.cell(row=2, column=2).fill.start_color.rgb, "FFFFFF00")
+        self.assertEqual(ws_out.cell(row=2, column=3).font.color.rgb, "FFFF0000")
+        self.assertEqual(ws_out.cell(row=2, column=3).value, 100)
+        self.assertNotEqual(ws_out.cell(row=3, column=3).font.color.rgb, "FFFF0000")
+
+        # Cells share a handful of named styles instead of one style per cell
+        self.assertEqual(ws_out.cell(row=2, column=3).style, 'compare_diff')
+        self.assertEqual(ws_out.cell(row=3, column=2).style, 'compare_key')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import datetime
+import io
+import os
+import unittest
+import zipfile
+from openpyxl import Workbook
+from engine import compare_workbooks, open_workbook, sheet_dimensions, sheet_rows
+from xlsx_reader import XlsxWorkbook
+
+SHEET_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetData>
+<row><c t="inlineStr"><is><r><t>ab</t></r><r><t xml:space="preserve">c </t></r><rPh><t>x</t></rPh></is></c><c t="b"><v>1</v></c></row>
+<row r="3"><c r="B3" t="e"><v>#N/A</v></c><c r="D3" t="str"><f>A1</f><v>ab</v></c></row>
+<row r="4"><c r="A4"><f>1+1</f></c><c r="C4"><v>1.5E3</v></c></row>
+</sheetData>
+</worksheet>'''
+
+class TestXlsxReader(unittest.TestCase):
+    def setUp(self):
+        self.file1 = 'test_xml_reader_1.xlsx'
+        self.file2 = 'test_xml_reader_2.xlsx'
+
+    def tearDown(self):
+        for f in [self.file1, self.file2]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def read(self, wb):
+        try:
+            sheets = []
+            for name in wb.sheetnames:
+                dims = sheet_dimensions(wb[name])
+                sheets.append((name, dims, list(sheet_rows(wb[name], dims))))
+            return sheets
+        finally:
+            wb.close()
+
+    def test_same_values_as_openpyxl(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['ID', 'Name', 'When', 'Price', 'Flag'])
+        ws.append([1, '台北', datetime.datetime(2024, 3, 1, 12, 30), 9.5, True])
+        ws.append([2, None, datetime.date(2024, 3, 2), -3, False])
+        ws['C6'] = datetime.time(8, 15)
+        ws['F7'] = ' padded '
+        wb.create_sheet('Empty')
+        wb.save(self.file1)
+
+        self.assertEqual(self.read(XlsxWorkbook(self.file1)), self.read(open_workbook(self.file1)))
+        with open(self.file1, 'rb') as f:
+            self.assertEqual(self.read(XlsxWorkbook(f)), self.read(open_workbook(self.file1)))
+
+    def test_sheet_xml(self):
+        # Inline and rich strings, rows and cells without references, no <dimension>
+        wb = Workbook()
+        wb.active.title = 'Raw'
+        wb.save(self.file1)
+        with zipfile.ZipFile(self.file1) as src, zipfile.ZipFile(self.file2, 'w') as dst:
+            for item in src.infolist():
+                data = src.read(item.filename)
+                dst.writestr(item, SHEET_XML if item.filename == 'xl/worksheets/sheet1.xml' else data)
+
+        expected = [
+            ('abc ', True, None, None),
+            (None, None, None, None),
+            (None, '#N/A', None, 'ab'),
+            (None, None, 1500.0, None),
+        ]
+        self.assertEqual(self.read(XlsxWorkbook(self.file2)), [('Raw', (4, 4), expected)])
+
+    def test_compare_with_xml_reader(self):
+        for filename, rows in ((self.file1, [[1, 'a'], [2, 'b'], [3, 'c']]), (self.file2, [[1, 'a'], [2, 'x']])):
+            wb = Workbook()
+            wb.active.append(['ID', 'Value'])
+            for row in rows:
+                wb.active.append(row)
+            wb.save(filename)
+
+        stream = io.BytesIO()
+        result = compare_workbooks(self.file1, self.file2, stream, reader='xml')
+        expected = compare_workbooks(self.file1, self.file2)
+        sheet = result['Sheet']
+        self.assertEqual(list(sheet.iter_diff_rows()), list(expected['Sheet'].iter_diff_rows()))
+        self.assertEqual(list(sheet.iter_diff_rows()), [(3, (2,)), (4, None)])
+        self.assertGreater(len(stream.getvalue()), 0)
+        with self.assertRaises(ValueError):
+            compare_workbooks(self.file1, self.file2, reader='lxml')
+
+if __name__ == '__main__':
+    unittest.main()
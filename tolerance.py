@@ -0,0 +1,143 @@
+"""
+Tolerant comparison of cell values.
+
+By default two cells differ unless their values are equal (Python ==), so
+100 and 100.0000001, a date and the same date written as text, or "a" and
+"a " all count as differences. A Tolerance relaxes that: numbers within an
+absolute or relative tolerance, dates however they are written, and text
+ignoring surrounding whitespace and/or case count as equal.
+
+Each column gets one kernel, an equal(value1, value2) function picked once
+per sheet from the type of the column's values in the first data rows of
+file 1, so the row loop doesn't look at types: it still compares the two
+rows with == first, and only calls the kernel of a column whose values are
+not equal. Columns of mixed types get a kernel that checks the types of
+each pair.
+"""
+import datetime
+import math
+
+NUMBER = 'number'
+DATE = 'date'
+TEXT = 'text'
+
+
+def as_datetime(value):
+    """value as a datetime if it is a date, a datetime or ISO 8601 date text, else None."""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def dates_equal(value1, value2):
+    value1 = as_datetime(value1)
+    return value1 is not None and value1 == as_datetime(value2)
+
+
+def numbers_kernel(abs_tol, rel_tol):
+    def numbers_equal(value1, value2):
+        try:
+            return math.isclose(value1, value2, rel_tol=rel_tol, abs_tol=abs_tol)
+        except TypeError:
+            return False
+    return numbers_equal
+
+
+def text_kernel(strip, casefold):
+    if strip and casefold:
+        canonical = lambda value: value.strip().casefold()
+    elif strip:
+        canonical = str.strip
+    else:
+        canonical = str.casefold
+
+    def text_equal(value1, value2):
+        try:
+            return canonical(value1) == canonical(value2)
+        except (TypeError, AttributeError):
+            return False
+    return text_equal
+
+
+class Tolerance:
+    """
+    How far cell values may differ and still count as equal:
+    numbers within abs_tol or rel_tol (as in math.isclose), dates (and ISO
+    8601 date text) equal whatever their form, text equal after stripping
+    surrounding whitespace and/or casefolding.
+    """
+
+    def __init__(self, abs_tol=0.0, rel_tol=0.0, dates=False, strip=False, casefold=False):
+        if not (abs_tol >= 0 and rel_tol >= 0):
+            raise ValueError("Tolerances can't be negative")
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        self.dates = dates
+        self.strip = strip
+        self.casefold = casefold
+
+    def __bool__(self):
+        return bool(self.abs_tol or self.rel_tol or self.dates or self.strip or self.casefold)
+
+    def __repr__(self):
+        return (f"Tolerance(abs_tol={self.abs_tol!r}, rel_tol={self.rel_tol!r}, dates={self.dates!r}, "
+                f"strip={self.strip!r}, casefold={self.casefold!r})")
+
+    def column_kind(self, values):
+        """NUMBER, DATE or TEXT if every non-empty value is of that kind, else None."""
+        kinds = set()
+        for value in values:
+            if value is None or value == '':
+                continue
+            if isinstance(value, bool):
+                return None
+            if isinstance(value, (int, float)):
+                kinds.add(NUMBER)
+            elif isinstance(value, (datetime.date, datetime.datetime)):
+                kinds.add(DATE)
+            elif isinstance(value, str):
+                kinds.add(DATE if self.dates and as_datetime(value) is not None else TEXT)
+            else:
+                return None
+            if len(kinds) > 1:
+                return None
+        return kinds.pop() if kinds else None
+
+    def kernels(self, rows, width):
+        """
+        Kernel of each of the width columns for a sheet whose first data rows
+        are rows: an equal(value1, value2) function, or None where only equal
+        values are equal.
+        """
+        numbers = numbers_kernel(self.abs_tol, self.rel_tol) if self.abs_tol or self.rel_tol else None
+        dates = dates_equal if self.dates else None
+        text = text_kernel(self.strip, self.casefold) if self.strip or self.casefold else None
+        by_kind = {NUMBER: numbers, DATE: dates, TEXT: text}
+        mixed = self._mixed_kernel(numbers, dates, text)
+
+        kernels = []
+        for c in range(width):
+            kind = self.column_kind(row[c] for row in rows if c < len(row))
+            kernels.append(by_kind[kind] if kind else mixed)
+        return kernels
+
+    def _mixed_kernel(self, numbers, dates, text):
+        """Kernel for columns without one kind of value: picks by the types of each pair."""
+        if not (numbers or dates or text):
+            return None
+
+        def mixed_equal(value1, value2):
+            if isinstance(value1, str) and isinstance(value2, str):
+                if text and text(value1, value2):
+                    return True
+            elif numbers and isinstance(value1, (int, float)) and isinstance(value2, (int, float)):
+                return numbers(value1, value2)
+            return dates is not None and dates(value1, value2)
+        return mixed_equal
@@ -0,0 +1,55 @@
+"""
+Upload handling.
+
+File parts of a multipart upload are written to temp files on disk chunk by
+chunk as they arrive, instead of being buffered in memory, and checked to be
+XLSX packages before any parsing starts. The comparison then reads them from
+disk, so the size limit doesn't bound the memory of a worker.
+"""
+import os
+import tempfile
+import zipfile
+from flask import Request
+
+# Parts every workbook package has; a ZIP without them isn't a workbook
+REQUIRED_PARTS = ('[Content_Types].xml', 'xl/workbook.xml')
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+class SpoolingRequest(Request):
+    """Request that spools every uploaded file straight to a named temp file."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Deleted when the request closes its files
+        return tempfile.NamedTemporaryFile(mode='w+b', prefix='upload-', suffix='.xlsx')
+
+
+def validate_workbook(source, label):
+    """Raise InvalidUpload unless source (a path or seekable file) is an XLSX package."""
+    try:
+        # Only reads the ZIP central directory at the end of the file
+        with zipfile.ZipFile(source) as package:
+            names = set(package.namelist())
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, EOFError):
+        raise InvalidUpload(f"{label} is not a valid .xlsx file")
+    if not all(part in names for part in REQUIRED_PARTS):
+        raise InvalidUpload(f"{label} is a ZIP file but not an Excel workbook")
+
+
+def upload_source(upload, label):
+    """
+    Validate an uploaded file and return what the engine should read: the
+    path of its spooled temp file, or the upload itself if it wasn't spooled.
+    Raises InvalidUpload for anything that isn't a workbook.
+    """
+    stream = upload.stream
+    stream.flush()
+    path = getattr(stream, 'name', None)
+    if not (isinstance(path, str) and os.path.isfile(path)):
+        path = None
+    validate_workbook(path or stream, label)
+    stream.seek(0)
+    return path or upload
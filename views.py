@@ -0,0 +1,59 @@
+"""
+The HTML view of a DiffResult: the per-sheet summary of the results page and
+the cell dicts of the rows it fetches a page at a time. Kept apart from the
+Flask app so the benchmarks can time rendering without starting it.
+"""
+from writers import is_diff_cell
+
+# Rows per page of the results table
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def cell_class(sheet, row_idx, col_idx, diff_cols):
+    """CSS classes for one cell of the HTML view (red = diff, green = header, yellow = key)."""
+    style_class = ""
+    if is_diff_cell(col_idx, diff_cols):
+        style_class += " text-red-600 font-bold"
+    if sheet.is_header(row_idx):
+        style_class += " bg-green-100"
+    elif sheet.is_key(row_idx, col_idx):
+        style_class += " bg-yellow-100"
+    return style_class
+
+
+def view_row(sheet, row_idx, values, diff_cols):
+    """Cell dicts for one row of the HTML view."""
+    if diff_cols is not None:
+        diff_cols = set(diff_cols)
+    return [
+        {'value': value if value is not None else "",
+         'class': cell_class(sheet, row_idx, col_idx, diff_cols)}
+        for col_idx, value in enumerate(values, 1)
+    ]
+
+
+def result_to_view_data(result, file1_rows=None):
+    """
+    Convert a DiffResult to a structure for rendering in HTML.
+    Only the header row and the differing rows are rendered, straight from
+    the values captured during the comparison; file1_rows(sheet) gives the
+    rows of sheets missing from file 2 (see output_rows).
+    Returns: list of sheets, where each sheet is {'name': str, 'rows': list of lists of dicts}
+    Cell dict: {'value': str, 'class': str (red/green/yellow/normal)}
+    """
+    sheets = []
+    for sheet in result:
+        value_rows = file1_rows(sheet) if file1_rows and not sheet.in_file2 else None
+        rows = [view_row(sheet, *row) for row in sheet.iter_view_rows(value_rows=value_rows)]
+        sheets.append({'name': sheet.name, 'rows': rows})
+    return sheets
+
+
+def result_summary(result):
+    """Per-sheet counts shown on the results page before any rows are fetched."""
+    return [
+        {'name': sheet.name, 'diff_rows': sheet.diff_row_count, 'view_rows': sheet.view_row_count,
+         'fast_rows': sheet.fast_rows}
+        for sheet in result
+    ]
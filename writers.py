@@ -0,0 +1,110 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font
+
+# Shared named styles for the comparison output.
+# Every styled cell refers to one of these instead of carrying its own fill/font.
+GREEN = 'FF00FF00'
+YELLOW = 'FFFFFF00'
+RED = 'FFFF0000'
+
+HEADER_STYLE = 'compare_header'
+KEY_STYLE = 'compare_key'
+DIFF_STYLE = 'compare_diff'
+HEADER_DIFF_STYLE = 'compare_header_diff'
+KEY_DIFF_STYLE = 'compare_key_diff'
+
+# First column of diff-only output, holding the row number in file 1
+ROW_NUMBER_HEADER = '列號'
+
+
+def _fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+def make_named_styles():
+    return [
+        NamedStyle(name=HEADER_STYLE, fill=_fill(GREEN)),
+        NamedStyle(name=KEY_STYLE, fill=_fill(YELLOW)),
+        NamedStyle(name=DIFF_STYLE, font=Font(color=RED)),
+        NamedStyle(name=HEADER_DIFF_STYLE, fill=_fill(GREEN), font=Font(color=RED)),
+        NamedStyle(name=KEY_DIFF_STYLE, fill=_fill(YELLOW), font=Font(color=RED)),
+    ]
+
+
+def register_styles(wb):
+    for style in make_named_styles():
+        if style.name not in wb.named_styles:
+            wb.add_named_style(style)
+
+
+def is_diff_cell(col_idx, diff_cols):
+    # diff_cols is None when the whole row is missing from file 2
+    return diff_cols is None or col_idx in diff_cols
+
+
+def cell_style(sheet, row_idx, col_idx, diff_cols):
+    """Name of the output style for a cell of a SheetDiff, or None for an unstyled cell."""
+    is_diff = is_diff_cell(col_idx, diff_cols)
+    if sheet.is_header(row_idx):
+        return HEADER_DIFF_STYLE if is_diff else HEADER_STYLE
+    if sheet.is_key(row_idx, col_idx):
+        return KEY_DIFF_STYLE if is_diff else KEY_STYLE
+    return DIFF_STYLE if is_diff else None
+
+
+def _styled_row(ws_out, sheet, row_idx, values, diff_cols):
+    """Output cells of one compared row: plain values, or WriteOnlyCells for styled cells."""
+    if diff_cols is not None:
+        diff_cols = set(diff_cols)
+    out_row = []
+    for col_idx, value in enumerate(values, 1):
+        style = cell_style(sheet, row_idx, col_idx, diff_cols)
+        if style is None:
+            out_row.append(value)
+        else:
+            cell = WriteOnlyCell(ws_out, value)
+            cell.style = style
+            out_row.append(cell)
+    return out_row
+
+
+def write_sheet(ws_out, sheet, rows):
+    """
+    Append the compared rows of one sheet to a write-only worksheet.
+    sheet is the SheetDiff giving the layout; rows yields
+    (row_idx, values, diff_cols) as produced by engine.compare_sheet.
+    """
+    key_cols = sheet.key_cols
+    for row_idx, values, diff_cols in rows:
+        if diff_cols is not None and not diff_cols and not sheet.is_header(row_idx):
+            # Unchanged row: at most the key cells carry a style
+            if key_cols and row_idx > sheet.header_row:
+                values = list(values)
+                for col_idx in key_cols:
+                    if col_idx <= len(values):
+                        cell = WriteOnlyCell(ws_out, values[col_idx - 1])
+                        cell.style = KEY_STYLE
+                        values[col_idx - 1] = cell
+            ws_out.append(values)
+            continue
+        ws_out.append(_styled_row(ws_out, sheet, row_idx, values, diff_cols))
+
+
+def write_diff_sheet(ws_out, sheet, value_rows=None):
+    """
+    Append only the header and the differing rows of a SheetDiff to a
+    write-only worksheet, each led by its row number in file 1.
+    Needs nothing but the SheetDiff itself, except for a sheet missing from
+    file 2: value_rows then gives its rows (see SheetDiff.iter_view_rows).
+    """
+    for row_idx, values, diff_cols in sheet.iter_view_rows(value_rows=value_rows):
+        row_number = ROW_NUMBER_HEADER if sheet.is_header(row_idx) else row_idx
+        ws_out.append([row_number] + _styled_row(ws_out, sheet, row_idx, values, diff_cols))
+
+
+def new_output_workbook():
+    """A write-only workbook with the comparison styles registered."""
+    output_wb = Workbook(write_only=True)
+    register_styles(output_wb)
+    return output_wb
@@ -0,0 +1,320 @@
+"""
+Cell values read straight from the sheet XML of an XLSX file.
+
+openpyxl's read-only mode still builds a dict per cell, parses every
+coordinate with a regex and resolves styles on the way. This reader feeds
+xl/worksheets/sheetN.xml out of the zip to expat a block at a time and
+turns each <row> into a plain value tuple; no element tree is built, so
+memory stays flat however long the sheet is. Shared strings are loaded
+once per workbook; of the stylesheet only the number formats are read,
+to tell dates from numbers.
+
+Values come out as openpyxl gives them with data_only=True: cached formula
+results, int or float numbers, datetimes for date formats, bools, and
+error codes as text. XlsxWorkbook stands in for openpyxl's read-only
+workbook (sheetnames, [name], active, close) like snapshot.SnapshotWorkbook.
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Tag names as ElementTree spells them
+_TEXT = f'{{{SHEET_NS}}}t'
+_RUN = f'{{{SHEET_NS}}}r'
+_STRING_ITEM = f'{{{SHEET_NS}}}si'
+_DIMENSION = f'{{{SHEET_NS}}}dimension'
+_SHEET_DATA = f'{{{SHEET_NS}}}sheetData'
+_RELATIONSHIP = f'{{{PKG_REL_NS}}}Relationship'
+
+# Tag names as expat reports them with namespace_separator=' '
+_ROW = SHEET_NS + ' row'
+_C = SHEET_NS + ' c'
+_V = SHEET_NS + ' v'
+_T = SHEET_NS + ' t'
+_INLINE = SHEET_NS + ' is'
+_PHONETIC = SHEET_NS + ' rPh'
+
+_OFFICE_DOCUMENT = REL_NS + '/officeDocument'
+_WORKSHEET = REL_NS + '/worksheet'
+_SHARED_STRINGS = REL_NS + '/sharedStrings'
+_STYLES = REL_NS + '/styles'
+
+_DIGITS = '0123456789'
+
+# Bytes of sheet XML fed to the parser at a time
+READ_BYTES = 1 << 16
+
+# Column letters already seen -> column number
+_columns = {}
+
+
+def _column_index(letters):
+    """1-based column number of column letters ('A' -> 1, 'AB' -> 28)."""
+    idx = _columns.get(letters)
+    if idx is None:
+        idx = 0
+        for ch in letters:
+            idx = idx * 26 + ord(ch) - 64
+        _columns[letters] = idx
+    return idx
+
+
+def _text_content(node):
+    """Plain text of a string item (<si> or <is>): its <t> and the <t> of its runs, without phonetic runs."""
+    parts = []
+    for child in node:
+        if child.tag == _TEXT:
+            parts.append(child.text or '')
+        elif child.tag == _RUN:
+            for t in child:
+                if t.tag == _TEXT:
+                    parts.append(t.text or '')
+    return ''.join(parts)
+
+
+def _part_path(base, target):
+    """Zip path of a relationship target, relative to the part at base unless absolute."""
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), target))
+
+
+def _rels_path(part):
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+
+class XlsxSheet:
+    """Worksheet read from its XML, with the parts of openpyxl's read-only worksheet the engine uses."""
+
+    def __init__(self, workbook, title, path):
+        self._workbook = workbook
+        self.title = title
+        self._path = path
+        self.max_row = self.max_column = None
+        with workbook._archive.open(path) as f:
+            for event, elem in ET.iterparse(f, events=('start',)):
+                if elem.tag == _DIMENSION:
+                    _, _, self.max_column, self.max_row = range_boundaries(elem.get('ref'))
+                    break
+                if elem.tag == _SHEET_DATA:
+                    # Dimension missing: the sheet is unsized
+                    break
+
+    def _parse_rows(self, columns=None):
+        """
+        Yield (row_idx, {column: value}) for every <row> of the sheet XML.
+        With columns (a set of column numbers), other cells are skipped unread.
+        """
+        wb = self._workbook
+        strings, date_styles, timedelta_styles, epoch = wb._strings, wb._date_styles, wb._timedelta_styles, wb.epoch
+        parsed = []
+        text = []
+        row_idx = col = 0
+        cells = {}
+        cell_type, style = 'n', None
+        inline = collecting = phonetic = skipped = False
+
+        def start(name, attrs):
+            nonlocal row_idx, col, cells, cell_type, style, inline, collecting, phonetic, skipped
+            if name == _C:
+                ref = attrs.get('r')
+                col = _column_index(ref.rstrip(_DIGITS)) if ref else col + 1
+                cell_type = attrs.get('t', 'n')
+                style = attrs.get('s')
+                inline = False
+                skipped = columns is not None and col not in columns
+                text.clear()
+            elif name == _V:
+                collecting = cell_type != 'inlineStr' and not skipped
+            elif name == _T:
+                # Text of an inline string, leaving out phonetic runs
+                collecting = cell_type == 'inlineStr' and not phonetic and not skipped
+            elif name == _ROW:
+                r = attrs.get('r')
+                row_idx = int(float(r)) if r else row_idx + 1
+                col = 0
+                cells = {}
+            elif name == _INLINE:
+                inline = True
+            elif name == _PHONETIC:
+                phonetic = True
+
+        def end(name):
+            nonlocal collecting, phonetic
+            if name == _C:
+                if skipped:
+                    return
+                value = ''.join(text)
+                if cell_type == 'inlineStr':
+                    value = value if inline else None
+                elif not value:
+                    value = None
+                elif cell_type == 'n':
+                    value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+                    if date_styles and int(style or 0) in date_styles:
+                        try:
+                            value = from_excel(value, epoch, timedelta=int(style or 0) in timedelta_styles)
+                        except (OverflowError, ValueError):
+                            value = '#VALUE!'
+                elif cell_type == 's':
+                    value = strings[int(value)]
+                elif cell_type == 'b':
+                    value = bool(int(value))
+                elif cell_type == 'd':
+                    value = from_ISO8601(value)
+                # 'str' (formula text) and 'e' (error codes) stay text
+                cells[col] = value
+            elif name == _V or name == _T:
+                collecting = False
+            elif name == _ROW:
+                parsed.append((row_idx, cells))
+            elif name == _PHONETIC:
+                phonetic = False
+
+        def data(chunk):
+            if collecting:
+                text.append(chunk)
+
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+        with wb._archive.open(self._path) as f:
+            # Feed the XML a block at a time and hand out the rows completed so far
+            for block in iter(lambda: f.read(READ_BYTES), b''):
+                parser.Parse(block, False)
+                yield from parsed
+                parsed.clear()
+            parser.Parse(b'', True)
+            yield from parsed
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True, columns=None):
+        """
+        Yield value tuples for rows min_row..max_row (or to the last row of
+        the XML), max_col wide (or as wide as their last cell). Rows missing
+        from the XML come back empty, and so do the cells of columns not in
+        columns, if given. The <dimension> record (max_row, max_column) is
+        not a limit: it can be stale.
+        """
+        if not values_only:
+            raise ValueError("The XML reader only reads cell values")
+        empty = (None,) * max_col if max_col else ()
+        next_idx = min_row
+        for row_idx, cells in self._parse_rows(columns):
+            if max_row is not None and row_idx > max_row:
+                break
+            if row_idx < next_idx:
+                continue
+            while next_idx < row_idx:
+                yield empty
+                next_idx += 1
+            width = max_col or (max(cells) if cells else 0)
+            yield tuple([cells.get(col) for col in range(1, width + 1)])
+            next_idx += 1
+        if max_row is not None:
+            for _ in range(next_idx, max_row + 1):
+                yield empty
+
+
+class XlsxWorkbook:
+    """XLSX file opened for reading cell values, standing in for openpyxl's read-only workbook."""
+
+    def __init__(self, source):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        self._archive = zipfile.ZipFile(source)
+        try:
+            self._load(self._archive)
+        except Exception:
+            self._archive.close()
+            raise
+
+    def _relationships(self, part):
+        """{id: (type, zip path)} of the relationships of a part."""
+        try:
+            data = self._archive.read(_rels_path(part))
+        except KeyError:
+            return {}
+        return {
+            rel.get('Id'): (rel.get('Type'), _part_path(part, rel.get('Target')))
+            for rel in ET.fromstring(data).iter(_RELATIONSHIP)
+            if rel.get('TargetMode') != 'External'
+        }
+
+    def _load(self, archive):
+        workbook_path = next(
+            (path for kind, path in self._relationships('').values() if kind == _OFFICE_DOCUMENT),
+            'xl/workbook.xml')
+        rels = self._relationships(workbook_path)
+        root = ET.fromstring(archive.read(workbook_path))
+
+        properties = root.find(f'{{{SHEET_NS}}}workbookPr')
+        date1904 = properties is not None and properties.get('date1904') in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        self._strings = []
+        self._date_styles, self._timedelta_styles = set(), set()
+        for kind, path in rels.values():
+            if kind == _SHARED_STRINGS and path in archive.namelist():
+                self._strings = self._read_strings(path)
+            elif kind == _STYLES and path in archive.namelist():
+                self._read_number_formats(path)
+
+        # Worksheets only, like openpyxl skipping chartsheets' rows; missing parts are skipped too
+        self._sheets = {}
+        for sheet in root.iter(f'{{{SHEET_NS}}}sheet'):
+            kind, path = rels.get(sheet.get(f'{{{REL_NS}}}id'), (None, None))
+            if kind == _WORKSHEET and path in archive.namelist():
+                name = sheet.get('name')
+                self._sheets[name] = XlsxSheet(self, name, path)
+        self.sheetnames = list(self._sheets)
+
+    def _read_strings(self, path):
+        strings = []
+        with self._archive.open(path) as f:
+            for _, node in ET.iterparse(f):
+                if node.tag == _STRING_ITEM:
+                    strings.append(_text_content(node).replace('x005F_', ''))
+                    node.clear()
+        return strings
+
+    def _read_number_formats(self, path):
+        """Indices of the cell styles whose number format shows dates (and durations)."""
+        root = ET.fromstring(self._archive.read(path))
+        custom = {}
+        num_fmts = root.find(f'{{{SHEET_NS}}}numFmts')
+        if num_fmts is not None:
+            for fmt in num_fmts:
+                custom[int(fmt.get('numFmtId'))] = fmt.get('formatCode')
+        xfs = root.find(f'{{{SHEET_NS}}}cellXfs')
+        if xfs is None:
+            return
+        for idx, xf in enumerate(xfs):
+            fmt_id = int(xf.get('numFmtId', 0))
+            fmt = custom.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+            if fmt is None:
+                continue
+            if is_date_format(fmt):
+                self._date_styles.add(idx)
+            if is_timedelta_format(fmt):
+                self._timedelta_styles.add(idx)
+
+    def __getitem__(self, name):
+        return self._sheets[name]
+
+    @property
+    def active(self):
+        return self._sheets[self.sheetnames[0]]
+
+    def close(self):
+        self._archive.close()